@@ -0,0 +1,98 @@
+import gzip
+import threading
+from pathlib import Path
+
+import zstandard
+
+COMPRESSION_NONE = "none"
+COMPRESSION_GZIP = "gzip"
+COMPRESSION_ZSTD = "zstd"
+COMPRESSIONS = (COMPRESSION_NONE, COMPRESSION_GZIP, COMPRESSION_ZSTD)
+# raised by decompress() for corrupted files or zstd frames whose dictionary is missing
+DECOMPRESSION_ERRORS = (OSError, EOFError, zstandard.ZstdError)
+# appended to the name of the uncompressed file, the suffix tells readers how to decompress it
+_SUFFIXES = {COMPRESSION_NONE: "", COMPRESSION_GZIP: ".gz", COMPRESSION_ZSTD: ".zst"}
+
+_GZIP_LEVEL = 6
+_ZSTD_LEVEL = 9
+# zstd's default size. most artifacts are only a few KB, without a dictionary they do not share anything to compress
+_DICT_SIZE = 112 * 1024
+_DICT_SUFFIX = ".zdict"
+_CURRENT_DICT_FILE = "current.txt"  # ID of the dictionary new files are compressed with
+
+
+def get_suffix(compression: str) -> str:
+    return _SUFFIXES[compression]
+
+
+class ArtifactCompressor:
+    """
+    Compresses artifacts with gzip or zstd. zstd uses a dictionary trained on existing artifacts, if there is one.
+    Every zstd frame contains the ID of the dictionary it was compressed with and dictionaries are never deleted, so
+    training a new dictionary does not make existing files unreadable. Dictionaries are loaded lazily and shared by
+    the threads of a process.
+    """
+
+    def __init__(self, dict_dir: Path):
+        self._dict_dir = dict_dir
+        self._lock = threading.Lock()
+        self._dicts: dict[int, zstandard.ZstdCompressionDict] = {}
+        self._current_dict_id: int | None = None  # 0 if there is no dictionary, like in frames without one
+
+    def compress(self, content: bytes, compression: str) -> bytes:
+        if compression == COMPRESSION_GZIP:
+            return gzip.compress(content, compresslevel=_GZIP_LEVEL, mtime=0)
+
+        if compression == COMPRESSION_ZSTD:
+            zstd_dict = self._get_dict(self._get_current_dict_id())
+            compressor = zstandard.ZstdCompressor(level=_ZSTD_LEVEL, dict_data=zstd_dict)
+            return compressor.compress(content)
+
+        return content
+
+    def decompress(self, content: bytes, compression: str) -> bytes:
+        if compression == COMPRESSION_GZIP:
+            return gzip.decompress(content)
+
+        if compression == COMPRESSION_ZSTD:
+            zstd_dict = self._get_dict(zstandard.get_frame_parameters(content).dict_id)
+            return zstandard.ZstdDecompressor(dict_data=zstd_dict).decompress(content)
+
+        return content
+
+    def train(self, samples: list[bytes]) -> int:
+        """
+        Train a dictionary on the given artifacts and compress new zstd files with it. Returns its ID.
+        """
+        zstd_dict = zstandard.train_dictionary(_DICT_SIZE, samples, level=_ZSTD_LEVEL)
+        dict_id = zstd_dict.dict_id()
+        (self._dict_dir / f"{dict_id}{_DICT_SUFFIX}").write_bytes(zstd_dict.as_bytes())
+        # the dictionary has to exist before any process may use it
+        tmp_path = self._dict_dir / f".{_CURRENT_DICT_FILE}.tmp"
+        tmp_path.write_text(str(dict_id))
+        tmp_path.replace(self._dict_dir / _CURRENT_DICT_FILE)
+        with self._lock:
+            self._current_dict_id = dict_id
+
+        return dict_id
+
+    def _get_current_dict_id(self) -> int:
+        with self._lock:
+            if self._current_dict_id is None:
+                current_path = self._dict_dir / _CURRENT_DICT_FILE
+                self._current_dict_id = int(current_path.read_text()) if current_path.is_file() else 0
+
+            return self._current_dict_id
+
+    def _get_dict(self, dict_id: int) -> zstandard.ZstdCompressionDict | None:
+        if dict_id == 0:
+            return None
+
+        with self._lock:
+            if dict_id not in self._dicts:
+                dict_path = self._dict_dir / f"{dict_id}{_DICT_SUFFIX}"
+                zstd_dict = zstandard.ZstdCompressionDict(dict_path.read_bytes())
+                zstd_dict.precompute_compress(level=_ZSTD_LEVEL)  # otherwise every compressor prepares it again
+                self._dicts[dict_id] = zstd_dict
+
+            return self._dicts[dict_id]
@@ -0,0 +1,112 @@
+import multiprocessing.util
+import os
+import sqlite3
+import threading
+import typing
+from pathlib import Path
+
+# writes are collected and committed together, a transaction per artifact would cost an fsync each
+_BATCH_SIZE = 200
+# workers of all processes share the database, SQLite only allows one writer at a time
+_BUSY_TIMEOUT_S = 60
+
+
+class ArtifactStore:
+    """
+    SQLite database in WAL mode with one table per artifact type. Each row holds the serialized artifact of one paper,
+    keyed by the name of the paper directory. Writes are buffered and committed in batches, reads see the buffered
+    writes. Every process opens its own connection, buffered writes are committed when the process exits normally,
+    call flush() to commit them earlier.
+    """
+
+    def __init__(self, db_path: Path, tables: typing.Iterable[str]):
+        self._db_path = db_path
+        self._tables = tuple(tables)
+        self._lock = threading.Lock()  # the download threads share the connection of their process
+        self._pid = -1
+        self._connection: sqlite3.Connection | None = None
+        self._pending: dict[tuple[str, str], str | None] = {}  # None marks a pending delete
+
+    def read(self, table: str, key: str) -> str | None:
+        with self._lock:
+            self._check_process()
+            if (table, key) in self._pending:
+                return self._pending[(table, key)]
+
+            row = self._connection.execute(f"SELECT data FROM {table} WHERE paper = ?", (key,)).fetchone()
+            return row[0] if row else None
+
+    def exists(self, table: str, key: str) -> bool:
+        with self._lock:
+            self._check_process()
+            if (table, key) in self._pending:
+                return self._pending[(table, key)] is not None
+
+            return self._connection.execute(f"SELECT 1 FROM {table} WHERE paper = ?", (key,)).fetchone() is not None
+
+    def write(self, table: str, key: str, data: str) -> None:
+        self._add_pending(table, key, data)
+
+    def delete(self, table: str, key: str) -> None:
+        self._add_pending(table, key, None)
+
+    def delete_all(self, table: str) -> None:
+        with self._lock:
+            self._check_process()
+            self._pending = {(t, k): data for (t, k), data in self._pending.items() if t != table}
+            with self._connection:
+                self._connection.execute(f"DELETE FROM {table}")
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._pid == os.getpid():
+                self._flush()
+
+    def _add_pending(self, table: str, key: str, data: str | None) -> None:
+        with self._lock:
+            self._check_process()
+            self._pending[(table, key)] = data
+            if len(self._pending) >= _BATCH_SIZE:
+                self._flush()
+
+    def _flush(self) -> None:
+        if not self._pending:
+            return
+
+        upserts = {table: [] for table in self._tables}
+        deletes = {table: [] for table in self._tables}
+        for (table, key), data in self._pending.items():
+            if data is None:
+                deletes[table].append((key,))
+            else:
+                upserts[table].append((key, data))
+
+        with self._connection:  # one transaction for the whole batch
+            for table in self._tables:
+                if upserts[table]:
+                    self._connection.executemany(f"INSERT OR REPLACE INTO {table} VALUES (?, ?)", upserts[table])
+                if deletes[table]:
+                    self._connection.executemany(f"DELETE FROM {table} WHERE paper = ?", deletes[table])
+
+        self._pending.clear()
+
+    def _check_process(self) -> None:
+        # a forked process inherits the connection and the buffered writes of its parent. neither can be used there:
+        # the parent commits its own writes and SQLite connections must not be shared between processes.
+        if self._pid == os.getpid():
+            return
+
+        self._pid = os.getpid()
+        self._pending = {}
+        self._connection = sqlite3.connect(self._db_path, timeout=_BUSY_TIMEOUT_S, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        # in WAL mode, NORMAL only syncs at checkpoints. a crash may lose the last commits but never corrupts the db.
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        with self._connection:
+            for table in self._tables:
+                self._connection.execute(
+                    f"CREATE TABLE IF NOT EXISTS {table} (paper TEXT PRIMARY KEY, data TEXT NOT NULL) WITHOUT ROWID"
+                )
+
+        # runs when a process exits normally, including the main process and the workers of multiprocessing pools
+        multiprocessing.util.Finalize(None, self.flush, exitpriority=10)
@@ -1,55 +1,102 @@
 import logging
 import time
-from datetime import datetime
+import typing
 
-import bs4
 import requests
 
+import arxiv_feed
+import http_session
 import util
+from HttpCache import HttpCache, DEFAULT_TTL_S
+from TokenBucket import TokenBucket
+from definition.data.ArxivMetadata import ArxivMetadata
 
 _logger = logging.getLogger(__name__)
 _API_BASE_URL = "https://export.arxiv.org/api/query"
 _SRC_DL_BASE_URL = "https://export.arxiv.org/src/"
 _DELAY_API_QUERY_MS = 3000
-# theoretically bursts of 4 per second and then 1-second delay. since the download mostly takes longer we just use a
-# delay of a second and no bursts
-_DELAY_EXPORT_DL_MS = 1000
+_MAX_QUERY_RETRIES = 5
+_QUERY_DELAY_FACTOR = 10
+# theoretically bursts of 4 per second and then 1-second delay. we allow the burst but only refill one token per second
+# so the average stays at one source download per second, no matter how many download workers share the bucket.
+_SRC_DL_BURST_SIZE = 4
+_SRC_DL_PER_SECOND = 1.0
 
 
-def _get_current_ms():
-    return time.time_ns() // 1_000_000  # not all systems provide time with better precision than 1 second!
+def create_src_rate_limiter() -> TokenBucket:
+    return TokenBucket(_SRC_DL_BURST_SIZE, _SRC_DL_PER_SECOND)
 
 
-def _find_entries(xml: str) -> bs4.ResultSet:
-    xml = bs4.BeautifulSoup(xml, features="xml")
-    entries = xml.find_all("entry")
-    return entries
+def _get_current_ms():
+    return time.time_ns() // 1_000_000  # not all systems provide time with better precision than 1 second!
 
 
 class ArxivAPI:
-    def __init__(self):
+    def __init__(
+            self, src_rate_limiter: TokenBucket | None = None, pool_size=1,
+            timeout: tuple[float, float] = http_session.DEFAULT_TIMEOUT, cache_ttl_s: float = DEFAULT_TTL_S,
+            api_base_url=_API_BASE_URL, src_base_url=_SRC_DL_BASE_URL
+    ):
         self._last_request_ms: int = -1
-
-    def query(self, category: str, max_results: int, chunk_size: int) -> list[bs4.Tag]:
+        # the base URLs only differ from the defaults when running against a stand-in server (see scripts/benchmark.py)
+        self._api_base_url = api_base_url
+        self._src_base_url = src_base_url
+        # share one limiter between all API objects that download sources, otherwise they exceed the limit together
+        self._src_rate_limiter = src_rate_limiter if src_rate_limiter else create_src_rate_limiter()
+        # one connection per download worker plus one for the queries. the session is shared by all threads.
+        self._session = http_session.create_session(pool_size + 1)
+        self._timeout = timeout
+        # query pages are cached, sources are not as every source only gets downloaded once
+        self._cache = HttpCache(util.get_http_cache_dir())
+        self._cache_ttl_s = cache_ttl_s
+
+    def query(self, category: str, max_results: int, chunk_size: int) -> typing.Iterator[ArxivMetadata]:
+        """
+        Yield the metadata of the papers of a category page by page. The next page only gets requested once all
+        papers of the current page are consumed, so the caller can start working on the first papers right away.
+        """
         total_results = self._get_total_results(category)
         max_results = total_results if max_results > total_results else max_results
-        all_entries = []
+        received = 0
         start = 0
         while start < max_results:
             # do not request last page with chunk_size entries if there aren't that many requested by max_results
             chunk = max_results - start if (start + chunk_size) > max_results else chunk_size
-            feed_entries = self._retrieve_query_response(category, max_results, start, chunk)
-            all_entries += feed_entries
+            for paper_metadata in self._retrieve_query_response(category, start, chunk):
+                received += 1
+                yield paper_metadata
+
             start += chunk
 
-        return all_entries
+        _logger.info("Received %s of %s requested entries.", received, max_results)
 
     def get(self, url: str, delay_ms: int, max_retries=5, delay_factor=10):
+        return self._get(url, lambda: self._wait_for_delay(delay_ms), max_retries, delay_factor)
+
+    def get_src(self, arxiv_id: str, offset=0, validator="", max_retries=0, delay_factor=10):
+        # the response is streamed, the caller has to consume the content and close it. failed requests are not
+        # retried by default, the download loop schedules the retries without blocking the download worker.
+        paper_src_url = self._src_base_url + arxiv_id
+        headers = {}
+        if offset > 0:
+            # resume a partial download. If-Range makes the server send the whole file again (200 instead of 206) if
+            # the file changed since the first part was downloaded. the content encoding would change the byte
+            # positions, so we request the file as it is.
+            headers = {"Range": f"bytes={offset}-", "If-Range": validator, "Accept-Encoding": "identity"}
+
+        return self._get(
+            paper_src_url, self._src_rate_limiter.acquire, max_retries, delay_factor, stream=True, headers=headers
+        )
+
+    def _get(
+            self, url: str, wait_for_turn: typing.Callable[[], None], max_retries: int, delay_factor: int,
+            stream=False, headers: dict | None = None
+    ):
         attempts = 0
         while True:
             try:
-                self._wait_for_delay(delay_ms)
-                response = requests.get(url)
+                wait_for_turn()
+                response = self._session.get(url, stream=stream, timeout=self._timeout, headers=headers)
                 self._update_last_request()
                 return response
             except requests.RequestException:
@@ -57,16 +104,12 @@ class ArxivAPI:
 
                 if attempts < max_retries:
                     attempts += 1
-                    # fail on 1. attempt: wait delay + 10s, on 5. attempt: wait delay + 50s
-                    self._wait_for_delay(attempts * delay_factor * 1000)
+                    # fail on 1. attempt: wait 10s + delay, on 5. attempt: wait 50s + delay
+                    time.sleep(attempts * delay_factor)
                     continue
                 else:
                     raise
 
-    def get_src(self, arxiv_id: str, max_retries=5, delay_factor=10):
-        paper_src_url = _SRC_DL_BASE_URL + arxiv_id
-        return self.get(paper_src_url, _DELAY_EXPORT_DL_MS, max_retries=max_retries, delay_factor=delay_factor)
-
     def _update_last_request(self) -> None:
         self._last_request_ms = _get_current_ms()
 
@@ -77,13 +120,31 @@ class ArxivAPI:
             wait_s = (next_request - curr_ms) / 1000
             time.sleep(wait_s)
 
-    def _send_request(self, params: dict) -> requests.Response:
-        url = requests.Request("GET", _API_BASE_URL, params=params).prepare().url  # only get encoded url
-        response = self.get(url, _DELAY_API_QUERY_MS)
-        response.encoding = util.ARXIV_ENCODING
-        return response
+    def _send_request(self, params: dict, refresh=False) -> bytes:
+        url = requests.Request("GET", self._api_base_url, params=params).prepare().url  # only get encoded url
+        if refresh:
+            self._cache.invalidate(url)
+
+        return self._cache.get(url, self._cache_ttl_s, lambda headers: self._get_query_page(url, headers))
 
-    def _send_query(self, category: str, chunk_size: int, start: int) -> str:
+    def _get_query_page(self, url: str, headers: dict) -> requests.Response:
+        # error responses (503, 429, ...) are retried like failed requests, the cache only stores a 200 response
+        attempts = 0
+        while True:
+            response = self._get(
+                url, lambda: self._wait_for_delay(_DELAY_API_QUERY_MS), _MAX_QUERY_RETRIES, _QUERY_DELAY_FACTOR,
+                headers=headers
+            )
+            if response.status_code in (200, 304) or attempts >= _MAX_QUERY_RETRIES:
+                return response
+
+            attempts += 1
+            _logger.debug(
+                "Query returned status %s. Retrying (%s/%s).", response.status_code, attempts, _MAX_QUERY_RETRIES
+            )
+            time.sleep(attempts * _QUERY_DELAY_FACTOR)
+
+    def _send_query(self, category: str, chunk_size: int, start: int, refresh=False) -> bytes:
         query_params = {
             "search_query": f"cat:{category}",
             # "sortBy": "lastUpdatedDate",
@@ -91,27 +152,29 @@ class ArxivAPI:
             "start": start,
             "max_results": chunk_size
         }
-        response = self._send_request(query_params)
-        return response.text
+        return self._send_request(query_params, refresh)
 
-    def _retrieve_query_response(self, category: str, max_results: int, start: int, chunk_size: int) -> bs4.ResultSet:
-        # database of export.arxiv.org gets updated once a day, no use in calling it more often and discouraged by ArXiv
-        date = datetime.today().strftime('%Y-%m-%d')
-        request_file = f"{date}_{category.replace(".", "_")}_r{max_results}_s{start}_cs{chunk_size}.xml"
-        if not (response := util.read_file(util.get_requests_dir(), request_file)):
-            response = self._send_query(category, chunk_size, start)
+    def _retrieve_query_response(self, category: str, start: int, chunk_size: int) -> typing.Iterator[ArxivMetadata]:
+        response = self._send_query(category, chunk_size, start)
+        while True:
+            entries = 0
+            for paper_metadata in arxiv_feed.parse_entries(response):
+                entries += 1
+                yield paper_metadata
 
-        entries = _find_entries(response)
-        while len(entries) == 0:
-            # retry as we received a response without entries
-            response = self._send_query(category, chunk_size, start)
-            entries = _find_entries(response)
+            if entries > 0:
+                break
 
-        util.write_to_file(util.get_requests_dir(), request_file, response)
-        return entries
+            # retry as we received a response without entries, the cached page must not be used for that
+            response = self._send_query(category, chunk_size, start, refresh=True)
 
     def _get_total_results(self, category: str) -> int:
         # requesting 1 result will still populate the opensearch:totalResults value
         response = self._send_query(category, 1, 0)
-        xml = bs4.BeautifulSoup(response, features="xml")
-        return int(xml.find("opensearch:totalResults").text)
+        attempts = 0
+        while (total_results := arxiv_feed.parse_total_results(response)) == 0 and attempts < _MAX_QUERY_RETRIES:
+            # an error page or an invalid response, like in _retrieve_query_response() the cached page is not used
+            attempts += 1
+            response = self._send_query(category, 1, 0, refresh=True)
+
+        return total_results
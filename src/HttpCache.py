@@ -0,0 +1,146 @@
+import hashlib
+import logging
+import time
+import typing
+from pathlib import Path
+
+import requests
+
+import util
+
+_logger = logging.getLogger(__name__)
+_BODY_SUFFIX = ".body"
+_META_SUFFIX = ".meta.json"
+# export.arxiv.org updates its database once a day, requesting the same page more often is of no use
+DEFAULT_TTL_S = 24 * 60 * 60
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+# an eviction frees some room below the limit, otherwise a full cache would be counted again on every store
+_EVICTION_TARGET = 0.9
+
+
+def _get_key(url: str) -> str:
+    return hashlib.sha256(url.encode(util.ARXIV_ENCODING)).hexdigest()
+
+
+class HttpCache:
+    """
+    File based cache for GET responses. Entries younger than the TTL are returned without sending a request, older
+    entries are revalidated with If-None-Match/If-Modified-Since, so an unchanged resource only costs a 304 response.
+    Once the bodies exceed max_bytes, the least recently used entries get evicted.
+    """
+
+    def __init__(self, cache_dir: Path, max_bytes=DEFAULT_MAX_BYTES):
+        self._cache_dir = cache_dir
+        self._max_bytes = max_bytes
+        # size of all bodies, counted once on the first store and then kept up to date. other processes may store
+        # entries as well, so it is only an estimate until the next eviction counts them again.
+        self._total_bytes: int | None = None
+
+    def get(
+            self, url: str, ttl_s: float, send: typing.Callable[[dict], requests.Response]
+    ) -> bytes:
+        # send is called with the conditional headers and has to perform the request (delays, retries, ...)
+        key = _get_key(url)
+        meta = self._read_meta(key)
+        now = time.time()
+        if meta and now - meta["stored_at"] < ttl_s:
+            if body := self._read_body(key, meta):
+                self._touch(key, meta, now)
+                return body
+
+            meta = None  # body is gone or incomplete
+
+        response = send(self._get_conditional_headers(meta))
+        if response.status_code == 304 and meta and (body := self._read_body(key, meta)):
+            _logger.debug("Revalidated cached response for '%s'.", url)
+            meta["stored_at"] = now
+            self._touch(key, meta, now)
+            return body
+
+        if response.status_code != 200:
+            return b""
+
+        body = response.content
+        self._store(key, url, response, body, now)
+        return body
+
+    def invalidate(self, url: str) -> None:
+        key = _get_key(url)
+        util.delete_file_in_dir(self._cache_dir, key + _META_SUFFIX)
+        util.delete_file_in_dir(self._cache_dir, key + _BODY_SUFFIX)
+
+    @staticmethod
+    def _get_conditional_headers(meta: dict | None) -> dict:
+        headers = {}
+        if not meta:
+            return headers
+
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+        return headers
+
+    def _read_meta(self, key: str) -> dict | None:
+        try:
+            meta = util.read_json(self._cache_dir, key + _META_SUFFIX)
+        except ValueError:
+            return None
+
+        return meta if isinstance(meta, dict) else None
+
+    def _read_body(self, key: str, meta: dict) -> bytes:
+        body_path = self._cache_dir / (key + _BODY_SUFFIX)
+        try:
+            body = body_path.read_bytes()
+        except OSError:
+            return b""
+
+        return body if len(body) == meta.get("size", -1) else b""
+
+    def _touch(self, key: str, meta: dict, now: float) -> None:
+        meta["last_used"] = now
+        util.write_obj_to_json(self._cache_dir, key + _META_SUFFIX, meta, unpicklable=False)
+
+    def _store(self, key: str, url: str, response: requests.Response, body: bytes, now: float) -> None:
+        # the body is written first, an entry only counts once its meta file exists
+        util.write_to_file(self._cache_dir, key + _BODY_SUFFIX, body, flags="wb", encoding=None)
+        meta = {
+            "url": url,
+            "etag": response.headers.get("ETag", ""),
+            "last_modified": response.headers.get("Last-Modified", ""),
+            "size": len(body),
+            "stored_at": now,
+            "last_used": now
+        }
+        util.write_obj_to_json(self._cache_dir, key + _META_SUFFIX, meta, unpicklable=False)
+        # reading every meta file only pays off once the cache may be full
+        if self._total_bytes is None or self._total_bytes + len(body) > self._max_bytes:
+            self._evict()
+        else:
+            self._total_bytes += len(body)
+
+    def _evict(self) -> None:
+        util.delete_stale_tmp_files(self._cache_dir)
+        entries = []
+        for meta_path in self._cache_dir.glob("*" + _META_SUFFIX):
+            key = meta_path.name.removesuffix(_META_SUFFIX)
+            if meta := self._read_meta(key):
+                entries.append((meta.get("last_used", 0), key, meta.get("size", 0)))
+
+        total_bytes = sum(size for _, _, size in entries)
+        if total_bytes <= self._max_bytes:
+            self._total_bytes = total_bytes
+            return
+
+        for _, key, size in sorted(entries):
+            if total_bytes <= self._max_bytes * _EVICTION_TARGET:
+                break
+
+            _logger.debug("Evicting cached response '%s'.", key)
+            util.delete_file_in_dir(self._cache_dir, key + _META_SUFFIX)
+            util.delete_file_in_dir(self._cache_dir, key + _BODY_SUFFIX)
+            total_bytes -= size
+
+        self._total_bytes = total_bytes
@@ -0,0 +1,155 @@
+import multiprocessing.util
+import os
+import sqlite3
+import threading
+import typing
+from datetime import datetime, timezone
+from pathlib import Path
+
+STAGE_DOWNLOAD = "download"
+STAGE_CMDS = "cmds"
+STAGE_EXTRACT = "extract"
+STAGE_MATCH = "match"
+STAGES = (STAGE_DOWNLOAD, STAGE_CMDS, STAGE_EXTRACT, STAGE_MATCH)  # in the order they run
+
+STATUS_DONE = "done"  # the stage wrote its output
+STATUS_EMPTY = "empty"  # the stage ran but had nothing to write, e.g. no commands in the tex files
+STATUS_FAILED = "failed"  # the stage could not run, it is tried again in the next run
+
+# status updates are collected and committed together, like the artifacts of the ArtifactStore
+_BATCH_SIZE = 200
+_BUSY_TIMEOUT_S = 60
+
+
+def _get_stage_columns(stage: str) -> tuple[str, str, str]:
+    return f"{stage}_status", f"{stage}_at", f"{stage}_reason"
+
+
+class PipelineManifest:
+    """
+    SQLite database with one row per paper, holding the status of each pipeline stage, when it was set and why a
+    stage failed or had nothing to do, as well as the number and size of the paper's tex files. A run asks the
+    manifest once which papers a stage still has to process instead of checking the files of every paper.
+    Setting the status of a stage resets the statuses of all later stages, their results are based on outdated input.
+    A stage that only finds the output of an earlier run keeps them, as their input did not change.
+    Updates are buffered and committed in batches, every process opens its own connection.
+    """
+
+    def __init__(self, db_path: Path):
+        self._db_path = db_path
+        self._lock = threading.Lock()  # the download threads share the connection of their process
+        self._pid = -1
+        self._connection: sqlite3.Connection | None = None
+        self._pending: dict[str, dict[str, str | int | None]] = {}  # paper -> column -> value
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            self._check_process()
+            if self._pending:
+                return False
+
+            return self._connection.execute("SELECT 1 FROM papers LIMIT 1").fetchone() is None
+
+    def get_papers(self, stage: str, statuses: tuple[str, ...]) -> set[str]:
+        status_column = _get_stage_columns(stage)[0]
+        placeholders = ", ".join("?" * len(statuses))
+        with self._lock:
+            self._check_process()
+            self._flush()
+            rows = self._connection.execute(
+                f"SELECT paper FROM papers WHERE {status_column} IN ({placeholders})", statuses
+            )
+            return {row[0] for row in rows}
+
+    def get_finished_papers(self, stage: str) -> set[str]:
+        # papers a stage does not need to process again, failed ones are retried
+        return self.get_papers(stage, (STATUS_DONE, STATUS_EMPTY))
+
+    def get_tex_stats(self) -> dict[str, tuple[int, int]]:
+        with self._lock:
+            self._check_process()
+            self._flush()
+            rows = self._connection.execute(
+                "SELECT paper, tex_files, tex_bytes FROM papers WHERE tex_files IS NOT NULL"
+            )
+            return {paper: (tex_files, tex_bytes) for paper, tex_files, tex_bytes in rows}
+
+    def set_status(self, paper: str, stage: str, status: str, reason="", reset_later_stages=True) -> None:
+        updated_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        updates = dict(zip(_get_stage_columns(stage), (status, updated_at, reason)))
+        if reset_later_stages:
+            for later_stage in STAGES[STAGES.index(stage) + 1:]:
+                updates.update(dict.fromkeys(_get_stage_columns(later_stage)))
+
+        self._add_pending(paper, updates)
+
+    def set_tex_stats(self, paper: str, tex_files: int, tex_bytes: int) -> None:
+        self._add_pending(paper, {"tex_files": tex_files, "tex_bytes": tex_bytes})
+
+    def remove(self, papers: typing.Iterable[str]) -> None:
+        papers = [(paper,) for paper in papers]
+        with self._lock:
+            self._check_process()
+            self._flush()
+            with self._connection:
+                self._connection.executemany("DELETE FROM papers WHERE paper = ?", papers)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._check_process()
+            self._pending.clear()
+            with self._connection:
+                self._connection.execute("DELETE FROM papers")
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._pid == os.getpid():
+                self._flush()
+
+    def _add_pending(self, paper: str, updates: dict[str, str | int | None]) -> None:
+        with self._lock:
+            self._check_process()
+            self._pending.setdefault(paper, {}).update(updates)
+            if len(self._pending) >= _BATCH_SIZE:
+                self._flush()
+
+    def _flush(self) -> None:
+        if not self._pending:
+            return
+
+        # papers with the same updated columns share a statement
+        statements: dict[tuple[str, ...], list[tuple]] = {}
+        for paper, updates in self._pending.items():
+            columns = tuple(updates)
+            statements.setdefault(columns, []).append((paper, *updates.values()))
+
+        with self._connection:  # one transaction for the whole batch
+            for columns, rows in statements.items():
+                placeholders = ", ".join("?" * (len(columns) + 1))
+                assignments = ", ".join(f"{column} = excluded.{column}" for column in columns)
+                self._connection.executemany(
+                    f"INSERT INTO papers (paper, {', '.join(columns)}) VALUES ({placeholders}) "
+                    f"ON CONFLICT (paper) DO UPDATE SET {assignments}",
+                    rows
+                )
+
+        self._pending.clear()
+
+    def _check_process(self) -> None:
+        # see ArtifactStore._check_process(), a forked process needs its own connection
+        if self._pid == os.getpid():
+            return
+
+        self._pid = os.getpid()
+        self._pending = {}
+        self._connection = sqlite3.connect(self._db_path, timeout=_BUSY_TIMEOUT_S, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        stage_columns = ", ".join(f"{column} TEXT" for stage in STAGES for column in _get_stage_columns(stage))
+        with self._connection:
+            self._connection.execute(
+                f"CREATE TABLE IF NOT EXISTS papers "
+                f"(paper TEXT PRIMARY KEY, tex_files INTEGER, tex_bytes INTEGER, {stage_columns}) WITHOUT ROWID"
+            )
+
+        multiprocessing.util.Finalize(None, self.flush, exitpriority=10)
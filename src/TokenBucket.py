@@ -0,0 +1,37 @@
+import multiprocessing
+import time
+
+_TOKENS = 0
+_LAST_REFILL = 1
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter that allows bursts of up to `capacity` requests and refills `rate` tokens per second.
+    The state lives in shared memory, so the same bucket limits all threads of a process and all processes that
+    inherit it (pass it as argument when creating a multiprocessing.Process).
+    """
+
+    def __init__(self, capacity: int, rate: float):
+        self._capacity = capacity
+        self._rate = rate
+        # time.monotonic() uses a system-wide clock on all supported platforms, so the timestamp is valid across
+        # processes. the array comes with its own lock that we also use to guard the refill.
+        self._state = multiprocessing.Array("d", [float(capacity), time.monotonic()])
+
+    def acquire(self) -> None:
+        while True:
+            with self._state.get_lock():
+                now = time.monotonic()
+                tokens = self._state[_TOKENS] + (now - self._state[_LAST_REFILL]) * self._rate
+                tokens = min(tokens, self._capacity)
+                self._state[_LAST_REFILL] = now
+                if tokens >= 1:
+                    self._state[_TOKENS] = tokens - 1
+                    return
+
+                self._state[_TOKENS] = tokens
+                wait_s = (1 - tokens) / self._rate
+
+            # sleep outside the lock so other threads and processes can refill and check in the meantime
+            time.sleep(wait_s)
@@ -0,0 +1,120 @@
+import io
+import logging
+import typing
+
+from lxml import etree
+
+from definition.data.ArxivMetadata import ArxivMetadata
+from definition.data.Author import Author
+
+_logger = logging.getLogger(__name__)
+
+# namespaces in Clark notation as used by lxml: {namespace}tag
+_ATOM = "{http://www.w3.org/2005/Atom}"
+_ARXIV = "{http://arxiv.org/schemas/atom}"
+_OPENSEARCH = "{http://a9.com/-/spec/opensearch/1.1/}"
+
+
+def _get_author_list(entry: etree.ElementBase) -> list[Author]:
+    authors = []
+    for author_tag in entry.iterfind(_ATOM + "author"):
+        name = author_tag.findtext(_ATOM + "name", default="").strip()
+        affiliations = []
+        for affiliation_tag in author_tag.iterfind(_ARXIV + "affiliation"):
+            affiliations.append(affiliation_tag.text or "")
+
+        authors.append(Author(name, affiliations))
+
+    return authors
+
+
+def _get_arxiv_id(arxiv_abs_url: str) -> tuple[str, str]:
+    version_index = arxiv_abs_url.rfind("v")
+    paper_version = arxiv_abs_url[version_index:] if version_index != -1 else "v1"
+    arxiv_id = arxiv_abs_url[:version_index].replace("http://arxiv.org/abs/", "")
+    return arxiv_id, paper_version
+
+
+def _str_contains_digit_char(string: str) -> bool:
+    for char in string:
+        if char.isdigit():
+            return True
+
+    return False
+
+
+def _get_categories(entry: etree.ElementBase) -> list[str]:
+    category_tags = entry.findall(_ATOM + "category")
+    if len(category_tags) == 0:
+        primary_category = entry.find(_ARXIV + "primary_category")
+        if primary_category is not None:
+            return [primary_category.get("term", "")]
+        else:
+            return []
+
+    # categories can be a classification from arXiv, ACM or MSC. multiple arXiv categories are normally in
+    # multiple category tags, while multiple ACM/MSC categories are separated by a semicolon. These category names
+    # also often include multiple dots and digits which arXiv does not.
+    # https://arxiv.org/category_taxonomy
+    categories = []
+    for category_tag in category_tags:
+        category_content = category_tag.get("term", "")
+
+        # ignore category lists from ACM/MSC
+        if ";" in category_content:
+            continue
+
+        # ignore categories that do not contain exactly one dot
+        if category_content.count(".") != 1:
+            continue
+
+        # if ignore categories with digits
+        if _str_contains_digit_char(category_content):
+            continue
+
+        categories.append(category_content)
+
+    return categories
+
+
+def _get_paper_metadata(entry: etree.ElementBase) -> ArxivMetadata:
+    arxiv_abs_url = entry.findtext(_ATOM + "id", default="")
+    arxiv_id, version = _get_arxiv_id(arxiv_abs_url)
+    title = entry.findtext(_ATOM + "title", default="")
+    comment = entry.findtext(_ARXIV + "comment", default="")
+    journal_ref = entry.findtext(_ARXIV + "journal_ref", default="")
+    doi = entry.findtext(_ARXIV + "doi", default="")
+    categories = _get_categories(entry)
+    last_updated = entry.findtext(_ATOM + "updated", default="")  # format: "%Y-%m-%dT%H:%M:%SZ"
+    published_on = entry.findtext(_ATOM + "published", default="")  # format: "%Y-%m-%dT%H:%M:%SZ"
+    authors = _get_author_list(entry)
+    return ArxivMetadata(
+        arxiv_id, version, title, comment, journal_ref, doi, categories, last_updated, published_on, authors
+    )
+
+
+def parse_entries(xml: bytes) -> typing.Iterator[ArxivMetadata]:
+    """
+    Parse the entries of an Atom feed page of the arXiv API one by one. Each entry is removed from the tree after
+    it got parsed, so only the entry that is currently processed is kept in memory. Parsing stops at the first error
+    of a truncated or otherwise invalid page, an empty error page yields no entries at all.
+    """
+    try:
+        for _, entry in etree.iterparse(io.BytesIO(xml), events=("end",), tag=_ATOM + "entry"):
+            yield _get_paper_metadata(entry)
+            entry.clear()
+            # cleared elements stay in the tree as empty siblings, remove them as well
+            while entry.getprevious() is not None:
+                del entry.getparent()[0]
+    except etree.XMLSyntaxError as e:
+        _logger.warning("Could not parse feed page: %s", e)
+
+
+def parse_total_results(xml: bytes) -> int:
+    try:
+        for _, total_results in etree.iterparse(io.BytesIO(xml), events=("end",), tag=_OPENSEARCH + "totalResults"):
+            return int(total_results.text)
+    except etree.XMLSyntaxError as e:
+        _logger.warning("Could not parse feed page: %s", e)
+
+    return 0
@@ -0,0 +1,16 @@
+from dataclasses import dataclass
+from pathlib import Path, PurePosixPath
+
+
+@dataclass
+class ArchiveMember:
+    archive_path: Path
+    at: str  # name of the member inside the archive, like zipfile.Path.at
+    file_size: int  # uncompressed size, like the size of extracted files
+
+    @property
+    def name(self) -> str:
+        return PurePosixPath(self.at).name
+
+    def __str__(self) -> str:
+        return f"{self.archive_path}/{self.at}"
@@ -1,12 +1,10 @@
 from dataclasses import dataclass
 
-from definition.data.RorDataset import ResearchOrganization
-
 
 @dataclass
 class MatchedAffiliationInfo:
     ext_name: str
-    matched_ror: ResearchOrganization
+    ror_id: str  # resolve the organization with ror_index.resolve()
     score: float
 
 
@@ -21,3 +19,4 @@ class MatchedAuthorInfo:
 @dataclass
 class MatchedPaperData:
     matched_authors: list[MatchedAuthorInfo]
+    ror_version: str = ""  # file name of the ROR dataset the IDs were matched with, empty for older files
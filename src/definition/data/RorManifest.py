@@ -0,0 +1,11 @@
+from dataclasses import dataclass
+
+
+@dataclass
+class RorManifest:
+    src_file_name: str
+    record_count: int
+    size: int
+    sha256: str
+    build_time: str
+    mtime_ns: int = 0  # 0 in manifests written before it was stored
@@ -333,6 +333,19 @@ AUTHORSHIP_ENV = regex.compile(
     regex.IGNORECASE
 )
 
+# matches the undecoded bytes of a tex file where AUTHORSHIP, AUTHORSHIP_ENV or LATEX_DOCUMENTCLASS may match, so only
+# the parts around these places have to be decoded and searched. the command names are ascii, matching a superset of
+# both patterns is enough.
+AUTHORSHIP_TRIGGER_BYTES = regex.compile(
+    rb"\\"
+    rb"(?:"
+        rb"(?P<env>mdxauthorstart\{\}|begin\{author\})"  # AUTHORSHIP_ENV ends on the line its content starts on
+        rb"|documentclass"
+        rb"|" + _trie_regex(_AUTHOR_CMDS + _AFFILIATION_CMDS).encode("ascii") +
+    rb")",
+    regex.IGNORECASE
+)
+
 # latex suggested syntax of \a{b} with a being the combining char and b being the char. however, curly braces are
 # optional and thus \`e will be valid as well. since stuff like \ca could be a command we will ignore characters of
 # the alphabet as the combining char. Furthermore, the char is limited to one char in the case without curly braces.
@@ -1,18 +1,41 @@
+import gzip
+import heapq
+import io
+import itertools
 import logging
+import multiprocessing
+import multiprocessing.queues
+import random
 import re
 import tarfile
-from datetime import datetime
+import time
+import typing
+import zlib
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED, Future
 from pathlib import Path
 
-import bs4
-import jsonpickle
+import requests
 
+import kaggle_scan
 import util
 from ArxivAPI import ArxivAPI
+from PipelineManifest import STAGE_DOWNLOAD, STATUS_DONE, STATUS_FAILED
 from definition.data.ArxivMetadata import ArxivMetadata
-from definition.data.Author import Author
 
-_SRC_FILE_NAME = "psrcdl.tar.gz"
+_STREAM_CHUNK_SIZE = 64 * 1024
+# sources of at least this size are downloaded to a part file first, so the download can be resumed
+_RESUMABLE_MIN_BYTES = 8 * 1024 * 1024
+_MAX_RESUMES = 5
+_PART_FILE = "src.part"
+_PART_INFO_FILE = "src.part.json"
+# number of papers handed to the executor per worker. keeps the workers busy without putting every paper of the
+# Kaggle dataset into the queue of the executor at once.
+_QUEUED_PAPERS_PER_WORKER = 2
+# failed downloads are retried after 10s, 20s, 40s, ... (plus jitter) while the other downloads continue
+_MAX_DOWNLOAD_ATTEMPTS = 5
+_RETRY_BASE_DELAY_S = 10
+# besides these, only server errors (5xx) are worth a retry. 403, 404, 410, ... will not change on the next request.
+_TRANSIENT_FAILURE_STATUS = {408, 429}
 _logger: logging.Logger = logging.getLogger(__name__)
 
 # own filter to sanitize names in tar for windows usage
@@ -28,19 +51,21 @@ def _tar_filter_sanitize(member: tarfile.TarInfo, path: str | Path, /) -> tarfil
     return tarfile.data_filter(member, path)
 
 
-def _process_single_member(tar, tar_member_name: str, arxiv_id: str) -> bool:
+def _is_single_file_source(tar_member_name: str, arxiv_id: str) -> bool:
+    # file named like the arxiv id without file extension containing the TeX source (new id)
+    # file named like the numeric part of the id (old id -> cs/9810022 -> 9810022)
+    return tar_member_name == arxiv_id or tar_member_name == re.sub("[^0-9]", "", arxiv_id)
+
+
+def _process_single_member(tar_member_name: str, paper_tex_dir: Path, extracted: bool) -> bool:
     if tar_member_name.endswith(".pdf") or tar_member_name.endswith(".html") or tar_member_name.endswith(".ps"):
         file_ext = tar_member_name.split(".")[-1]
         _logger.warning("Extraction failed! tar only contains a %s file!", file_ext)
         return False
 
-    # file named like the arxiv id without file extension containing the TeX source (new id)
-    # file named like the numeric part of the id (old id -> cs/9810022 -> 9810022)
-    if tar_member_name != arxiv_id and tar_member_name != re.sub("[^0-9]", "", arxiv_id):
+    if not extracted:
         return False
 
-    paper_tex_dir = util.get_paper_tex_dir_by_arxiv_id(arxiv_id)
-    tar.extract(tar_member_name, path=paper_tex_dir, filter="data")  # see _process_tar_members for info
     if not util.rename_file(paper_tex_dir, tar_member_name, "main.tex"):
         _logger.warning("Could not rename '%s' to a .tex-file!", tar_member_name)
         return False
@@ -48,65 +73,240 @@ def _process_single_member(tar, tar_member_name: str, arxiv_id: str) -> bool:
     return True
 
 
-def _process_tar_members(tar: tarfile.TarFile, arxiv_id: str) -> bool:
-    tar_member_names = tar.getnames()
-    if len(tar_member_names) == 1:
-        return _process_single_member(tar, tar_member_names[0], arxiv_id)
-    else:
-        tar_members = tar.getmembers()
-        tex_files = [tar_member for tar_member in tar_members if tar_member.name.endswith(".tex")]
-        if len(tex_files) == 0:
-            _logger.warning("Failed! tar-file does not contain any .tex-files.")
-            return False
-
-        # using the filter to prevent some security issues. "data" will become the default in python 3.14
-        # https://docs.python.org/3/library/tarfile.html#tarfile.TarFile.extractall
-        # https://docs.python.org/3/library/tarfile.html#tarfile-extraction-filter
-        # extract(all) also does not handle invalid characters on windows.
-        # manually sanitize the names before extraction with own filter implementation:
-        # https://github.com/python/cpython/issues/80715#issuecomment-1533155463
-        for tex_file in tex_files:
+def _process_tar_members(tar: tarfile.TarFile, arxiv_id: str, paper_tex_dir: Path) -> bool:
+    # in stream mode every member can only be visited once and in order, so we can not check the number of members
+    # before extracting. the file of a single file source gets extracted on suspicion and removed again if it turns
+    # out that there are more members.
+    member_count = 0
+    first_member_name = ""
+    single_file_name = ""
+    tex_files = 0
+    for tar_member in tar:
+        member_count += 1
+        if member_count == 1:
+            first_member_name = tar_member.name
+
+        if not tar_member.isfile():
+            continue
+
+        if tar_member.name.endswith(".tex"):
+            # using the filter to prevent some security issues. "data" will become the default in python 3.14
+            # https://docs.python.org/3/library/tarfile.html#tarfile.TarFile.extractall
+            # https://docs.python.org/3/library/tarfile.html#tarfile-extraction-filter
+            # extract(all) also does not handle invalid characters on windows.
+            # manually sanitize the names before extraction with own filter implementation:
+            # https://github.com/python/cpython/issues/80715#issuecomment-1533155463
             try:
-                tar.extract(tex_file, path=util.get_paper_tex_dir_by_arxiv_id(arxiv_id), filter=_tar_filter_sanitize)
+                tar.extract(tar_member, path=paper_tex_dir, filter=_tar_filter_sanitize)
+                tex_files += 1
             except OSError:
-                _logger.warning("Can not extract file! Invalid name of tar member: '%s'", tex_file.name)
-                continue
+                _logger.warning("Can not extract file! Invalid name of tar member: '%s'", tar_member.name)
+        elif member_count == 1 and _is_single_file_source(tar_member.name, arxiv_id):
+            tar.extract(tar_member, path=paper_tex_dir, filter="data")
+            single_file_name = tar_member.name
+
+    if member_count == 1 and tex_files == 0:
+        return _process_single_member(first_member_name, paper_tex_dir, single_file_name != "")
+
+    if single_file_name:
+        util.delete_file_in_dir(paper_tex_dir, single_file_name)
 
+    if tex_files == 0:
+        _logger.warning("Failed! tar-file does not contain any .tex-files.")
+        return False
+
+    return True
+
+
+class _ResponseStream(io.RawIOBase):
+    """
+    Read-only file object over the body of a streamed response. Uses iter_content() so the content encoding gets
+    decoded and connection errors are raised as requests exceptions, like they are for response.content.
+    """
+
+    def __init__(self, response: requests.Response):
+        self._chunks = response.iter_content(chunk_size=_STREAM_CHUNK_SIZE)
+        self._buffer = b""
+
+    def readable(self) -> bool:
         return True
 
+    def readinto(self, buffer) -> int:
+        while not self._buffer:
+            if (chunk := next(self._chunks, None)) is None:
+                return 0
+
+            self._buffer = chunk
+
+        size = min(len(buffer), len(self._buffer))
+        buffer[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+
+def _delete_tex_files(paper_tex_dir: Path) -> None:
+    # an incomplete set of tex files would make later runs skip the download of that paper
+    util.delete_files(util.get_all_files_recursive(paper_tex_dir))
+
 
 # working with tar commands would work (even for windows due to WSL), but the syntax for those commands is different.
 # Windows: tar -xzf <name> "*.tex"
 # Linux: tar -xzf <name> --wildcard --no-anchored "*.tex"
 # Adding more commands to check the file contents would further increase the issue and would require platform dependent
 # methods. That's why instead of using tar commands via subprocess, the tarfile lib gets used here.
-def _extract_tar(tar_file_path: Path, arxiv_id: str) -> bool:
-    _logger.info("Extracting tar file.")
-    if not tarfile.is_tarfile(tar_file_path):
-        _logger.warning("Extraction failed! '%s' is not a tar-file.", tar_file_path.name)
+# The source is read by tarfile in stream mode ("r|*" also detects the compression), so it never needs to be written to
+# disk as a whole and only the needed members end up in the tex directory.
+def _extract_tar_stream(src: typing.BinaryIO, arxiv_id: str) -> bool:
+    _logger.info("Extracting tar stream.")
+    paper_tex_dir = util.get_paper_tex_dir_by_arxiv_id(arxiv_id)
+    try:
+        with tarfile.open(fileobj=src, mode="r|*") as tar:
+            return _process_tar_members(tar, arxiv_id, paper_tex_dir)
+    except (tarfile.TarError, EOFError):
+        _logger.warning("Extraction failed! Source of '%s' is not a valid tar-file.", arxiv_id)
+        _delete_tex_files(paper_tex_dir)
         return False
+    except requests.RequestException:
+        _delete_tex_files(paper_tex_dir)
+        raise
+
+
+def _check_status(response: requests.Response, arxiv_id: str) -> bool:
+    # transient errors are raised, so the download gets retried later. permanent errors put the paper on the skip list.
+    status = response.status_code
+    if status in _TRANSIENT_FAILURE_STATUS or status >= 500:
+        response.close()
+        raise requests.HTTPError(f"Status {status} for '{arxiv_id}'", response=response)
+
+    if status >= 400:
+        _logger.warning("Source of '%s' is not available (status %s)!", arxiv_id, status)
+        response.close()
+        return False
+
+    return True
+
+
+def _get_total_length(response: requests.Response, offset: int) -> int:
+    # "Content-Range: bytes 1000-4999/5000" for resumed downloads, otherwise the length of the whole file
+    if response.status_code == 206 and (content_range := response.headers.get("Content-Range", "")):
+        total_length = content_range.rsplit("/", 1)[-1]
+        return int(total_length) if total_length.isdigit() else -1
+
+    content_length = response.headers.get("Content-Length", "")
+    return int(content_length) + offset if content_length.isdigit() else -1
 
-    with tarfile.open(tar_file_path, "r") as tar:
-        success = _process_tar_members(tar, arxiv_id)
 
-    util.delete_file(tar_file_path)
+def _write_part(response: requests.Response, paper_dir: Path, offset: int) -> None:
+    if response.status_code != 206:
+        offset = 0  # the server sends the whole file, e.g. because it changed since the last attempt
+
+    part_info = {
+        "validator": response.headers.get("ETag", response.headers.get("Last-Modified", "")),
+        "length": _get_total_length(response, offset)
+    }
+    util.write_obj_to_json(paper_dir, _PART_INFO_FILE, part_info)
+    with open(paper_dir / _PART_FILE, "ab" if offset > 0 else "wb") as part_file:
+        for chunk in response.iter_content(chunk_size=_STREAM_CHUNK_SIZE):
+            part_file.write(chunk)
+
+
+def _is_gzip_complete(part_path: Path) -> bool:
+    # reading a gzip file to its end checks the CRC-32 and the length stored in the trailer of the gzip stream
+    try:
+        with gzip.open(part_path, "rb") as gzip_file:
+            while gzip_file.read(_STREAM_CHUNK_SIZE):
+                pass
+    except (OSError, EOFError, zlib.error):
+        return False
+
+    return True
+
+
+def _is_valid_part(part_path: Path, part_info: dict) -> bool:
+    if part_info.get("length", -1) not in (-1, part_path.stat().st_size):
+        return False
+
+    with open(part_path, "rb") as part_file:
+        is_gzip = part_file.read(2) == b"\x1f\x8b"
+
+    return _is_gzip_complete(part_path) if is_gzip else True
+
+
+def _download_part(arxiv_api: ArxivAPI, arxiv_id: str, paper_dir: Path, response: requests.Response | None) -> bool:
+    part_path = paper_dir / _PART_FILE
+    attempts = 0
+    while True:
+        offset = part_path.stat().st_size if part_path.is_file() else 0
+        try:
+            if response is None:
+                part_info = util.read_json(paper_dir, _PART_INFO_FILE) or {}
+                response = arxiv_api.get_src(arxiv_id, offset, part_info.get("validator", ""))
+
+            with response:
+                if response.status_code == 416:
+                    # range not satisfiable: the part file already holds the whole source
+                    return offset > 0
+                if not _check_status(response, arxiv_id):
+                    return False
+
+                _write_part(response, paper_dir, offset)
+
+            return True
+        except requests.HTTPError:
+            raise  # the server is not ready for us, resuming right away would not help
+        except requests.RequestException:
+            # the part file stays on disk, so even a new run can continue from here
+            response = None
+            if attempts >= _MAX_RESUMES:
+                raise
+
+            attempts += 1
+            _logger.warning("Download of '%s' interrupted! Resuming (%s/%s).", arxiv_id, attempts, _MAX_RESUMES)
+
+
+# large sources are written to a part file, so an interrupted download can be continued with a range request
+# instead of starting over. the part file is validated before the extraction and removed afterward.
+def _download_resumable(arxiv_api: ArxivAPI, arxiv_id: str, response: requests.Response | None) -> bool:
+    paper_dir = util.get_paper_dir(arxiv_id)
+    downloaded = _download_part(arxiv_api, arxiv_id, paper_dir, response)
+    part_path = paper_dir / _PART_FILE
+    part_info = util.read_json(paper_dir, _PART_INFO_FILE) or {}
+    if not downloaded:
+        success = False
+    elif _is_valid_part(part_path, part_info):
+        with open(part_path, "rb") as part_file:
+            success = _extract_tar_stream(part_file, arxiv_id)
+    else:
+        _logger.warning("Download of '%s' is incomplete or corrupted!", arxiv_id)
+        success = False
+
+    util.delete_file(part_path)
+    util.delete_file_in_dir(paper_dir, _PART_INFO_FILE)
     return success
 
 
-def _download_src_tar(arxiv_api: ArxivAPI, arxiv_id, paper_dir) -> Path:
+def download_paper(arxiv_api: ArxivAPI, arxiv_id: str) -> bool:
     _logger.info("Requesting src tar from arxiv.")
+    if util.file_exists(util.get_paper_dir(arxiv_id), _PART_FILE):
+        _logger.info("Found partial download of '%s'. Resuming download.", arxiv_id)
+        return _download_resumable(arxiv_api, arxiv_id, None)
+
     response = arxiv_api.get_src(arxiv_id)
-    src_file = response.content
-    return util.write_to_file(paper_dir, _SRC_FILE_NAME, src_file, flags="wb", encoding=None)  # no encoding needed
+    if not _check_status(response, arxiv_id):
+        return False
 
+    content_length = _get_total_length(response, 0)
+    if content_length >= _RESUMABLE_MIN_BYTES and "Content-Encoding" not in response.headers:
+        return _download_resumable(arxiv_api, arxiv_id, response)
 
-def download_paper(arxiv_api: ArxivAPI, arxiv_id: str) -> bool:
-    paper_dir = util.get_paper_dir(arxiv_id)
-    tar_file_path = _download_src_tar(arxiv_api, arxiv_id, paper_dir)
-    return _extract_tar(tar_file_path, arxiv_id)
+    with response:
+        return _extract_tar_stream(_ResponseStream(response), arxiv_id)
 
 
-def _run(arxiv_api: ArxivAPI, paper_metadata: ArxivMetadata, to_skip: set[str]) -> None:
+def _run(
+        arxiv_api: ArxivAPI, paper_metadata: ArxivMetadata, to_skip: set[str],
+        paper_queue: multiprocessing.queues.Queue | None, pack_sources: bool
+) -> None:
     arxiv_id = paper_metadata.arxiv_id
     _logger.info("Downloading arXiv paper '%s'...", arxiv_id)
     paper_dir = util.get_paper_dir(arxiv_id)
@@ -117,209 +317,145 @@ def _run(arxiv_api: ArxivAPI, paper_metadata: ArxivMetadata, to_skip: set[str])
         _logger.info("'%s' in skip list! Skipping download.", arxiv_id)
         return
 
-    if len(util.get_all_files_recursive(util.get_paper_tex_dir_by_arxiv_id(arxiv_id), extension=".tex")) > 0:
+    manifest = util.get_pipeline_manifest()
+    if util.has_tex_files(paper_dir):
         _logger.info("TeX files found on disk for '%s'! Skipping download.", arxiv_id)
+        manifest.set_tex_stats(paper_dir.name, *util.get_tex_stats(paper_dir))
+        # the files did not change, so the results of the later stages are still valid
+        manifest.set_status(paper_dir.name, STAGE_DOWNLOAD, STATUS_DONE, reset_later_stages=False)
         return
 
     if not download_paper(arxiv_api, arxiv_id):
         _logger.warning("Download failed! Adding '%s' to skip list.", arxiv_id)
         to_skip.add(arxiv_id)
+        manifest.set_status(paper_dir.name, STAGE_DOWNLOAD, STATUS_FAILED, "no LaTeX source available")
+        return
 
+    if pack_sources:
+        util.pack_tex_files(paper_dir)
+
+    manifest.set_tex_stats(paper_dir.name, *util.get_tex_stats(paper_dir))
+    manifest.set_status(paper_dir.name, STAGE_DOWNLOAD, STATUS_DONE)
+
+    if paper_queue is not None:
+        # hand the paper over to the extraction workers while we continue downloading. the workers run in other
+        # processes, they only see the metadata once it is committed.
+        util.flush_artifacts()
+        paper_queue.put(paper_dir)
+
+
+def _get_retry_delay(error: requests.RequestException, attempt: int) -> float:
+    delay = _RETRY_BASE_DELAY_S * 2 ** attempt
+    # jitter spreads the retries of papers that failed at the same time, e.g. during a short outage
+    delay += random.uniform(0, delay / 2)
+    retry_after = error.response.headers.get("Retry-After", "") if error.response is not None else ""
+    return max(delay, int(retry_after)) if retry_after.isdigit() else delay
+
+
+# downloading is mostly waiting for the network, so we use threads instead of processes. the number of requests is
+# still limited by the token bucket of the ArxivAPI which is shared by all threads (and processes).
+# a download that fails with a network error or a temporary server error is put into a heap of retries ordered by
+# the time it is due. the loop keeps submitting new papers in the meantime, so one flaky paper does not stall the rest.
+def _run_concurrently(
+        arxiv_api: ArxivAPI, papers: typing.Iterable[ArxivMetadata], to_skip: set[str], workers: int,
+        paper_queue: multiprocessing.queues.Queue | None, pack_sources=False
+) -> None:
+    papers = iter(papers)
+    max_in_flight = workers * _QUEUED_PAPERS_PER_WORKER
+    in_flight: dict[Future, tuple[ArxivMetadata, int]] = {}
+    retries: list[tuple[float, int, ArxivMetadata, int]] = []  # (due, sequence number, paper, attempt)
+    sequence = itertools.count()  # tie-breaker, metadata objects are not comparable
+    papers_left = True
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while True:
+            while retries and retries[0][0] <= time.monotonic() and len(in_flight) < max_in_flight:
+                _, _, paper_metadata, attempt = heapq.heappop(retries)
+                future = executor.submit(_run, arxiv_api, paper_metadata, to_skip, paper_queue, pack_sources)
+                in_flight[future] = (paper_metadata, attempt)
+
+            while papers_left and len(in_flight) < max_in_flight:
+                if (paper_metadata := next(papers, None)) is None:
+                    papers_left = False
+                    break
+
+                future = executor.submit(_run, arxiv_api, paper_metadata, to_skip, paper_queue, pack_sources)
+                in_flight[future] = (paper_metadata, 0)
+
+            if not in_flight and not retries:
+                break
+
+            # a due retry can only be submitted once a slot is free, until then only finished downloads matter
+            timeout = None
+            if retries and len(in_flight) < max_in_flight:
+                timeout = max(0.0, retries[0][0] - time.monotonic())
+
+            if not in_flight:
+                time.sleep(timeout)
+                continue
 
-def _replace_month_abbr(date_str: str) -> str:
-    months = {
-        "Jan": "01", "Feb": "02", "Mar": "03", "Apr": "04", "May": "05", "Jun": "06",
-        "Jul": "07", "Aug": "08", "Sep": "09", "Oct": "10", "Nov": "11", "Dec": "12",
-    }
-    # "%d %b %Y %H:%M:%S %Z"
-    parts = date_str.split(" ")
-    parts[1] = months[parts[1]]
-    return " ".join(parts)
-
-def _get_kaggle_version_data(metadata: dict) -> tuple[str, str]:
-    paper_versions = metadata.get("versions", [{"version": "v1", "created": metadata.get("update_date", "")}])
-    paper_version = paper_versions[-1].get("version", "")  # get the latest version
-    published_on = paper_versions[0].get("created", "")  # get the original release date
-    # DATETIME IS LOCALE DEPENDENT!!! DATETIME DOES NOT SUPPORT USING OTHER LOCALES!!!
-    # We could set the locale with locale.setlocale but that is platform dependent and discouraged.
-    # Instead, we drop the day name abbreviation and transform the month name abbreviation to a number.
-    # We need to replace the month name abbreviation because the day of month is not zero-padded so the month isn't
-    # always at the same position.
-    # transform "%a, %d %b %Y %H:%M:%S %Z" ("Mon, 2 Apr 2007 19:18:42 GMT")
-    # to        "%d %m %Y %H:%M:%S %Z"     ("2 04 2007 19:18:42 GMT")
-    # to        "%Y-%m-%dT%H:%M:%SZ"       ("2007-04-02T19:18:42Z") -> ArXiv format
-    published_on = _replace_month_abbr(published_on[5:])  # remove "Mon, " and the month abbr
-    dt = datetime.strptime(published_on, "%d %m %Y %H:%M:%S %Z")
-    published_on = dt.strftime("%Y-%m-%dT%H:%M:%SZ")
-    return paper_version, published_on
-
-
-def _get_kaggle_author_list(metadata: dict) -> list[Author]:
-    author_list = metadata.get("authors_parsed", [])
-    authors = []
-    for author in author_list:
-        # "The list for each author will have at least three elements for
-        # keyname, firstname(s) and suffix. The keyname will always have content
-        # but the other strings might be empty strings if there is no firstname
-        # or suffix. Any additional elements after the first three are affiliations,
-        # there may be zero or more."
-        # -> https://github.com/mattbierbaum/arxiv-public-datasets/blob/master/arxiv_public_data/authors.py#L66
-        keyname = author[0].strip()
-        given_name = author[1].strip() if len(author) > 1 else ""
-        suffix = author[2].strip() if len(author) > 2 else ""  # like Jr., Sr. or roman numbers
-        affiliations = []
-        for affiliation in author[3:]:
-            affiliations.append(affiliation)
-
-        name = " ".join([given_name, keyname, suffix])
-        authors.append(Author(name, affiliations))
-
-    return authors
-
-
-def _get_kaggle_metadata(line: str) -> ArxivMetadata:
-    metadata = jsonpickle.decode(line)
-    arxiv_id = metadata["id"]
-    title = metadata.get("title", "")
-    comment = metadata.get("comments", "")
-    journal_ref = metadata.get("journal-ref", "")
-    doi = metadata.get("doi", "")
-    categories = metadata.get("categories", "").split(" ")  # the arXiv dataset already filters any non-arXiv categories
-
-    # format: "%Y-%m-%d" (kaggle) -> %Y-%m-%dT%H:%M:%SZ" (arXiv)
-    last_updated = metadata.get("update_date", "")
-    if last_updated:
-        last_updated += "T11:11:11Z"  # set some time to adhere to arxiv format
-
-    version, published_on = _get_kaggle_version_data(metadata)
-    authors = _get_kaggle_author_list(metadata)
-    return ArxivMetadata(
-        arxiv_id, version, title, comment, journal_ref, doi, categories, last_updated, published_on, authors
-    )
-
-
-def run_kaggle(arxiv_api: ArxivAPI, kaggle_path: Path, arxiv_category: str) -> None:
+            done, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                paper_metadata, attempt = in_flight.pop(future)
+                try:
+                    future.result()
+                except requests.RequestException as e:
+                    arxiv_id = paper_metadata.arxiv_id
+                    attempt += 1
+                    if attempt >= _MAX_DOWNLOAD_ATTEMPTS:
+                        # not added to the skip list, the next run tries again
+                        _logger.error("Download of '%s' failed %s times! Giving up for now: %s", arxiv_id, attempt, e)
+                        util.get_pipeline_manifest().set_status(
+                            util.sanitize_arxiv_id(arxiv_id), STAGE_DOWNLOAD, STATUS_FAILED, str(e)
+                        )
+                        continue
+
+                    delay = _get_retry_delay(e, attempt - 1)
+                    _logger.warning("Download of '%s' failed! Retrying in %.0f seconds: %s", arxiv_id, delay, e)
+                    heapq.heappush(retries, (time.monotonic() + delay, next(sequence), paper_metadata, attempt))
+
+
+def _get_downloaded_arxiv_ids() -> set[str]:
+    papers = util.load_pipeline_manifest().get_papers(STAGE_DOWNLOAD, (STATUS_DONE,))
+    # reverse util.sanitize_arxiv_id(), arXiv IDs do not contain underscores
+    return {paper.replace("_", "/") for paper in papers}
+
+
+def run_kaggle(
+        arxiv_api: ArxivAPI, kaggle_path: Path, arxiv_category: str, workers: int,
+        paper_queue: multiprocessing.queues.Queue | None = None, pack_sources=False
+) -> None:
     """
     Download LaTeX files from arXiv using the data provided in the Kaggle dataset of arXiv metadata.
+    The directory of each downloaded paper is put into paper_queue, if given. With pack_sources, the LaTeX files of
+    each paper are stored in a single archive instead of a directory.
     """
     util.configure_logger(_logger)
     to_skip = set(util.read_json(util.get_papers_dir(), util.SKIPPED_DL_FILE) or [])
     try:
-        with open(kaggle_path, "r") as f:
-            # each line is a JSON object, 'jsonlines' format
-            for line in f:
-                paper_metadata = _get_kaggle_metadata(line)
-                if arxiv_category not in paper_metadata.categories:
-                    # skip any papers that are not of the requested category
-                    continue
-
-                _run(arxiv_api, paper_metadata, to_skip)
+        # papers that are downloaded or skipped do not need to be read from the dataset at all
+        papers = kaggle_scan.scan(kaggle_path, arxiv_category, exclude_ids=to_skip | _get_downloaded_arxiv_ids())
+        _run_concurrently(arxiv_api, papers, to_skip, workers, paper_queue, pack_sources)
     finally:
         # save the skipped downloads even on KeyboardInterrupt or other exceptions
         util.write_obj_to_json(util.get_papers_dir(), util.SKIPPED_DL_FILE, to_skip)
 
 
-def _get_author_list(entry: bs4.element.Tag) -> list[Author]:
-    authors = []
-    for author_tag in entry.findAll("author"):
-        if not author_tag.name:
-            continue
-
-        # .name does not work here as that is used by the lib for the tag name
-        name = str(author_tag.find("name").string).strip()
-        affiliations = []
-        for affiliation_tag in author_tag.findAll("arxiv:affiliation"):
-            affiliations.append(str(affiliation_tag.string))
-
-        authors.append(Author(name, affiliations))
-
-    return authors
-
-
-def _get_arxiv_id(arxiv_abs_url: str) -> tuple[str, str]:
-    version_index = arxiv_abs_url.rfind("v")
-    paper_version = arxiv_abs_url[version_index:] if version_index != -1 else "v1"
-    arxiv_id = arxiv_abs_url[:version_index].replace("http://arxiv.org/abs/", "")
-    return arxiv_id, paper_version
-
-
-def _str_contains_digit_char(string: str) -> bool:
-    for char in string:
-        if char.isdigit():
-            return True
-
-    return False
-
-
-def _get_categories(entry: bs4.Tag) -> list[str]:
-    category_tags = entry.findAll("category")
-    if len(category_tags) == 0:
-        primary_category = entry.find("arxiv:primary_category")
-        if primary_category:
-            return [str(primary_category["term"])]
-        else:
-            return []
-
-    # categories can be a classification from arXiv, ACM or MSC. multiple arXiv categories are normally in
-    # multiple category tags, while multiple ACM/MSC categories are separated by a semicolon. These category names
-    # also often include multiple dots and digits which arXiv does not.
-    # https://arxiv.org/category_taxonomy
-    categories = []
-    for category_tag in category_tags:
-        category_content = str(category_tag["term"])
-
-        # ignore category lists from ACM/MSC
-        if ";" in category_content:
-            continue
-
-        # ignore categories that do not contain exactly one dot
-        if category_content.count(".") != 1:
-            continue
-
-        # if ignore categories with digits
-        if _str_contains_digit_char(category_content):
-            continue
-
-        categories.append(category_content)
-
-    return categories
-
-
-def _get_optional_tag(entry: bs4.Tag, tag_name: str, ):
-    tag = entry.find(tag_name)
-    if not tag:
-        return ""
-
-    return str(tag.string)
-
-
-def _get_paper_metadata(entry: bs4.element.Tag) -> ArxivMetadata:
-    # use str() to convert bs4.NavigableString to built-in str as otherwise JSON encoding will fail
-    arxiv_abs_url = str(entry.id.string)
-    arxiv_id, version = _get_arxiv_id(arxiv_abs_url)
-    title = str(entry.title.string)
-    comment = _get_optional_tag(entry, "arxiv:comment")
-    journal_ref = _get_optional_tag(entry, "arxiv:journal_ref")
-    doi = _get_optional_tag(entry, "arxiv:doi")
-    categories = _get_categories(entry)
-    last_updated = str(entry.updated.string)  # format: "%Y-%m-%dT%H:%M:%SZ"
-    published_on = str(entry.published.string)  # format: "%Y-%m-%dT%H:%M:%SZ"
-    authors = _get_author_list(entry)
-    return ArxivMetadata(
-        arxiv_id, version, title, comment, journal_ref, doi, categories, last_updated, published_on, authors
-    )
-
-
-def run_api(arxiv_api: ArxivAPI, entries: list[bs4.Tag]) -> None:
+def run_api(
+        arxiv_api: ArxivAPI, papers: typing.Iterable[ArxivMetadata], workers: int,
+        paper_queue: multiprocessing.queues.Queue | None = None, pack_sources=False
+) -> None:
     """
     Download LaTeX files from arXiv using its API to get a list of papers.
+    The directory of each downloaded paper is put into paper_queue, if given. With pack_sources, the LaTeX files of
+    each paper are stored in a single archive instead of a directory.
     """
     util.configure_logger(_logger)
     to_skip = set(util.read_json(util.get_papers_dir(), util.SKIPPED_DL_FILE) or [])
+    downloaded = _get_downloaded_arxiv_ids()
     try:
-        for entry in entries:
-            paper_metadata = _get_paper_metadata(entry)
-            _run(arxiv_api, paper_metadata, to_skip)
+        # like the Kaggle import, papers that are downloaded already are not submitted at all
+        papers = (paper for paper in papers if paper.arxiv_id not in downloaded)
+        _run_concurrently(arxiv_api, papers, to_skip, workers, paper_queue, pack_sources)
     finally:
         # save the skipped downloads even on KeyboardInterrupt or other exceptions
         util.write_obj_to_json(util.get_papers_dir(), util.SKIPPED_DL_FILE, to_skip)
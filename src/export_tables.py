@@ -0,0 +1,274 @@
+import logging
+import multiprocessing
+from collections import OrderedDict
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import ror_index
+import util
+from definition.data.ArxivMetadata import ArxivMetadata
+from definition.data.ExtAuthorData import ExtAuthorInfo
+from definition.data.MatchedAuthorData import MatchedPaperData
+
+_logger = logging.getLogger(__name__)
+
+TABLE_PAPERS = "papers"
+TABLE_AUTHORS = "authors"
+TABLE_AFFILIATIONS = "affiliations"
+TABLE_EXTRACTIONS = "extractions"
+_SCHEMAS = {
+    TABLE_PAPERS: pa.schema([
+        ("arxiv_id", pa.string()),
+        ("version", pa.string()),
+        ("title", pa.string()),
+        ("doi", pa.string()),
+        ("journal_ref", pa.string()),
+        ("categories", pa.list_(pa.string())),
+        ("published_on", pa.timestamp("s", tz="UTC")),
+        ("last_updated", pa.timestamp("s", tz="UTC")),
+        ("arxiv_authors", pa.int32()),
+        ("ext_type", pa.string()),
+        ("best_scheme", pa.string()),
+        ("best_score", pa.float64()),
+        ("matched_authors", pa.int32()),
+        ("ror_version", pa.string())
+    ]),
+    TABLE_AUTHORS: pa.schema([
+        ("arxiv_id", pa.string()),
+        ("author_index", pa.int32()),
+        ("arxiv_name", pa.string()),
+        ("ext_name", pa.string()),
+        ("score", pa.float64())
+    ]),
+    TABLE_AFFILIATIONS: pa.schema([
+        ("arxiv_id", pa.string()),
+        ("author_index", pa.int32()),  # references the author of the same paper in the authors table
+        ("ext_name", pa.string()),
+        ("ror_id", pa.string()),
+        ("ror_name", pa.string()),
+        ("countries", pa.list_(pa.string())),
+        ("score", pa.float64())
+    ]),
+    TABLE_EXTRACTIONS: pa.schema([
+        ("arxiv_id", pa.string()),
+        ("scheme_name", pa.string()),
+        ("score", pa.float64()),
+        ("authors", pa.int32()),
+        ("is_best", pa.bool_())
+    ])
+}
+
+# the tables are partitioned by the month the papers were published in, as directories named like
+# "published_month=2024-05" (hive partitioning, pyarrow.dataset and most other readers detect the column)
+_PARTITION_KEY = "published_month"
+_UNKNOWN_PARTITION = "unknown"
+# a reader only needs to decode the row groups (and the columns) it uses
+_ROW_GROUP_SIZE = 64 * 1024
+# rows of all partitions buffered together, before they are written even if the row groups are not full yet
+_MAX_BUFFERED_ROWS = 4 * _ROW_GROUP_SIZE
+# papers are exported ordered by their ID, which starts with year and month for new IDs. the partitions are mostly
+# written one after another, so only a few files have to be open. a partition that is needed again after its file
+# got closed gets another file.
+_MAX_OPEN_FILES = 32
+_COMPRESSION = "zstd"
+_DATE_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+_PAPERS_PER_CHUNK = 64
+
+
+class _PartitionedTableWriter:
+    """
+    Writes the rows of one table into Parquet files, one directory per partition. Rows are buffered and written in
+    row groups. Files are written under a temporary name and only get their final name once they are complete.
+    """
+
+    def __init__(self, table_dir: Path, schema: pa.Schema):
+        self._table_dir = table_dir
+        self._schema = schema
+        self._rows: dict[str, list[dict]] = {}
+        self._buffered_rows = 0
+        self._writers: OrderedDict[str, tuple[pq.ParquetWriter, Path, Path]] = OrderedDict()  # least recent first
+        self._file_counts: dict[str, int] = {}
+
+    def add(self, partition: str, rows: list[dict]) -> None:
+        self._rows.setdefault(partition, []).extend(rows)
+        self._buffered_rows += len(rows)
+        if len(self._rows[partition]) >= _ROW_GROUP_SIZE:
+            self._write_row_group(partition)
+        elif self._buffered_rows >= _MAX_BUFFERED_ROWS:
+            for buffered_partition in list(self._rows):
+                self._write_row_group(buffered_partition)
+
+    def close(self) -> None:
+        for partition in list(self._rows):
+            self._write_row_group(partition)
+
+        for partition in list(self._writers):
+            self._close_file(partition)
+
+    def _write_row_group(self, partition: str) -> None:
+        rows = self._rows.pop(partition)
+        self._buffered_rows -= len(rows)
+        if partition in self._writers:
+            self._writers.move_to_end(partition)
+        else:
+            if len(self._writers) >= _MAX_OPEN_FILES:
+                self._close_file(next(iter(self._writers)))
+
+            self._open_file(partition)
+
+        writer = self._writers[partition][0]
+        writer.write_table(pa.Table.from_pylist(rows, schema=self._schema), row_group_size=_ROW_GROUP_SIZE)
+
+    def _open_file(self, partition: str) -> None:
+        partition_dir = self._table_dir / f"{_PARTITION_KEY}={partition}"
+        partition_dir.mkdir(parents=True, exist_ok=True)
+        file_number = self._file_counts.get(partition, 0)
+        self._file_counts[partition] = file_number + 1
+        file_path = partition_dir / f"part-{file_number}.parquet"
+        tmp_path = partition_dir / f".{file_path.name}.tmp"  # readers ignore files starting with a dot
+        writer = pq.ParquetWriter(tmp_path, self._schema, compression=_COMPRESSION)
+        self._writers[partition] = (writer, tmp_path, file_path)
+
+    def _close_file(self, partition: str) -> None:
+        writer, tmp_path, file_path = self._writers.pop(partition)
+        writer.close()
+        tmp_path.replace(file_path)
+
+
+def _parse_date(value: str) -> datetime | None:
+    try:
+        return datetime.strptime(value, _DATE_FORMAT).replace(tzinfo=timezone.utc)
+    except ValueError:
+        return None
+
+
+def _get_partition(published_on: datetime | None) -> str:
+    return published_on.strftime("%Y-%m") if published_on else _UNKNOWN_PARTITION
+
+
+def _get_extraction_rows(arxiv_id: str, ext_data: ExtAuthorInfo | None) -> list[dict]:
+    if not ext_data or not ext_data.extractions:
+        return []
+
+    # the first extraction with the highest score, like match_data._get_best_extraction()
+    best = max(ext_data.extractions, key=lambda extraction: extraction.score)
+    return [{
+        "arxiv_id": arxiv_id,
+        "scheme_name": extraction.scheme_name,
+        "score": extraction.score,
+        "authors": len(extraction.authors),
+        "is_best": extraction is best
+    } for extraction in ext_data.extractions]
+
+
+def _get_author_rows(arxiv_id: str, matched_data: MatchedPaperData | None) -> tuple[list[dict], list[dict]]:
+    author_rows = []
+    affiliation_rows = []
+    if not matched_data:
+        return author_rows, affiliation_rows
+
+    for author_index, author in enumerate(matched_data.matched_authors):
+        author_rows.append({
+            "arxiv_id": arxiv_id,
+            "author_index": author_index,
+            "arxiv_name": author.arxiv_name,
+            "ext_name": author.ext_name,
+            "score": author.score
+        })
+        for affiliation in author.affiliations:
+            ror_org = ror_index.resolve(affiliation)
+            affiliation_rows.append({
+                "arxiv_id": arxiv_id,
+                "author_index": author_index,
+                "ext_name": affiliation.ext_name,
+                "ror_id": affiliation.ror_id,
+                "ror_name": ror_org.names[0] if ror_org and ror_org.names else None,
+                "countries": [location.country_name for location in ror_org.locations] if ror_org else [],
+                "score": affiliation.score
+            })
+
+    return author_rows, affiliation_rows
+
+
+def _get_paper_row(
+        arxiv_metadata: ArxivMetadata, published_on: datetime | None, ext_data: ExtAuthorInfo | None,
+        extraction_rows: list[dict], matched_data: MatchedPaperData | None, matched_authors: int
+) -> dict:
+    best = next((row for row in extraction_rows if row["is_best"]), None)
+    return {
+        "arxiv_id": arxiv_metadata.arxiv_id,
+        "version": arxiv_metadata.version,
+        "title": arxiv_metadata.title,
+        "doi": arxiv_metadata.doi,
+        "journal_ref": arxiv_metadata.journal_ref,
+        "categories": arxiv_metadata.categories,
+        "published_on": published_on,
+        "last_updated": _parse_date(arxiv_metadata.last_updated),
+        "arxiv_authors": len(arxiv_metadata.authors),
+        "ext_type": ext_data.ext_type if ext_data else None,
+        "best_scheme": best["scheme_name"] if best else None,
+        "best_score": best["score"] if best else None,
+        "matched_authors": matched_authors,
+        "ror_version": (matched_data.ror_version or None) if matched_data else None
+    }
+
+
+def _get_paper_rows(paper_dir: Path) -> tuple[str, dict[str, list[dict]]] | None:
+    # runs in the worker processes, which do the expensive part: reading and decoding the JSON files
+    if not (arxiv_metadata := util.read_json(paper_dir, util.ARXIV_METADATA_FILE)):
+        return None
+
+    arxiv_id = arxiv_metadata.arxiv_id
+    ext_data = util.read_json(paper_dir, util.EXTRACTED_DATA_FILE)
+    extraction_rows = _get_extraction_rows(arxiv_id, ext_data)
+    matched_data = util.read_json(paper_dir, util.MATCHED_DATA_FILE)
+    author_rows, affiliation_rows = _get_author_rows(arxiv_id, matched_data)
+    published_on = _parse_date(arxiv_metadata.published_on)
+    paper_row = _get_paper_row(arxiv_metadata, published_on, ext_data, extraction_rows, matched_data, len(author_rows))
+    return _get_partition(published_on), {
+        TABLE_PAPERS: [paper_row],
+        TABLE_AUTHORS: author_rows,
+        TABLE_AFFILIATIONS: affiliation_rows,
+        TABLE_EXTRACTIONS: extraction_rows
+    }
+
+
+def run(paper_dirs: list[Path]) -> None:
+    """
+    Export the metadata, extractions and matches of all papers into flat Parquet tables (papers, authors,
+    affiliations, extractions) in the export directory, partitioned by the month the papers were published in.
+    Replaces the previous export.
+    """
+    util.configure_logger(_logger)
+    util.clear_export()
+    export_dir = util.get_export_dir()
+
+    ror_version = ror_index.get_version()  # loads the index before the workers are forked, so they share it
+    writers = {table: _PartitionedTableWriter(export_dir / table, schema) for table, schema in _SCHEMAS.items()}
+    exported = 0
+    outdated_papers = 0
+    # the papers are consumed in order while the workers read the next ones, so only a few papers are in memory
+    with multiprocessing.Pool() as pool:
+        for paper_rows in pool.imap(_get_paper_rows, sorted(paper_dirs), chunksize=_PAPERS_PER_CHUNK):
+            if paper_rows is None:
+                continue
+
+            partition, rows_by_table = paper_rows
+            paper_ror_version = rows_by_table[TABLE_PAPERS][0]["ror_version"] or ""
+            if ror_version and rows_by_table[TABLE_AFFILIATIONS] and paper_ror_version != ror_version:
+                outdated_papers += 1
+
+            for table, rows in rows_by_table.items():
+                if rows:
+                    writers[table].add(partition, rows)
+
+            exported += 1
+
+    for writer in writers.values():
+        writer.close()
+
+    _logger.info("Exported %s of %s papers to '%s'.", exported, len(paper_dirs), export_dir)
+    ror_index.warn_outdated(outdated_papers)
@@ -6,6 +6,7 @@ from rapidfuzz.distance import Indel
 
 import threaded_run
 import util
+from PipelineManifest import STAGE_EXTRACT, STATUS_DONE, STATUS_EMPTY, STATUS_FAILED
 from definition.data.ArxivMetadata import ArxivMetadata
 from definition.data.Author import Author
 from definition.data.ExtAuthorData import ExtAuthorInfo, ExtResults
@@ -199,18 +200,22 @@ def _single_cmd_ext(ext_cmds: ExtCmdData, arxiv_metadata: ArxivMetadata) -> list
     return author_affs
 
 
-def _run_single_element(paper_dir: Path) -> None:
+def run_single_element(paper_dir: Path) -> None:
     util.configure_logger(_logger)
+    manifest = util.get_pipeline_manifest()
     if not (arxiv_metadata := util.read_json(paper_dir, util.ARXIV_METADATA_FILE)):
         _logger.error("Could not read arXiv metadata for '%s'. Skipping extraction", paper_dir.name)
+        manifest.set_status(paper_dir.name, STAGE_EXTRACT, STATUS_FAILED, "could not read arXiv metadata")
         return
 
     if util.file_exists(paper_dir, util.EXTRACTED_DATA_FILE):
         _logger.debug("Extracted data file already exists for '%s'. Skipping extraction.", paper_dir.name)
+        manifest.set_status(paper_dir.name, STAGE_EXTRACT, STATUS_DONE, reset_later_stages=False)
         return
 
     if not (ext_cmds := util.read_json(paper_dir, util.CMDS_FILE)) or len(ext_cmds.cmds) == 0:
         _logger.debug("'%s' does not have any extracted commands! Skipping extraction.", paper_dir.name)
+        manifest.set_status(paper_dir.name, STAGE_EXTRACT, STATUS_EMPTY, "no extracted commands")
         return
 
     if len(ext_cmds.cmds) == 1:
@@ -227,6 +232,9 @@ def _run_single_element(paper_dir: Path) -> None:
     if ext_results:
         ext_data = ExtAuthorInfo(ext_type, ext_results)
         util.write_obj_to_json(paper_dir, util.EXTRACTED_DATA_FILE, ext_data)
+        manifest.set_status(paper_dir.name, STAGE_EXTRACT, STATUS_DONE)
+    else:
+        manifest.set_status(paper_dir.name, STAGE_EXTRACT, STATUS_EMPTY, "no scheme extracted any authors")
 
 
 def run(paper_dirs: list[Path]) -> None:
@@ -234,4 +242,4 @@ def run(paper_dirs: list[Path]) -> None:
     Extract metadata related to the authors from the LaTeX commands we extracted before.
     We are looking for the name and the affiliations of the authors.
     """
-    threaded_run.run(paper_dirs, _run_single_element)
+    threaded_run.run(util.get_unfinished_paper_dirs(paper_dirs, STAGE_EXTRACT), run_single_element)
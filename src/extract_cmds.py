@@ -5,12 +5,20 @@ import regex
 
 import threaded_run
 import util
+from PipelineManifest import STAGE_CMDS, STATUS_DONE, STATUS_EMPTY
 from definition import latex
 from definition import reg_exp
 from definition.data.ExtCmdData import ExtCmdData, LatexCmd
 
 _logger: logging.Logger = logging.getLogger(__name__)
 
+# the arguments of a command are searched for at most this far, e.g. if its braces never close
+_MAX_CMD_BYTES = 64 * 1024
+_CMD_ARG_DELIMITERS = regex.compile(rb"[{}\[\]%]")
+_NEXT_CMD_ARG = regex.compile(rb"\s*[{\[]")
+# like latex.remove_comments(), \% is an escaped percent sign but \\% a line break followed by a comment
+_WHITESPACE_OR_COMMENTS = regex.compile(rb"(?:\s|(?<!(?<!\\)\\)%[^\n]*)*")
+
 
 def _is_empty_command(cmd: str) -> bool:
     if "{" not in cmd:
@@ -59,10 +67,16 @@ def _extract_authorship_from_tex(pattern: regex.Pattern[str], tex: str, envs=Non
     return cmds
 
 
-def _extract_authorship_cmds_from_tex(tex: str) -> list[LatexCmd]:
-    cmds = _extract_authorship_from_tex(reg_exp.AUTHORSHIP_ENV, tex)
-    cmds += _extract_authorship_from_tex(reg_exp.AUTHORSHIP, tex, envs=cmds)
-    return [LatexCmd(cmd["text"], latex.sanitize_latex_cmd(cmd["text"])) for cmd in cmds]
+def _extract_authorship_cmds_from_tex(texs: list[str]) -> list[LatexCmd]:
+    # all environments of a file come first, like when searching the whole file at once
+    env_cmds = []
+    cmds = []
+    for tex in texs:
+        tex_env_cmds = _extract_authorship_from_tex(reg_exp.AUTHORSHIP_ENV, tex)
+        env_cmds += tex_env_cmds
+        cmds += _extract_authorship_from_tex(reg_exp.AUTHORSHIP, tex, envs=tex_env_cmds)
+
+    return [LatexCmd(cmd["text"], latex.sanitize_latex_cmd(cmd["text"])) for cmd in env_cmds + cmds]
 
 
 def _extract_documentclass(tex: str) -> str:
@@ -73,41 +87,115 @@ def _extract_documentclass(tex: str) -> str:
     return m.group(1)[1:-1].strip()
 
 
-def _extract_authorship_cmds_from_files(paper_tex_dir: Path) -> ExtCmdData:
+def _find_line_start(content: bytes, pos: int) -> int:
+    return content.rfind(b"\n", 0, pos) + 1
+
+
+def _find_line_end(content: bytes, pos: int) -> int:
+    end = content.find(b"\n", pos)
+    return len(content) if end == -1 else end + 1
+
+
+def _find_cmd_end(content: bytes, pos: int) -> int:
+    # end of the arguments following a command name: groups of brackets and curly braces, separated by whitespace at
+    # most. like in the regex, escaped braces are counted as well. comments are skipped, they are removed before the
+    # regex runs.
+    depth = 0
+    bracket_depth = 0  # brackets only count outside of curly braces
+    end = min(len(content), pos + _MAX_CMD_BYTES)
+    while m := _CMD_ARG_DELIMITERS.search(content, pos, end):
+        pos = m.end()
+        char = m.group()
+        if char == b"%":
+            if content[pos - 2:pos - 1] != b"\\" or content[pos - 3:pos - 2] == b"\\":
+                pos = _find_line_end(content, pos)
+        elif char == b"{":
+            depth += 1
+        elif char == b"}":
+            depth -= 1
+        elif depth == 0:
+            bracket_depth += 1 if char == b"[" else -1
+
+        if depth <= 0 and bracket_depth <= 0 and not _NEXT_CMD_ARG.match(content, pos, end):
+            return pos
+
+    return end
+
+
+def _find_span_start(content: bytes, pos: int) -> int:
+    # start of the line before the one containing pos, the lookbehind of the regexes may look across the line break.
+    # blank and comment lines in between are skipped, latex.remove_comments() drops them.
+    start = _find_line_start(content, pos)
+    while start > 0:
+        start = _find_line_start(content, start - 1)
+        line = content[start:_find_line_end(content, start)].strip()
+        if line and not line.startswith(b"%"):
+            break
+
+    return start
+
+
+def _get_tex_spans(content: bytes) -> list[tuple[int, int]]:
+    # the parts of a tex file that may contain authorship commands or the documentclass. they consist of whole lines,
+    # so comments can be removed from them, overlapping parts are merged.
+    spans = []
+    for m in regex.finditer(reg_exp.AUTHORSHIP_TRIGGER_BYTES, content):
+        start = _find_span_start(content, m.start())
+        if m.group("env"):
+            # the environment ends on the line its content starts on, comments are removed before the regex runs
+            end = _find_line_end(content, _WHITESPACE_OR_COMMENTS.match(content, m.end()).end())
+        else:
+            end = _find_line_end(content, _find_cmd_end(content, m.end()))
+
+        if spans and start <= spans[-1][1]:
+            spans[-1] = (spans[-1][0], max(spans[-1][1], end))
+        else:
+            spans.append((start, end))
+
+    return spans
+
+
+def _extract_authorship_cmds_from_files(paper_dir: Path) -> ExtCmdData:
     cmds = []
     documentclasses = []
-    for tex_file in util.get_all_tex_files(paper_tex_dir):
-        tex = util.read(tex_file)
-        if tex == "%auto-ignore":
-            continue
+    for tex_file in util.get_all_tex_files(paper_dir):
+        # only the parts around authorship commands get decoded, files without any (generated tables, figures or
+        # arXiv's "%auto-ignore" placeholders) are skipped after a single scan of their bytes
+        with util.read_mapped(tex_file) as content:
+            texs = [latex.remove_comments(util.decode(content[start:end])) for start, end in _get_tex_spans(content)]
 
-        tex = latex.remove_comments(tex)
-        documentclass = _extract_documentclass(tex)
+        documentclass = next((documentclass for tex in texs if (documentclass := _extract_documentclass(tex))), "")
         if documentclass:
             documentclasses.append(documentclass)
 
-        cmds += _extract_authorship_cmds_from_tex(tex)
+        cmds += _extract_authorship_cmds_from_tex(texs)
 
     return ExtCmdData(documentclasses, cmds)
 
 
-def _run_single_element(paper_dir: Path) -> None:
+def run_single_element(paper_dir: Path) -> None:
     util.configure_logger(_logger)
+    manifest = util.get_pipeline_manifest()
     if util.file_exists(paper_dir, util.CMDS_FILE):
         _logger.debug("Commands file already exists for '%s'.", paper_dir.name)
+        manifest.set_status(paper_dir.name, STAGE_CMDS, STATUS_DONE, reset_later_stages=False)
         return
 
-    paper_tex_dir = util.get_paper_tex_dir_by_path(paper_dir)
-    if not (ext_cmds := _extract_authorship_cmds_from_files(paper_tex_dir)):
+    # the tex files are either in the tex directory or packed in an archive
+    if not (ext_cmds := _extract_authorship_cmds_from_files(paper_dir)):
         _logger.debug("No commands found in tex files of '%s'!", paper_dir.name)
+        manifest.set_status(paper_dir.name, STAGE_CMDS, STATUS_EMPTY, "no commands found")
         return
 
     if len(ext_cmds.cmds) > 0 or len(ext_cmds.documentclasses) > 0:
         util.write_obj_to_json(paper_dir, util.CMDS_FILE, ext_cmds)
+        manifest.set_status(paper_dir.name, STAGE_CMDS, STATUS_DONE)
+    else:
+        manifest.set_status(paper_dir.name, STAGE_CMDS, STATUS_EMPTY, "no commands found")
 
 
 def run(paper_dirs: list[Path]) -> None:
     """
     Extract LaTeX commands from TeX files that are known to be related to author definitions.
     """
-    threaded_run.run(paper_dirs, _run_single_element)
+    threaded_run.run(util.get_unfinished_paper_dirs(paper_dirs, STAGE_CMDS), run_single_element)
@@ -0,0 +1,22 @@
+import requests
+from requests.adapters import HTTPAdapter
+
+# (connect, read) timeouts in seconds. without a timeout a stalled connection blocks a download worker forever.
+DEFAULT_TIMEOUT = (10, 60)
+# number of hosts we keep a connection pool for (arxiv.org, export.arxiv.org, zenodo.org, ...)
+_POOLED_HOSTS = 4
+
+
+def create_session(pool_size: int) -> requests.Session:
+    """
+    Create a session that keeps up to pool_size connections per host alive, so consecutive requests reuse the
+    TCP and TLS connection instead of opening a new one each time. Use one session per process and share it between
+    all threads of that process.
+    """
+    session = requests.Session()
+    # pool_block=False: if more threads than pool_size request the same host at once, the additional connections
+    # get opened anyway and are just not kept alive afterward
+    adapter = HTTPAdapter(pool_connections=_POOLED_HOSTS, pool_maxsize=pool_size, pool_block=False)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
@@ -0,0 +1,94 @@
+import dataclasses
+import json
+import typing
+
+from definition.data.ArxivMetadata import ArxivMetadata
+from definition.data.Author import Author
+from definition.data.ExtAuthorData import ExtResults, ExtAuthorInfo
+from definition.data.ExtCmdData import LatexCmd, ExtCmdData
+from definition.data.MatchedAuthorData import MatchedAffiliationInfo, MatchedAuthorInfo, MatchedPaperData
+from definition.data.RorDataset import ResearchLocation, ResearchOrganization, RorDataset
+from definition.data.RorManifest import RorManifest
+
+# every object of a registered dataclass is stored as its fields plus the class name under this key. in contrast to
+# jsonpickle's "py/object" the name is not a module path, so moving a class does not break existing files.
+_TYPE_KEY = "@type"
+_VERSION = 1
+# files written by the codec start with this header, everything else is read as jsonpickle
+_HEADER = '{"@codec":'
+_SEPARATORS = (",", ":")
+
+_types_by_name: dict[str, type] = {}
+_names_by_type: dict[type, str] = {}
+
+
+def register(*classes: type) -> None:
+    """
+    Make dataclasses known to the codec. Class names have to be unique among all registered classes.
+    """
+    for cls in classes:
+        if not dataclasses.is_dataclass(cls):
+            raise TypeError(f"{cls.__name__} is not a dataclass.")
+
+        registered = _types_by_name.setdefault(cls.__name__, cls)
+        if registered is not cls:
+            raise ValueError(f"Another class named {cls.__name__} is already registered.")
+
+        _names_by_type[cls] = cls.__name__
+
+
+def _encode_object(obj: typing.Any) -> dict:
+    # only called by the json encoder for objects it can not encode itself
+    name = _names_by_type.get(type(obj))
+    if name is None:
+        raise TypeError(f"Objects of type {type(obj).__name__} are not supported.")
+
+    encoded = {_TYPE_KEY: name}
+    encoded.update(obj.__dict__)
+    return encoded
+
+
+def _decode_object(encoded: dict) -> typing.Any:
+    name = encoded.get(_TYPE_KEY)
+    if name is None:
+        return encoded
+
+    cls = _types_by_name.get(name)
+    if cls is None:
+        raise ValueError(f"Unknown type '{name}'.")
+
+    del encoded[_TYPE_KEY]
+    try:
+        return cls(**encoded)
+    except TypeError:
+        # the fields of an older version of the class, restore them as they are like jsonpickle does
+        obj = cls.__new__(cls)
+        obj.__dict__.update(encoded)
+        return obj
+
+
+def encode(obj: typing.Any) -> str:
+    """
+    Serialize obj to JSON. Besides the JSON types, obj may contain objects of registered dataclasses. Raises a
+    TypeError for anything else, e.g. sets.
+    """
+    # check_circular is only needed to turn a recursion error into a ValueError, dataclasses here never have cycles
+    return json.dumps(
+        {"@codec": _VERSION, "data": obj}, default=_encode_object, ensure_ascii=False, check_circular=False,
+        separators=_SEPARATORS
+    )
+
+
+def is_encoded(content: str) -> bool:
+    return content.startswith(_HEADER)
+
+
+def decode(content: str) -> typing.Any:
+    envelope = json.loads(content, object_hook=_decode_object)
+    return envelope["data"]
+
+
+register(
+    ArxivMetadata, Author, ExtResults, ExtAuthorInfo, LatexCmd, ExtCmdData, MatchedAffiliationInfo, MatchedAuthorInfo,
+    MatchedPaperData, ResearchLocation, ResearchOrganization, RorDataset, RorManifest
+)
@@ -0,0 +1,294 @@
+import contextlib
+import itertools
+import json
+import logging
+import multiprocessing
+import multiprocessing.pool
+import re
+import sqlite3
+import typing
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+
+import util
+from definition.data.ArxivMetadata import ArxivMetadata
+from definition.data.Author import Author
+
+ALL_CATEGORIES = "all"
+# size of the byte ranges handed to the scanning processes. small enough to hand out the first papers quickly, big
+# enough to keep the overhead of passing the ranges and results between processes low.
+_RANGE_SIZE = 32 * 1024 * 1024
+# number of lines read per task when the offsets of the papers are known from the index
+_OFFSETS_PER_TASK = 5000
+# number of finished tasks that may wait for the downloader per process. limits memory when the download is slower.
+_PENDING_TASKS_PER_PROCESS = 2
+_INDEX_SUFFIX = ".idx"
+# JSON strings can not contain unescaped quotes, so this only matches the "categories" key and never some text inside
+# the abstract or title.
+_CATEGORIES_REGEX = re.compile(rb'"categories":\s*"([^"]*)"')
+_ID_REGEX = re.compile(rb'"id":\s*"([^"]*)"')
+
+_logger: logging.Logger = logging.getLogger(__name__)
+
+
+def _replace_month_abbr(date_str: str) -> str:
+    months = {
+        "Jan": "01", "Feb": "02", "Mar": "03", "Apr": "04", "May": "05", "Jun": "06",
+        "Jul": "07", "Aug": "08", "Sep": "09", "Oct": "10", "Nov": "11", "Dec": "12",
+    }
+    # "%d %b %Y %H:%M:%S %Z"
+    parts = date_str.split(" ")
+    parts[1] = months[parts[1]]
+    return " ".join(parts)
+
+
+def _get_kaggle_version_data(metadata: dict) -> tuple[str, str]:
+    paper_versions = metadata.get("versions", [{"version": "v1", "created": metadata.get("update_date", "")}])
+    paper_version = paper_versions[-1].get("version", "")  # get the latest version
+    published_on = paper_versions[0].get("created", "")  # get the original release date
+    # DATETIME IS LOCALE DEPENDENT!!! DATETIME DOES NOT SUPPORT USING OTHER LOCALES!!!
+    # We could set the locale with locale.setlocale but that is platform dependent and discouraged.
+    # Instead, we drop the day name abbreviation and transform the month name abbreviation to a number.
+    # We need to replace the month name abbreviation because the day of month is not zero-padded so the month isn't
+    # always at the same position.
+    # transform "%a, %d %b %Y %H:%M:%S %Z" ("Mon, 2 Apr 2007 19:18:42 GMT")
+    # to        "%d %m %Y %H:%M:%S %Z"     ("2 04 2007 19:18:42 GMT")
+    # to        "%Y-%m-%dT%H:%M:%SZ"       ("2007-04-02T19:18:42Z") -> ArXiv format
+    published_on = _replace_month_abbr(published_on[5:])  # remove "Mon, " and the month abbr
+    dt = datetime.strptime(published_on, "%d %m %Y %H:%M:%S %Z")
+    published_on = dt.strftime("%Y-%m-%dT%H:%M:%SZ")
+    return paper_version, published_on
+
+
+def _get_kaggle_author_list(metadata: dict) -> list[Author]:
+    author_list = metadata.get("authors_parsed", [])
+    authors = []
+    for author in author_list:
+        # "The list for each author will have at least three elements for
+        # keyname, firstname(s) and suffix. The keyname will always have content
+        # but the other strings might be empty strings if there is no firstname
+        # or suffix. Any additional elements after the first three are affiliations,
+        # there may be zero or more."
+        # -> https://github.com/mattbierbaum/arxiv-public-datasets/blob/master/arxiv_public_data/authors.py#L66
+        keyname = author[0].strip()
+        given_name = author[1].strip() if len(author) > 1 else ""
+        suffix = author[2].strip() if len(author) > 2 else ""  # like Jr., Sr. or roman numbers
+        affiliations = []
+        for affiliation in author[3:]:
+            affiliations.append(affiliation)
+
+        name = " ".join([given_name, keyname, suffix])
+        authors.append(Author(name, affiliations))
+
+    return authors
+
+
+def _get_kaggle_metadata(metadata: dict) -> ArxivMetadata:
+    arxiv_id = metadata["id"]
+    title = metadata.get("title", "")
+    comment = metadata.get("comments", "")
+    journal_ref = metadata.get("journal-ref", "")
+    doi = metadata.get("doi", "")
+    categories = metadata.get("categories", "").split(" ")  # the arXiv dataset already filters any non-arXiv categories
+
+    # format: "%Y-%m-%d" (kaggle) -> %Y-%m-%dT%H:%M:%SZ" (arXiv)
+    last_updated = metadata.get("update_date", "")
+    if last_updated:
+        last_updated += "T11:11:11Z"  # set some time to adhere to arxiv format
+
+    version, published_on = _get_kaggle_version_data(metadata)
+    authors = _get_kaggle_author_list(metadata)
+    return ArxivMetadata(
+        arxiv_id, version, title, comment, journal_ref, doi, categories, last_updated, published_on, authors
+    )
+
+
+def _matches_category(arxiv_category: str, categories: typing.Iterable) -> bool:
+    return arxiv_category == ALL_CATEGORIES or arxiv_category in categories
+
+
+def _may_match_category(line: bytes, arxiv_category: bytes) -> bool:
+    # checking the raw line is way cheaper than decoding the JSON and parsing dates and authors for every paper
+    m = _CATEGORIES_REGEX.search(line)
+    if not m:
+        return True  # could not find the field, let the full decode decide
+
+    return arxiv_category in m.group(1).split(b" ")
+
+
+def _scan_range(kaggle_path: Path, start: int, end: int, arxiv_category: str) -> list[ArxivMetadata]:
+    papers = []
+    category_bytes = arxiv_category.encode()
+    with open(kaggle_path, "rb") as f:
+        f.seek(start)
+        position = start
+        # each line is a JSON object, 'jsonlines' format
+        for line in f:
+            position += len(line)
+            if arxiv_category == ALL_CATEGORIES or _may_match_category(line, category_bytes):
+                paper_metadata = _get_kaggle_metadata(json.loads(line))
+                if _matches_category(arxiv_category, paper_metadata.categories):
+                    papers.append(paper_metadata)
+
+            if position >= end:
+                break
+
+    return papers
+
+
+def _read_offsets(kaggle_path: Path, offsets: list[int]) -> list[ArxivMetadata]:
+    papers = []
+    with open(kaggle_path, "rb") as f:
+        for offset in offsets:
+            f.seek(offset)
+            papers.append(_get_kaggle_metadata(json.loads(f.readline())))
+
+    return papers
+
+
+def _get_byte_ranges(kaggle_path: Path) -> typing.Iterator[tuple[int, int]]:
+    # split the file into ranges of roughly _RANGE_SIZE bytes that start and end at line breaks
+    file_size = kaggle_path.stat().st_size
+    with open(kaggle_path, "rb") as f:
+        start = 0
+        while start < file_size:
+            f.seek(min(start + _RANGE_SIZE, file_size))
+            f.readline()  # move to the start of the next line
+            end = f.tell()
+            yield start, end
+            start = end
+
+
+def _index_range(kaggle_path: Path, start: int, end: int) -> list[tuple[str, int, str]]:
+    entries = []
+    with open(kaggle_path, "rb") as f:
+        f.seek(start)
+        position = start
+        for line in f:
+            m_id = _ID_REGEX.search(line)
+            m_categories = _CATEGORIES_REGEX.search(line)
+            if m_id and m_categories:
+                arxiv_id = m_id.group(1).decode()
+                if "\\" in arxiv_id:
+                    arxiv_id = json.loads(f'"{arxiv_id}"')  # only decode as JSON string if there are escape sequences
+
+                entries.append((arxiv_id, position, m_categories.group(1).decode()))
+
+            position += len(line)
+            if position >= end:
+                break
+
+    return entries
+
+
+def _run_tasks(
+        pool: multiprocessing.pool.Pool, tasks: typing.Iterator[tuple[typing.Callable, tuple]], processes: int
+) -> typing.Iterator:
+    # keep a limited number of tasks running ahead and return the results in order of the tasks
+    pending = deque()
+    for task in tasks:
+        pending.append(pool.apply_async(*task))
+        if len(pending) >= processes * _PENDING_TASKS_PER_PROCESS:
+            break
+
+    while pending:
+        results = pending.popleft().get()
+        if (task := next(tasks, None)) is not None:
+            pending.append(pool.apply_async(*task))
+
+        yield results
+
+
+def _get_index_path(kaggle_path: Path) -> Path:
+    return kaggle_path.with_name(kaggle_path.name + _INDEX_SUFFIX)
+
+
+def _is_index_valid(index_path: Path, kaggle_path: Path) -> bool:
+    if not index_path.is_file():
+        return False
+
+    stat = kaggle_path.stat()
+    try:
+        with contextlib.closing(sqlite3.connect(index_path)) as con:
+            snapshot = con.execute("SELECT size, mtime_ns FROM snapshot").fetchone()
+    except sqlite3.DatabaseError:
+        return False
+
+    # a new snapshot of the dataset replaces the file, so size and modification time identify the indexed version
+    return snapshot == (stat.st_size, stat.st_mtime_ns)
+
+
+def _build_index(pool: multiprocessing.pool.Pool, processes: int, kaggle_path: Path, index_path: Path) -> None:
+    _logger.info("Building index of the Kaggle dataset. This only happens once per dataset version.")
+    # build into a temporary file first, so an interrupted build never gets mistaken for a complete index
+    tmp_index_path = index_path.with_name(index_path.name + ".tmp")
+    util.delete_file(tmp_index_path)
+    stat = kaggle_path.stat()
+    with contextlib.closing(sqlite3.connect(tmp_index_path)) as con:
+        con.execute("CREATE TABLE papers (arxiv_id TEXT PRIMARY KEY, offset INTEGER)")
+        con.execute("CREATE TABLE categories (category TEXT, arxiv_id TEXT, offset INTEGER)")
+        con.execute("CREATE TABLE snapshot (size INTEGER, mtime_ns INTEGER)")
+        tasks = ((_index_range, (kaggle_path, start, end)) for start, end in _get_byte_ranges(kaggle_path))
+        for entries in _run_tasks(pool, tasks, processes):
+            con.executemany("INSERT OR REPLACE INTO papers VALUES (?, ?)", ((e[0], e[1]) for e in entries))
+            con.executemany(
+                "INSERT INTO categories VALUES (?, ?, ?)",
+                ((category, e[0], e[1]) for e in entries for category in e[2].split(" "))
+            )
+
+        con.execute("CREATE INDEX categories_category ON categories (category)")
+        con.execute("INSERT INTO snapshot VALUES (?, ?)", (stat.st_size, stat.st_mtime_ns))
+        con.commit()
+
+    tmp_index_path.replace(index_path)
+    _logger.info("Finished building the index of the Kaggle dataset.")
+
+
+def _get_indexed_offsets(
+        pool: multiprocessing.pool.Pool, processes: int, kaggle_path: Path, arxiv_category: str,
+        exclude_ids: typing.Collection[str]
+) -> list[int]:
+    index_path = _get_index_path(kaggle_path)
+    if not _is_index_valid(index_path, kaggle_path):
+        util.delete_file(index_path)
+        _build_index(pool, processes, kaggle_path, index_path)
+
+    with contextlib.closing(sqlite3.connect(index_path)) as con:
+        if arxiv_category == ALL_CATEGORIES:
+            rows = con.execute("SELECT arxiv_id, offset FROM papers")
+        else:
+            rows = con.execute("SELECT arxiv_id, offset FROM categories WHERE category = ?", (arxiv_category,))
+
+        offsets = [offset for arxiv_id, offset in rows if arxiv_id not in exclude_ids]
+
+    offsets.sort()  # read the file front to back
+    return offsets
+
+
+def scan(
+        kaggle_path: Path, arxiv_category: str, exclude_ids: typing.Collection[str] = frozenset(),
+        processes=multiprocessing.cpu_count()
+) -> typing.Iterator[ArxivMetadata]:
+    """
+    Read the metadata of all papers of a category from the Kaggle dataset, skipping the papers in exclude_ids.
+    An index of the byte offsets per category and arXiv ID gets stored next to the dataset on the first run, later
+    runs only read the lines of the requested papers. If the index can not be used, the file is split into line
+    aligned byte ranges instead. Either way the lines are parsed by multiple processes and papers are yielded in the
+    order of the file.
+    """
+    # spawn instead of fork: the caller might already run download threads and forking a process with threads can
+    # leave locks held by those threads locked forever in the child.
+    with multiprocessing.get_context("spawn").Pool(processes=processes) as pool:
+        try:
+            offsets = _get_indexed_offsets(pool, processes, kaggle_path, arxiv_category, exclude_ids)
+            tasks = ((_read_offsets, (kaggle_path, batch)) for batch in itertools.batched(offsets, _OFFSETS_PER_TASK))
+        except (OSError, sqlite3.Error):
+            _logger.warning("Could not use the index of the Kaggle dataset! Scanning the whole file instead.")
+            tasks = (
+                (_scan_range, (kaggle_path, start, end, arxiv_category))
+                for start, end in _get_byte_ranges(kaggle_path)
+            )
+
+        for papers in _run_tasks(pool, tasks, processes):
+            yield from (paper for paper in papers if paper.arxiv_id not in exclude_ids)
@@ -1,30 +1,36 @@
 import argparse
 import logging
 import multiprocessing
+import multiprocessing.queues
+import typing
 from pathlib import Path
 
-import bs4
-import requests
-
 import download
+import export_tables
 import extract_author_aff
 import extract_cmds
+import http_session
 import match_data
 import ror_dl
 import threaded_log
+import threaded_run
 import util
 from ArgRange import ArgRange
-from ArxivAPI import ArxivAPI
+from ArtifactCompressor import COMPRESSIONS, COMPRESSION_NONE
+from ArxivAPI import ArxivAPI, create_src_rate_limiter
+from HttpCache import DEFAULT_TTL_S
+from PipelineManifest import STAGE_DOWNLOAD, STAGE_CMDS, STAGE_EXTRACT, STATUS_DONE
+from TokenBucket import TokenBucket
+from definition.data.ArxivMetadata import ArxivMetadata
 
 _logger: logging.Logger = logging.getLogger(__name__)
 
 
-def _query_arxiv_api(arxiv_api: ArxivAPI, args: argparse.Namespace) -> list[bs4.Tag]:
+def _query_arxiv_api(arxiv_api: ArxivAPI, args: argparse.Namespace) -> typing.Iterator[ArxivMetadata]:
     logger = logging.getLogger(__name__)
     logger.info("Sending ArXiv query... ")
-    feed_entries = arxiv_api.query(args.category, args.max_results, args.chunk_size)
-    logger.info("Received %s of %s requested entries.", len(feed_entries), args.max_results)
-    return feed_entries
+    # the pages of the query are requested lazily while the papers of the previous pages are downloaded
+    return arxiv_api.query(args.category, args.max_results, args.chunk_size)
 
 
 # There are quite a few dataset for research organizations:
@@ -36,29 +42,47 @@ def _query_arxiv_api(arxiv_api: ArxivAPI, args: argparse.Namespace) -> list[bs4.
 # However, the Research Organization Registry (ROR) seems to be the most extensive by quite some margin.
 # Source: https://ror.org/registry/
 # Data URL: https://zenodo.org/records/14188848
-def _download_ror_dataset(logging_queue: multiprocessing.Queue) -> None:
+def _download_ror_dataset(args: argparse.Namespace, logging_queue: multiprocessing.Queue) -> None:
     threaded_log.configure_process_logger(logging_queue)
-    ror_dl.prepare_dataset()
+    ror_dl.prepare_dataset(_get_timeout(args), _get_cache_ttl(args))
 
 
-def _download_arxiv(args: argparse.Namespace, logging_queue: multiprocessing.Queue) -> None:
+def _download_arxiv(
+        args: argparse.Namespace, logging_queue: multiprocessing.Queue, rate_limiter: TokenBucket,
+        paper_queue: multiprocessing.queues.Queue | None = None
+) -> None:
     threaded_log.configure_process_logger(logging_queue)
     logger = logging.getLogger(__name__)
-    arxiv_api = ArxivAPI()
+    arxiv_api = ArxivAPI(rate_limiter, args.download_workers, _get_timeout(args), _get_cache_ttl(args))
     if not args.kaggle_path:
         logger.info("Running download via ArXiv API.")
-        feed_entries = _query_arxiv_api(arxiv_api, args)
-        download.run_api(arxiv_api, feed_entries)
+        papers = _query_arxiv_api(arxiv_api, args)
+        download.run_api(arxiv_api, papers, args.download_workers, paper_queue, args.pack_sources)
     else:
         logger.info("Running download via Kaggle import.")
         kaggle_path = Path(args.kaggle_path)
-        download.run_kaggle(arxiv_api, kaggle_path, args.category)
+        download.run_kaggle(
+            arxiv_api, kaggle_path, args.category, args.download_workers, paper_queue, args.pack_sources
+        )
+
+
+def _create_download_processes(
+        args: argparse.Namespace, log_queue: multiprocessing.Queue,
+        paper_queue: multiprocessing.queues.Queue | None = None
+) -> tuple[multiprocessing.Process, multiprocessing.Process]:
+    # the rate limiter has to be created here and passed to the process, so every download process shares it
+    rate_limiter = create_src_rate_limiter()
+    p_ror = multiprocessing.Process(target=_download_ror_dataset, args=[args, log_queue], daemon=True)
+    # not a daemon as the Kaggle import starts its own processes, which daemonic processes are not allowed to do
+    p_arxiv = multiprocessing.Process(
+        target=_download_arxiv, args=[args, log_queue, rate_limiter, paper_queue], daemon=False
+    )
+    return p_ror, p_arxiv
 
 
 def _run_downloads(args: argparse.Namespace) -> None:
     log_queue = multiprocessing.Queue()
-    p_ror = multiprocessing.Process(target=_download_ror_dataset, args=[log_queue], daemon=True)
-    p_arxiv = multiprocessing.Process(target=_download_arxiv, args=[args, log_queue], daemon=True)
+    p_ror, p_arxiv = _create_download_processes(args, log_queue)
 
     logging_thread = threaded_log.start_logging_thread(log_queue)
     p_ror.start()
@@ -71,20 +95,69 @@ def _run_downloads(args: argparse.Namespace) -> None:
     _logger.info("Finished all downloads!")
 
 
+def _extract_paper(paper_dir: Path) -> None:
+    extract_cmds.run_single_element(paper_dir)
+    extract_author_aff.run_single_element(paper_dir)
+
+
+# extracting commands and affiliations only depends on the files of a single paper. instead of waiting for all
+# downloads, the download process puts each downloaded paper into a queue which the extraction workers consume. the
+# CPU-heavy extraction then runs while the download waits for the rate limit. matching needs the affiliations of all
+# papers and the ROR dataset, so it still runs after everything else finished.
+def _run_pipelined(args: argparse.Namespace) -> None:
+    log_queue = multiprocessing.Queue()
+    paper_queue = multiprocessing.Queue()
+    p_ror, p_arxiv = _create_download_processes(args, log_queue, paper_queue)
+
+    logging_thread = threaded_log.start_logging_thread(log_queue)
+    p_ror.start()
+
+    # papers with TeX files on disk are skipped by the download, so the ones that still need an extraction are queued
+    # here. the download process only starts afterward, otherwise a paper could be queued twice when its download
+    # finishes during this loop.
+    manifest = util.load_pipeline_manifest()
+    downloaded = manifest.get_papers(STAGE_DOWNLOAD, (STATUS_DONE,))
+    extracted = manifest.get_finished_papers(STAGE_CMDS) & manifest.get_finished_papers(STAGE_EXTRACT)
+    for paper in downloaded - extracted:
+        paper_queue.put(util.get_paper_path(paper))
+
+    p_arxiv.start()
+    # the downloads are started first, forking a process while the threads of the pool are running may deadlock it.
+    # the pool is kept for matching, so it does not have to start new workers.
+    with threaded_run.worker_pool(log_queue):
+        feeder = threaded_run.start_workers(paper_queue, _extract_paper)
+        p_arxiv.join()
+        _logger.info("Finished arXiv downloads! Waiting for extractions to finish...")
+        threaded_run.stop_workers(paper_queue, feeder)
+        p_ror.join()
+        _logger.info("Finished extracting author affiliations! Matching data...")
+        match_data.run(util.get_paper_dirs())
+
+    log_queue.put(None)
+    logging_thread.join()
+    _logger.info("Done!")
+
+
 def _perform_requested_actions(args: argparse.Namespace) -> None:
     _perform_clear_actions(args)
-    if args.mode == "download" or args.mode == "all":
+    if args.mode == "all":
+        _run_pipelined(args)
+    elif args.mode == "download":
         _run_downloads(args)
-
-    if args.mode == "extract" or args.mode == "all":
+    elif args.mode == "extract":
         paper_dirs = util.get_paper_dirs()
-        _logger.info("Extracting commands...")
-        extract_cmds.run(paper_dirs)
-        _logger.info("Finished extracting commands! Extracting author affiliations...")
-        extract_author_aff.run(paper_dirs)
-        _logger.info("Finished extracting author affiliations! Matching data...")
-        match_data.run(paper_dirs)
+        # all stages share the workers of one pool
+        with threaded_run.worker_pool():
+            _logger.info("Extracting commands...")
+            extract_cmds.run(paper_dirs)
+            _logger.info("Finished extracting commands! Extracting author affiliations...")
+            extract_author_aff.run(paper_dirs)
+            _logger.info("Finished extracting author affiliations! Matching data...")
+            match_data.run(paper_dirs)
         _logger.info("Done!")
+    elif args.mode == "export":
+        _logger.info("Exporting tables...")
+        export_tables.run(util.get_paper_dirs())
 
 
 def _perform_clear_actions(args: argparse.Namespace) -> None:
@@ -105,9 +178,9 @@ def _build_arg_parser() -> argparse.ArgumentParser:
     arg_parser.add_argument(
         "mode",
         action="store",
-        choices=["download", "extract", "all"],
+        choices=["download", "extract", "all", "export"],
         default="all",
-        help="Choose whether to download papers only, extract LaTeX commands used for author and affiliation definitions, or both. Default: 'all'.",
+        help="Choose whether to download papers only, extract LaTeX commands used for author and affiliation definitions, or both. 'export' writes the results of all papers into Parquet tables in data/export. Default: 'all'.",
         metavar="MODE"
     )
     arg_parser.add_argument(
@@ -138,6 +211,36 @@ def _build_arg_parser() -> argparse.ArgumentParser:
         min=10,
         max=1000
     )
+    arg_parser.add_argument(
+        "-w", "--download-workers",
+        action=ArgRange,
+        default=4,
+        dest="download_workers",
+        help="Number of source files to download concurrently. The arXiv rate limit applies to all of them together. Has to be between 1 and 16 (inclusive). Default: 4.",
+        metavar="W",
+        min=1,
+        max=16
+    )
+    arg_parser.add_argument(
+        "-t", "--timeout",
+        action=ArgRange,
+        default=http_session.DEFAULT_TIMEOUT[1],
+        dest="timeout",
+        help=f"Seconds to wait for a server response before a request is considered failed. Has to be between 5 and 600 (inclusive). Default: {http_session.DEFAULT_TIMEOUT[1]}.",
+        metavar="SEC",
+        min=5,
+        max=600
+    )
+    arg_parser.add_argument(
+        "--cache-ttl",
+        action=ArgRange,
+        default=DEFAULT_TTL_S // 3600,
+        dest="cache_ttl",
+        help=f"Hours a cached API response is used without asking the server whether it changed. Has to be between 0 and 168 (inclusive). Default: {DEFAULT_TTL_S // 3600}.",
+        metavar="H",
+        min=0,
+        max=168
+    )
     arg_parser.add_argument(
         "-k", "--kaggle",
         action="store",
@@ -145,6 +248,39 @@ def _build_arg_parser() -> argparse.ArgumentParser:
         help="The path to the Kaggle arXiv dataset file. This will use the Kaggle file instead of the arXiv API.",
         metavar="PATH"
     )
+    arg_parser.add_argument(
+        "--pack-sources",
+        action="store_true",
+        dest="pack_sources",
+        help="Store the LaTeX files of each downloaded paper in a single tex.zip instead of a tex directory. Saves disk space and file system entries. Both formats can be mixed."
+    )
+    arg_parser.add_argument(
+        "--storage",
+        action="store",
+        choices=[util.STORAGE_FILES, util.STORAGE_SQLITE],
+        default=None,
+        dest="storage",
+        help=f"Where to keep the metadata and results of each paper: one JSON file per result in the paper directory ('files') or a single SQLite database for all papers ('sqlite'). Use scripts/migrate_storage.py to move existing data into the database. The choice is kept for later runs and the scripts. Default: the storage of the previous run, '{util.STORAGE_FILES}' for new data.",
+        metavar="STORAGE"
+    )
+    arg_parser.add_argument(
+        "--fsync",
+        action="store",
+        choices=[util.FSYNC_NONE, util.FSYNC_BATCH, util.FSYNC_ALWAYS],
+        default=None,
+        dest="fsync",
+        help=f"Files are always written to a temporary file first and then replace the old file, so killed processes do not leave truncated files behind. Additionally, flush them to the disk to survive power losses: never ('none'), every 200 files per process ('batch') or each file ('always'). Default: the value of the environment variable AFFILEXT_FSYNC if set, otherwise '{util.FSYNC_NONE}'.",
+        metavar="MODE"
+    )
+    arg_parser.add_argument(
+        "--compression",
+        action="store",
+        choices=list(COMPRESSIONS),
+        default=None,
+        dest="compression",
+        help=f"Compress the metadata and results of each paper when using files storage: not at all ('none'), with gzip ('gzip') or with zstd ('zstd'). zstd uses a dictionary trained on existing results if there is one, see scripts/compress_artifacts.py, which also converts existing files. Files of different compressions can be mixed. Default: the value of the environment variable AFFILEXT_COMPRESSION if set, otherwise '{COMPRESSION_NONE}'.",
+        metavar="COMPRESSION"
+    )
     arg_parser.add_argument(
         "--clear-cache",
         action="store_true",
@@ -166,6 +302,14 @@ def _get_cl_args() -> argparse.Namespace:
     return arg_parser.parse_args()
 
 
+def _get_timeout(args: argparse.Namespace) -> tuple[float, float]:
+    return http_session.DEFAULT_TIMEOUT[0], args.timeout
+
+
+def _get_cache_ttl(args: argparse.Namespace) -> float:
+    return args.cache_ttl * 3600
+
+
 def _verify_kaggle_path(kaggle_path: str) -> bool:
     if not kaggle_path:
         return False
@@ -181,7 +325,9 @@ def _verify_category(args: argparse.Namespace) -> bool:
 
     # do not use export.arxiv.org as that will return 200 even if the category does not exist
     url = f"https://arxiv.org/list/{category}/recent"
-    response = requests.head(url)
+    with http_session.create_session(1) as session:
+        response = session.head(url, timeout=_get_timeout(args))
+
     _logger.debug("Categoy verification status code: %s", response.status_code)
     return response.status_code == 200
 
@@ -198,6 +344,16 @@ def main():
         return
 
     _logger.debug("Running download script with args: %s", args)
+    # set before any worker process is started, the workers inherit it
+    if args.storage:  # otherwise the storage of the previous run or AFFILEXT_STORAGE is kept
+        util.set_storage(args.storage)
+
+    if args.fsync:  # otherwise AFFILEXT_FSYNC or the default is kept
+        util.set_fsync(args.fsync)
+
+    if args.compression:  # otherwise AFFILEXT_COMPRESSION or the default is kept
+        util.set_compression(args.compression)
+
     _perform_requested_actions(args)
 
 
@@ -8,6 +8,7 @@ from rapidfuzz import process, fuzz, utils
 import ror_dl
 import threaded_run
 import util
+from PipelineManifest import STAGE_MATCH, STATUS_DONE, STATUS_EMPTY, STATUS_FAILED
 from definition.data.Author import Author
 from definition.data.ExtAuthorData import ExtResults
 from definition.data.MatchedAuthorData import MatchedPaperData, MatchedAffiliationInfo, MatchedAuthorInfo
@@ -19,29 +20,28 @@ _TOP_MATCHES_LIMIT = 10
 _logger: logging.Logger = logging.getLogger(__name__)
 
 
-def _get_matched_affiliation_infos(matched_author: dict, ror_orgs_dict: dict) -> list[MatchedAffiliationInfo]:
+def _get_matched_affiliation_infos(matched_author: dict) -> list[MatchedAffiliationInfo]:
     aff_matches: list[dict] = matched_author["aff_matches"]
     matched_affiliation_infos = []
     for aff_match in aff_matches:
         ext_name = aff_match["ext_name"]
         ror_id = aff_match["ror_id"]
-        ror_org = ror_orgs_dict[ror_id]
         score = aff_match["score"]
         matched_affiliation_infos.append(
-            MatchedAffiliationInfo(ext_name, ror_org, score)
+            MatchedAffiliationInfo(ext_name, ror_id, score)
         )
 
     return matched_affiliation_infos
 
 
-def _get_matched_author_infos(matching_data: dict, ror_orgs_dict: dict) -> list[MatchedAuthorInfo]:
+def _get_matched_author_infos(matching_data: dict) -> list[MatchedAuthorInfo]:
     matched_author_infos = []
     for matched_author in matching_data["matched_authors"]:
         name_match = matched_author["name_match"]
         arxiv_name = name_match["arxiv_name"]
         ext_name = name_match["ext_name"]
         score = name_match["score"]
-        matched_affiliation_infos = _get_matched_affiliation_infos(matched_author, ror_orgs_dict)
+        matched_affiliation_infos = _get_matched_affiliation_infos(matched_author)
         matched_author_infos.append(
             MatchedAuthorInfo(arxiv_name, ext_name, score, matched_affiliation_infos)
         )
@@ -49,12 +49,12 @@ def _get_matched_author_infos(matching_data: dict, ror_orgs_dict: dict) -> list[
     return matched_author_infos
 
 
-def _get_matched_paper_data(matching_data: dict, ror_orgs_dict: dict) -> MatchedPaperData:
-    matched_authors = _get_matched_author_infos(matching_data, ror_orgs_dict)
-    return MatchedPaperData(matched_authors)
+def _get_matched_paper_data(matching_data: dict, ror_version: str) -> MatchedPaperData:
+    matched_authors = _get_matched_author_infos(matching_data)
+    return MatchedPaperData(matched_authors, ror_version)
 
 
-def _resolve_ror_id(matching_data: dict, args: tuple) -> None:
+def _write_matched_data(matching_data: dict, args: tuple) -> None:
     # matching_data = {
     #   "paper_dir": Path,
     #   "matched_authors": [
@@ -74,24 +74,17 @@ def _resolve_ror_id(matching_data: dict, args: tuple) -> None:
     #       }, ...
     #   ]
     # }
-    ror_orgs_dict: dict = args[0]
+    # only the ROR IDs are stored, ror_index resolves them to the organizations when needed
+    ror_version: str = args[0]
     paper_dir = matching_data.get("paper_dir", None)
     if paper_dir is None:
         return
 
-    matched_paper_data = _get_matched_paper_data(matching_data, ror_orgs_dict)
+    matched_paper_data = _get_matched_paper_data(matching_data, ror_version)
     if matched_paper_data:
         paper_dir = typing.cast(Path, paper_dir)  # paper_dir is a path and not None (IDE complains otherwise)
         util.write_obj_to_json(paper_dir, util.MATCHED_DATA_FILE, matched_paper_data)
-
-
-def _process_ror_orgs_to_dict(ror_dataset: RorDataset) -> dict:
-    ror_dict = {}
-    for ror_org in ror_dataset.data:
-        # use the ROR-ID as key and pass the object as value
-        ror_dict[ror_org.ror_id] = ror_org
-
-    return ror_dict
+        util.get_pipeline_manifest().set_status(paper_dir.name, STAGE_MATCH, STATUS_DONE)
 
 
 def _get_best_match(matches: list[tuple[str, float, int]], affiliation: str) -> tuple[str, float, int]:
@@ -144,17 +137,22 @@ def _match_authors(arxiv_authors: list[Author], ext_authors: list[Author], match
 
 
 def _run_single_element(paper_dir: Path, args: tuple) -> dict | None:
+    manifest = util.get_pipeline_manifest()
     if not (arxiv_metadata := util.read_json(paper_dir, util.ARXIV_METADATA_FILE)):
+        manifest.set_status(paper_dir.name, STAGE_MATCH, STATUS_FAILED, "could not read arXiv metadata")
         return None
 
     if not (ext_aff := util.read_json(paper_dir, util.EXTRACTED_DATA_FILE)):
+        manifest.set_status(paper_dir.name, STAGE_MATCH, STATUS_EMPTY, "no extracted data")
         return None
 
     extractions = ext_aff.extractions
     if len(ext_aff.extractions) == 0:
+        manifest.set_status(paper_dir.name, STAGE_MATCH, STATUS_EMPTY, "no extracted data")
         return None
 
     if util.file_exists(paper_dir, util.MATCHED_DATA_FILE):
+        manifest.set_status(paper_dir.name, STAGE_MATCH, STATUS_DONE)
         return None
 
     matched_affiliations: dict = args[0]  # {"extracted_aff" : {ror_id, score}, ...}
@@ -260,6 +258,10 @@ def _get_ror_dataset() -> RorDataset:
     if not util.file_exists(util.get_ror_dir(), util.ROR_DATASET_FILE):
         _logger.warning("Did not find ROR dataset file! Downloading it now.")
         ror_dl.prepare_dataset()
+    elif not ror_dl.is_dataset_valid():
+        _logger.warning("ROR dataset file is corrupted or incomplete! Downloading it again.")
+        util.delete_file_in_dir(util.get_ror_dir(), util.ROR_DATASET_FILE)
+        ror_dl.prepare_dataset()
 
     return util.read_json(util.get_ror_dir(), util.ROR_DATASET_FILE)
 
@@ -270,6 +272,8 @@ def run(paper_dirs: list[Path]) -> None:
     organizations (ROR dataset).
     """
     util.configure_logger(_logger)
+    # every following step only needs the papers that were not matched yet
+    paper_dirs = util.get_unfinished_paper_dirs(paper_dirs, STAGE_MATCH)
     _logger.info("Preparing ROR dataset for Matching.")
     ror_dataset = _get_ror_dataset()
     ror_orgs = _process_ror_orgs(ror_dataset)
@@ -277,7 +281,5 @@ def run(paper_dirs: list[Path]) -> None:
     extracted_affiliations = _get_extracted_affiliations(paper_dirs)
     matched_affiliations = _match_affiliations(extracted_affiliations, ror_orgs)
     matched_data = threaded_run.run_with_results(paper_dirs, _run_single_element, matched_affiliations)
-    _logger.info("Preparing ROR dataset for assignments.")
-    ror_orgs_dict = _process_ror_orgs_to_dict(ror_dataset)
-    _logger.info("Assigning ROR Organizations to extracted data.")
-    threaded_run.run(matched_data, _resolve_ror_id, ror_orgs_dict)
+    _logger.info("Writing matched data.")
+    threaded_run.run(matched_data, _write_matched_data, ror_dataset.src_file_name)
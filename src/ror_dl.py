@@ -1,30 +1,54 @@
+import hashlib
+import json
 import logging
+import re
 import time
+import typing
 import zipfile
+from datetime import datetime, timezone
 from pathlib import Path
 
 import requests
 
+import http_session
 import util
+from HttpCache import HttpCache, DEFAULT_TTL_S
 from definition.data.RorDataset import ResearchLocation, RorDataset, ResearchOrganization
+from definition.data.RorManifest import RorManifest
 
 _RECORD_LIST_URL = "https://zenodo.org/api/communities/ror-data/records?q=&sort=newest"
 _MAX_RETRIES = 10
 _ATTEMPT_DELAY_SEC = 10
+_READ_CHUNK_SIZE = 1024 * 1024
+# whitespace and separators between the elements of the top level array of the dump
+_ARRAY_SEPARATOR_REGEX = re.compile(r"[\s,]*")
 
 _logger: logging.Logger = logging.getLogger(__name__)
 
 
-def _get_latest_release_info() -> tuple[str, str]:
+def _get_latest_release_info(
+        session: requests.Session, timeout: tuple[float, float], cache_ttl_s: float, record_list_url: str
+) -> tuple[str, str]:
     _logger.info("Retrieving ROR dataset release information...")
+    cache = HttpCache(util.get_http_cache_dir())
     retries = 1
     while True:
-        ror_records = requests.get(_RECORD_LIST_URL).json()
+        try:
+            response = cache.get(
+                record_list_url,
+                cache_ttl_s,
+                lambda headers: session.get(record_list_url, timeout=timeout, headers=headers)
+            )
+            ror_records = json.loads(response)
+        except (requests.RequestException, ValueError):
+            ror_records = {}  # retry like any other incomplete response
+
         first_hit = ror_records.get("hits", {}).get("hits", [{}])[0]
-        file = first_hit.get("files", {})[0]
+        file = first_hit.get("files", [{}])[0]
         download_file_name = file.get("key", None)
         download_url = file.get("links", {}).get("self", None)
         if not download_url or not download_file_name:
+            cache.invalidate(record_list_url)
             if retries > _MAX_RETRIES:
                 _logger.error("Exceeded amount of max retries! Stopping ROR download.")
                 return "", ""
@@ -42,11 +66,17 @@ def _get_latest_release_info() -> tuple[str, str]:
     return download_file_name, download_url
 
 
-def _download_dataset(ror_dir: Path, file_name: str, latest_dl_url: str) -> bool:
+def _download_dataset(
+        session: requests.Session, timeout: tuple[float, float], ror_dir: Path, file_name: str, latest_dl_url: str
+) -> bool:
     _logger.info("Downloading latest ROR dataset...")
     retries = 1
     while True:
-        response = requests.get(latest_dl_url)
+        try:
+            response = session.get(latest_dl_url, timeout=timeout)
+        except requests.RequestException:
+            response = None
+
         if not response or response.status_code != 200 or not (content := response.content):
             if retries > _MAX_RETRIES:
                 _logger.error("Exceeded amount of max retries! Stopping ROR download.")
@@ -119,15 +149,44 @@ def _get_org_location(org: dict) -> list[ResearchLocation]:
     return locations
 
 
+def _iter_json_array(file_path: Path) -> typing.Iterator[dict]:
+    # the dump is a single array of organization objects. instead of loading the whole document, the file is read in
+    # chunks and one object after another is decoded from the buffer, so only the current chunk and the current
+    # object need to be in memory. an object that is cut off at the end of the buffer fails to decode, in that case
+    # the next chunk is appended and the object is decoded again.
+    decoder = json.JSONDecoder()
+    with open(file_path, "r", encoding=util.ARXIV_ENCODING) as file:
+        buffer = file.read(_READ_CHUNK_SIZE).lstrip().removeprefix("[")
+        pos = 0
+        eof = False
+        while True:
+            pos = _ARRAY_SEPARATOR_REGEX.match(buffer, pos).end()
+            if buffer.startswith("]", pos):
+                return
+
+            try:
+                obj, pos = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+
+                chunk = file.read(_READ_CHUNK_SIZE)
+                eof = not chunk
+                buffer = buffer[pos:] + chunk
+                pos = 0
+                continue
+
+            yield obj
+
+
 def _minimize_dataset(ror_dir: Path, dataset_file: str) -> RorDataset:
-    dataset = util.read_json(ror_dir, dataset_file)
     # add a fallback as first element as empty strings will just match the first element
     research_organizations = [ResearchOrganization(
         "https://ror.org",
         ["Incredibly unlikely match for anything, not supposed to be a real match!"],
         []  # locations
     )]
-    for research_org in dataset:
+    for research_org in _iter_json_array(ror_dir / dataset_file):
         ror_id = research_org["id"]
         names = _get_org_names(research_org)
         locations = _get_org_location(research_org)
@@ -137,23 +196,114 @@ def _minimize_dataset(ror_dir: Path, dataset_file: str) -> RorDataset:
 
 
 def _remove_unused_files(ror_dir: Path):
-    files = [file for file in util.get_all_files_recursive(ror_dir) if file.name != util.ROR_DATASET_FILE]
+    keep = {util.ROR_DATASET_FILE, util.ROR_MANIFEST_FILE}
+    files = [file for file in util.get_all_files_recursive(ror_dir) if file.name not in keep]
     util.delete_files(files)
     _logger.info("Removed unused ROR dataset files.")
 
 
-def _is_latest_version_on_disk(ror_dir: Path, dataset_file_name: str):
+def _get_file_sha256(file_path: Path) -> str:
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        while chunk := file.read(_READ_CHUNK_SIZE):
+            sha256.update(chunk)
+
+    return sha256.hexdigest()
+
+
+def _write_manifest(ror_dir: Path, src_file_name: str, record_count: int) -> RorManifest:
+    dataset_path = ror_dir / util.ROR_DATASET_FILE
+    stat = dataset_path.stat()
+    manifest = RorManifest(
+        src_file_name,
+        record_count,
+        stat.st_size,
+        _get_file_sha256(dataset_path),
+        datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        stat.st_mtime_ns
+    )
+    util.write_obj_to_json(ror_dir, util.ROR_MANIFEST_FILE, manifest)
+    return manifest
+
+
+def _read_manifest(ror_dir: Path) -> RorManifest | None:
     if not util.file_exists(ror_dir, util.ROR_DATASET_FILE):
+        return None
+
+    manifest = util.read_json(ror_dir, util.ROR_MANIFEST_FILE)
+    if not isinstance(manifest, RorManifest):
+        if manifest is not None:
+            return None
+
+        # dataset prepared before manifests were written, read it once to create the manifest
+        try:
+            dataset: RorDataset = util.read_json(ror_dir, util.ROR_DATASET_FILE)
+        except ValueError:
+            return None
+
+        if not isinstance(dataset, RorDataset):
+            return None
+
+        manifest = _write_manifest(ror_dir, dataset.src_file_name, len(dataset.data))
+
+    return manifest
+
+
+def _is_dataset_file_valid(ror_dir: Path, manifest: RorManifest, verify_checksum: bool) -> bool:
+    dataset_path = ror_dir / util.ROR_DATASET_FILE
+    stat = dataset_path.stat()
+    if manifest.size != stat.st_size:
+        return False  # catches truncated files without reading them
+
+    if not verify_checksum and manifest.mtime_ns == stat.st_mtime_ns:
+        return True
+
+    if manifest.sha256 != _get_file_sha256(dataset_path):
         return False
 
-    # TODO: this could be improved by not reading the whole file
-    dataset: RorDataset = util.read_json(ror_dir, util.ROR_DATASET_FILE)
-    return dataset.src_file_name == dataset_file_name
+    if manifest.mtime_ns != stat.st_mtime_ns:
+        # e.g. copied or restored from a backup, store the new time so the next check does not hash the file again
+        manifest.mtime_ns = stat.st_mtime_ns
+        util.write_obj_to_json(ror_dir, util.ROR_MANIFEST_FILE, manifest)
+
+    return True
+
+
+def _is_latest_version_on_disk(ror_dir: Path, dataset_file_name: str):
+    manifest = _read_manifest(ror_dir)
+    return (
+        manifest is not None
+        and manifest.src_file_name == dataset_file_name
+        and _is_dataset_file_valid(ror_dir, manifest, verify_checksum=True)
+    )
+
+
+def is_dataset_valid(verify_checksum=False) -> bool:
+    """
+    Check the prepared ROR dataset against its manifest without parsing it. By default, only its size and
+    modification time are compared, verify_checksum hashes the whole file.
+    """
+    ror_dir = util.get_ror_dir()
+    manifest = _read_manifest(ror_dir)
+    if manifest is None:
+        return False
+
+    return _is_dataset_file_valid(ror_dir, manifest, verify_checksum)
+
+
+def prepare_dataset(
+        timeout: tuple[float, float] = http_session.DEFAULT_TIMEOUT, cache_ttl_s: float = DEFAULT_TTL_S,
+        record_list_url=_RECORD_LIST_URL
+):
+    with http_session.create_session(1) as session:  # zenodo.org only, requests are sequential
+        _prepare_dataset(session, timeout, cache_ttl_s, record_list_url)
 
 
-def prepare_dataset():
+def _prepare_dataset(
+        session: requests.Session, timeout: tuple[float, float], cache_ttl_s: float, record_list_url: str
+):
     ror_dir = util.get_ror_dir()
-    zip_file_name, latest_dl_url = _get_latest_release_info()
+    zip_file_name, latest_dl_url = _get_latest_release_info(session, timeout, cache_ttl_s, record_list_url)
     if not zip_file_name or not latest_dl_url:
         return
 
@@ -163,7 +313,7 @@ def prepare_dataset():
         _logger.info("Found latest ROR dataset file on disk! Skipping download.")
         return
 
-    if not _download_dataset(ror_dir, zip_file_name, latest_dl_url):
+    if not _download_dataset(session, timeout, ror_dir, zip_file_name, latest_dl_url):
         return
 
     _extract_dataset_file(ror_dir, zip_file_name, dataset_file_name)
@@ -173,6 +323,9 @@ def prepare_dataset():
             return
 
     min_dataset = _minimize_dataset(ror_dir, dataset_file_name)
+    # write the manifest last, a dataset without matching manifest is considered incomplete
+    util.delete_file_in_dir(ror_dir, util.ROR_MANIFEST_FILE)
     util.write_obj_to_json(ror_dir, util.ROR_DATASET_FILE, min_dataset)
+    _write_manifest(ror_dir, dataset_file_name, len(min_dataset.data))
     _logger.info("ROR dataset prepared!")
     _remove_unused_files(ror_dir)
@@ -0,0 +1,70 @@
+import logging
+import threading
+
+import util
+from definition.data.MatchedAuthorData import MatchedAffiliationInfo, MatchedPaperData
+from definition.data.RorDataset import ResearchOrganization
+
+_logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_orgs: dict[str, ResearchOrganization] | None = None  # ROR ID -> organization, read on first use
+_version = ""  # file name of the loaded ROR dataset, empty if there is none
+
+
+def load() -> None:
+    """
+    Read the prepared ROR dataset into the index, unless that already happened. Call it before starting worker
+    processes, forked workers share the index of their parent instead of each reading the dataset again.
+    """
+    global _orgs, _version
+    with _lock:
+        if _orgs is not None:
+            return
+
+        ror_dataset = util.read_json(util.get_ror_dir(), util.ROR_DATASET_FILE)
+        if not ror_dataset:
+            util.configure_logger(_logger)
+            _logger.warning("Did not find the ROR dataset, run the match mode to download it.")
+            _orgs = {}
+            return
+
+        _orgs = {ror_org.ror_id: ror_org for ror_org in ror_dataset.data}
+        _version = ror_dataset.src_file_name
+
+
+def get_org(ror_id: str) -> ResearchOrganization | None:
+    load()
+    return _orgs.get(ror_id)
+
+
+def resolve(affiliation: MatchedAffiliationInfo) -> ResearchOrganization | None:
+    """
+    The ROR organization an affiliation was matched to, None if it is not part of the prepared dataset.
+    """
+    return get_org(affiliation.ror_id)
+
+
+def get_version() -> str:
+    load()
+    return _version
+
+
+def is_outdated(matched_data: MatchedPaperData) -> bool:
+    """
+    Whether matched_data was matched with another ROR dataset than the prepared one. IDs withdrawn since then do not
+    resolve to an organization anymore.
+    """
+    version = get_version()
+    return bool(version) and matched_data.ror_version != version
+
+
+def warn_outdated(outdated_papers: int) -> None:
+    if outdated_papers == 0:
+        return
+
+    util.configure_logger(_logger)
+    _logger.warning(
+        "%d papers were matched with another ROR dataset than '%s', organizations withdrawn since then are missing. "
+        "Use --clear-metadata to match them again.", outdated_papers, _version
+    )
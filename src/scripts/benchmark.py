@@ -1,26 +1,43 @@
 """
 Benchmark parts of the program
 """
+import contextlib
 import random
+import shutil
+import tempfile
+import time
 import timeit
+import typing
 from pathlib import Path
 from typing import Callable
 
+import ArxivAPI
+import download
 import extract_author_aff
 import extract_cmds
+import ror_dl
 import util
+from ArtifactStore import ArtifactStore
+from PipelineManifest import PipelineManifest
+from scripts import stand_in_server
 
 _seed = "benchmark1337"
 _choices = {
     "cmds": {
         "f": extract_cmds.run,
-        "validator": lambda paper_dir: len(util.get_all_tex_files(paper_dir / util._PAPER_TEX_DIR)) > 0
+        "validator": lambda paper_dir: util.has_tex_files(paper_dir)
     },
     "aff": {
         "f": extract_author_aff.run,
         "validator": lambda paper_dir: util.file_exists(paper_dir, util.CMDS_FILE)
+    },
+    # runs against the local stand-in server, the sample size is the number of synthetic papers to download
+    "download": {
+        "benchmark": lambda sample_size, runs: _benchmark_download(sample_size, runs)
     }
 }
+_DOWNLOAD_WORKERS = 4
+_SERVER_CONFIG = stand_in_server.ServerConfig(latency_ms=50, bandwidth_kbps=2048, error_rate=0.05)
 
 
 def _benchmark(f: Callable, paper_dirs: list[Path], runs: int) -> None:
@@ -29,6 +46,7 @@ def _benchmark(f: Callable, paper_dirs: list[Path], runs: int) -> None:
     timings = []
     for _ in range(runs):
         util.delete_generated_data()
+        util.load_pipeline_manifest()  # rebuilding the cleared manifest is not part of the benchmark
         t = timeit.timeit(lambda: f(paper_dirs), number=1)
         timings.append(t)
 
@@ -36,6 +54,109 @@ def _benchmark(f: Callable, paper_dirs: list[Path], runs: int) -> None:
           f"avg: {sum(timings) / len(timings)} seconds\n\tmax: {max(timings)} seconds")
 
 
+def _delete_synthetic_papers() -> None:
+    synthetic_dirs = [paper_dir for paper_dir in util.get_paper_dirs()
+                      if paper_dir.name.startswith(stand_in_server.SYNTHETIC_ID_PREFIX)]
+    for paper_dir in synthetic_dirs:
+        shutil.rmtree(paper_dir)
+
+    # otherwise the next run would consider them downloaded
+    util.get_pipeline_manifest().remove(paper_dir.name for paper_dir in synthetic_dirs)
+
+
+def _get_max_requests_per_window(timestamps: list[float], window_s: float) -> int:
+    timestamps = sorted(timestamps)
+    max_requests = 0
+    first = 0
+    for last in range(len(timestamps)):
+        while timestamps[last] - timestamps[first] >= window_s:
+            first += 1
+
+        max_requests = max(max_requests, last - first + 1)
+
+    return max_requests
+
+
+@contextlib.contextmanager
+def _temporary_data_dirs() -> typing.Iterator[None]:
+    # the papers, the ROR dataset and the HTTP cache are redirected to a temporary directory, so the real ones stay
+    # untouched. the papers dir also holds the manifest, the artifact database and the layout marker.
+    util.get_storage()  # reads the storage marker of the real papers dir, the temporary one has none
+    saved = (
+        util._PAPERS_PATH, util._ROR_PATH, util._HTTP_CACHE_PATH, util._artifact_store, util._pipeline_manifest,
+        util._layout
+    )
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        util._PAPERS_PATH = Path(tmp_dir) / "papers"
+        util._ROR_PATH, util._HTTP_CACHE_PATH = Path(tmp_dir) / "ror", Path(tmp_dir) / "http_cache"
+        for dir_path in (util._PAPERS_PATH, util._ROR_PATH, util._HTTP_CACHE_PATH):
+            dir_path.mkdir()
+
+        util._artifact_store = ArtifactStore(
+            util._PAPERS_PATH / util._ARTIFACT_DB_FILE, util._PAPER_ARTIFACT_TABLES.values()
+        )
+        util._pipeline_manifest = PipelineManifest(util._PAPERS_PATH / util._PIPELINE_DB_FILE)
+        util._layout = None
+        try:
+            yield
+        finally:
+            (
+                util._PAPERS_PATH, util._ROR_PATH, util._HTTP_CACHE_PATH, util._artifact_store,
+                util._pipeline_manifest, util._layout
+            ) = saved
+
+
+def _run_download(arxiv_api: ArxivAPI.ArxivAPI, sample_size: int, stats: stand_in_server.ServerStats) -> None:
+    stats.src_requests.clear()
+    stats.injected_errors = 0
+    stats.bytes_sent = 0
+    to_skip = set()
+    start = time.perf_counter()
+    papers = arxiv_api.query("cs.SE", sample_size, 500)
+    download._run_concurrently(arxiv_api, papers, to_skip, _DOWNLOAD_WORKERS, None)
+    duration = time.perf_counter() - start
+
+    downloaded = len([paper_dir for paper_dir in util.get_paper_dirs()
+                      if paper_dir.name.startswith(stand_in_server.SYNTHETIC_ID_PREFIX)
+                      and util.has_tex_files(paper_dir)])
+    max_per_second = _get_max_requests_per_window(stats.src_requests, 1.0)
+    max_allowed = ArxivAPI._SRC_DL_BURST_SIZE + ArxivAPI._SRC_DL_PER_SECOND
+    print(f"{duration:.1f} seconds, {downloaded} downloaded, {len(to_skip)} skipped, "
+          f"{len(stats.src_requests)} source requests ({stats.injected_errors} injected errors), "
+          f"{stats.bytes_sent / 1024 / 1024 / duration:.2f} MB/s, max {max_per_second} requests in 1 second "
+          f"({'ok' if max_per_second <= max_allowed else 'RATE LIMIT EXCEEDED'})")
+
+
+def _benchmark_download(sample_size: int, runs: int) -> None:
+    # the downloads use the real rate limits, so each run takes about sample_size / _SRC_DL_PER_SECOND seconds
+    server, stats = stand_in_server.start(_SERVER_CONFIG)
+    urls = stand_in_server.get_base_urls(server)
+    print(f"Stand-in server: {urls}. Each run takes about {sample_size / ArxivAPI._SRC_DL_PER_SECOND} seconds.")
+    timings = []
+    try:
+        with _temporary_data_dirs():
+            for _ in range(runs):
+                _delete_synthetic_papers()
+                # the cache is disabled (TTL 0) and emptied, so the query is part of every run
+                arxiv_api = ArxivAPI.ArxivAPI(
+                    pool_size=_DOWNLOAD_WORKERS, cache_ttl_s=0,
+                    api_base_url=urls["api_base_url"], src_base_url=urls["src_base_url"]
+                )
+                for cached_file in util.get_http_cache_dir().iterdir():
+                    cached_file.unlink()
+                timings.append(timeit.timeit(lambda: _run_download(arxiv_api, sample_size, stats), number=1))
+
+            ror_timing = timeit.timeit(
+                lambda: ror_dl.prepare_dataset(record_list_url=urls["record_list_url"]), number=1
+            )
+    finally:
+        server.shutdown()
+
+    print(f"{runs} runs with {sample_size} papers:\n\tmin: {min(timings)} seconds\n\t"
+          f"avg: {sum(timings) / len(timings)} seconds\n\tmax: {max(timings)} seconds\n\t"
+          f"ROR dataset: {ror_timing} seconds")
+
+
 def _select_papers(method_info: dict, sample_size: int) -> list[Path]:
     random.seed(_seed)
     paper_dirs = util.get_paper_dirs()
@@ -71,6 +192,10 @@ def main():
         selection = input(f"Please select what to benchmark {[choice for choice in _choices.keys()]}: ")
         method = _choices.get(selection, None)
 
+    if "benchmark" in method:
+        method.get("benchmark")(sample_size, runs)
+        return
+
     paper_dirs = _select_papers(method, sample_size)
     _benchmark(method.get("f"), paper_dirs, runs)
 
@@ -0,0 +1,44 @@
+"""
+Rewrite the metadata and results of all papers with the given compression, like --compression does for new files.
+With --train-dict a zstd dictionary is trained on a sample of the existing files first and used for all zstd files
+written afterward. Files compressed with an older dictionary stay readable.
+"""
+import argparse
+import random
+
+import util
+from ArtifactCompressor import COMPRESSIONS, COMPRESSION_ZSTD
+
+_FILE_NAMES = [util.ARXIV_METADATA_FILE, util.CMDS_FILE, util.EXTRACTED_DATA_FILE, util.MATCHED_DATA_FILE]
+_DICT_SAMPLE_PAPERS = 2000
+
+arg_parser = argparse.ArgumentParser(description="Change the compression of the metadata and results of all papers.")
+arg_parser.add_argument("compression", choices=COMPRESSIONS)
+arg_parser.add_argument(
+    "--train-dict",
+    action="store_true",
+    dest="train_dict",
+    help=f"Train a new zstd dictionary on the files of {_DICT_SAMPLE_PAPERS} random papers before compressing."
+)
+args = arg_parser.parse_args()
+util.set_compression(args.compression)
+paper_dirs = util.get_paper_dirs()
+
+if args.train_dict and args.compression == COMPRESSION_ZSTD:
+    sample_dirs = random.sample(paper_dirs, min(len(paper_dirs), _DICT_SAMPLE_PAPERS))
+    samples = [
+        json_str.encode(util.ARXIV_ENCODING) for paper_dir in sample_dirs for file_name in _FILE_NAMES
+        if (json_str := util.read_json_text(paper_dir, file_name))
+    ]
+    dict_id = util.get_artifact_compressor().train(samples)
+    print(f"Trained dictionary {dict_id} on {len(samples)} files.")
+
+rewritten = 0
+for paper_dir in paper_dirs:
+    for file_name in _FILE_NAMES:
+        # the content is stored as is, it does not have to be decoded
+        if json_str := util.read_json_text(paper_dir, file_name):
+            util.write_json_text(paper_dir, file_name, json_str)
+            rewritten += 1
+
+print(f"Rewrote {rewritten} files with compression '{args.compression}'.")
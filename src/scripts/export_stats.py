@@ -12,6 +12,8 @@ import scipy.stats as st
 from matplotlib.gridspec import GridSpec
 from mpl_toolkits.axes_grid1.inset_locator import inset_axes, mark_inset
 
+import json_codec
+import ror_index
 import util
 from definition.data.ArxivMetadata import ArxivMetadata
 from definition.data.ExtAuthorData import ExtAuthorInfo, ExtResults
@@ -127,6 +129,10 @@ class CombinedData:
     matched: MatchedPaperData
 
 
+# lets the codec store combined_data.json and basic_stats.json instead of jsonpickle
+json_codec.register(MatchStats, ExtStats, CmdStats, FileStats, Stats, CombinedData)
+
+
 def _generate_fg_dataset_country(filtered_papers: list[MatchedPaperData]) -> None:
     temp_nodes = {}
     temp_links = {}
@@ -134,8 +140,9 @@ def _generate_fg_dataset_country(filtered_papers: list[MatchedPaperData]) -> Non
         paper_countries = set()
         for author in paper.matched_authors:
             for affiliation in author.affiliations:
-                for loc in affiliation.matched_ror.locations:
-                    paper_countries.add(loc.country_name)
+                if ror_org := ror_index.resolve(affiliation):
+                    for loc in ror_org.locations:
+                        paper_countries.add(loc.country_name)
 
         if len(paper_countries) <= 1:
             continue
@@ -339,7 +346,8 @@ def _generate_fg_dataset_institution(filtered_papers: list[MatchedPaperData]) ->
         paper_affilitions = set()
         for author in paper.matched_authors:
             for affiliation in author.affiliations:
-                paper_affilitions.add(affiliation.matched_ror)
+                if ror_org := ror_index.resolve(affiliation):
+                    paper_affilitions.add(ror_org)
 
         if len(paper_affilitions) <= 1:
             continue
@@ -361,7 +369,8 @@ def _get_paper_affiliation_set(authors: list[MatchedAuthorInfo]) -> set[Research
     ror_orgs = set()
     for author in authors:
         for affiliation in author.affiliations:
-            ror_orgs.add(affiliation.matched_ror)
+            if ror_org := ror_index.resolve(affiliation):
+                ror_orgs.add(ror_org)
 
     return ror_orgs
 
@@ -399,7 +408,7 @@ def _graph_top_authors(filtered_papers: list[MatchedPaperData]) -> None:
             arxiv_author_name = author.arxiv_name.strip()
             if arxiv_author_name in authors:
                 authors[arxiv_author_name]["occ"] += 1
-                authors[arxiv_author_name]["aff"] += [aff.matched_ror.ror_id for aff in author.affiliations]
+                authors[arxiv_author_name]["aff"] += [aff.ror_id for aff in author.affiliations]
             else:
                 authors[arxiv_author_name] = {"occ": 1, "aff": []}
 
@@ -468,8 +477,7 @@ def _get_ror_org_occ(filtered_papers: list[MatchedPaperData]) -> dict:
     for paper in filtered_papers:
         for author in paper.matched_authors:
             for affiliation in author.affiliations:
-                ror_org = affiliation.matched_ror
-                ror_id = ror_org.ror_id
+                ror_id = affiliation.ror_id
                 if ror_id not in ror_orgs:
                     ror_orgs[ror_id] = 1
                 else:
@@ -1086,9 +1094,9 @@ def _print_ext_author_stats(combined_data: list[CombinedData], stats: Stats) ->
 
 
 def _print_latex_file_stats() -> None:
-    tex_files = util.get_all_tex_files(util.get_papers_dir(), ignore_cls=False)
-    print(f"Number of LaTeX files: {len(tex_files)}")
-    tex_files_size = sum(tex_file.stat().st_size for tex_file in tex_files)
+    tex_stats = util.load_pipeline_manifest().get_tex_stats().values()
+    print(f"Number of LaTeX files: {sum(tex_files for tex_files, _ in tex_stats)}")
+    tex_files_size = sum(tex_bytes for _, tex_bytes in tex_stats)
     print(f"Size of LaTeX files: {tex_files_size} bytes ({tex_files_size / 1_073_741_824:.2f} GB)")
 
 
@@ -1139,10 +1147,10 @@ def _cmd_stats(ext_cmds: ExtCmdData, cmd_stats: CmdStats) -> None:
 def _build_stats(combined_data: list[CombinedData]) -> Stats:
     stats = Stats()
     stats.file_stats.total_papers = len(combined_data)
+    tex_stats = util.load_pipeline_manifest().get_tex_stats()  # (number, size) of the tex files of each paper
     for paper_data in combined_data:
-        tex_dir = util.get_paper_tex_dir_by_arxiv_id(paper_data.arxiv.arxiv_id)
-        tex_files = util.get_all_tex_files(tex_dir)
-        if len(tex_files) == 0:
+        tex_files, _ = tex_stats.get(util.sanitize_arxiv_id(paper_data.arxiv.arxiv_id), (0, 0))
+        if tex_files == 0:
             stats.file_stats.no_latex += 1
             continue
 
@@ -1190,6 +1198,14 @@ def run(paper_dirs: list[Path]) -> None:
         util.write_obj_to_json(util.get_stats_dir(), util.STATS_ALL_DATA, combined_data)
         _logger.info("Saved data collection!")
 
+    outdated_papers = 0
+    for paper_data in combined_data:
+        util.upgrade_matched_data(paper_data.matched)  # a saved collection may be older than the matched data files
+        if paper_data.matched and ror_index.is_outdated(paper_data.matched):
+            outdated_papers += 1
+
+    ror_index.warn_outdated(outdated_papers)
+
     stats = util.read_json(util.get_stats_dir(), util.BASIC_STATS_FILE)
     if not stats:
         _logger.info("Building basic stats...")
@@ -1,3 +1,4 @@
+import ror_index
 import util
 from definition.data.MatchedAuthorData import MatchedPaperData, MatchedAuthorInfo
 
@@ -54,7 +55,7 @@ def _get_aff_matchings(authors: list[MatchedAuthorInfo]) -> list[tuple[str, floa
     for author in authors:
         aff_matching = author.affiliations
         for aff_match in aff_matching:
-            match = f"'{aff_match.ext_name}' <-> {aff_match.matched_ror}"
+            match = f"'{aff_match.ext_name}' <-> {ror_index.resolve(aff_match)}"
             if match in encountered_matches:
                 continue
 
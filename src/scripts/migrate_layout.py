@@ -0,0 +1,40 @@
+"""
+Move the directories of all papers into the given layout and store it in the papers dir, so the program uses it from
+now on. flat: papers/2409.08279, sharded: papers/2409/08/2409.08279. Run it again if it got interrupted.
+"""
+import argparse
+import os
+
+import util
+
+_LAYOUTS = [util.LAYOUT_FLAT, util.LAYOUT_SHARDED]
+
+arg_parser = argparse.ArgumentParser(description="Change the directory layout of the papers.")
+arg_parser.add_argument("layout", choices=_LAYOUTS)
+layout = arg_parser.parse_args().layout
+
+moved = 0
+shard_dirs = set()
+for old_layout in [old_layout for old_layout in _LAYOUTS if old_layout != layout]:
+    for paper_dir in util.get_paper_dirs(old_layout):
+        new_paper_dir = util.get_paper_path(paper_dir.name, layout)
+        if new_paper_dir.exists():
+            print(f"'{new_paper_dir}' already exists, skipped '{paper_dir}'.")
+            continue
+
+        new_paper_dir.parent.mkdir(parents=True, exist_ok=True)
+        paper_dir.rename(new_paper_dir)  # same file system, so only the directory entry moves
+        moved += 1
+        for parent in paper_dir.parents:
+            if parent == util.get_papers_dir():
+                break
+
+            shard_dirs.add(parent)
+
+# remove the shards of the old layout, deepest first
+for shard_dir in sorted(shard_dirs, key=lambda path: len(path.parts), reverse=True):
+    if not any(os.scandir(shard_dir)):
+        shard_dir.rmdir()
+
+util.set_layout(layout)
+print(f"Moved {moved} papers into the {layout} layout.")
@@ -0,0 +1,23 @@
+"""
+Copy the metadata and results of all papers from the JSON files in the paper directories into the SQLite database used
+by --storage sqlite and switch to that storage. The JSON files are kept, delete them yourself once the migration
+succeeded.
+"""
+import util
+
+store = util.get_artifact_store()
+file_names = [util.ARXIV_METADATA_FILE, util.CMDS_FILE, util.EXTRACTED_DATA_FILE, util.MATCHED_DATA_FILE]
+migrated = dict.fromkeys(file_names, 0)
+for paper_dir in util.get_paper_dirs():
+    for file_name in file_names:
+        # the content is stored as is (decompressed), both storages use the same format
+        if content := util.read_json_text(paper_dir, file_name):
+            store.write(util.get_artifact_table(file_name), paper_dir.name, content)
+            migrated[file_name] += 1
+
+store.flush()
+for file_name, count in migrated.items():
+    print(f"Migrated {count} '{file_name}' files.")
+
+util.set_storage(util.STORAGE_SQLITE)
+print("The program and the scripts now use the SQLite storage.")
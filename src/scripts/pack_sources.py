@@ -0,0 +1,14 @@
+"""
+Pack the extracted LaTeX files of all papers into one tex.zip per paper, like --pack-sources does for new downloads.
+"""
+import util
+
+packed = 0
+for paper_dir in util.get_paper_dirs():
+    if (paper_dir / util.TEX_ARCHIVE_FILE).is_file() or not util.has_tex_files(paper_dir):
+        continue
+
+    util.pack_tex_files(paper_dir)
+    packed += 1
+
+print(f"Packed the LaTeX files of {packed} papers.")
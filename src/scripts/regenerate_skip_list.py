@@ -10,7 +10,7 @@ run = 0
 to_skip = set()
 
 for paper_dir in paper_dirs:
-    if len(util.get_all_files_recursive(paper_dir / "tex", ".tex")) > 0:
+    if util.has_tex_files(paper_dir):
         continue
 
     to_skip.add(paper_dir.name.replace("_", "/"))
@@ -0,0 +1,231 @@
+"""
+Local stand-in for the arXiv API, the arXiv source download and the Zenodo ROR records. Serves generated data, so the
+download code can be run and benchmarked without touching the real services. Run it directly to use it with the
+normal program or start it from another script with start().
+
+Routes:
+    /api/query?search_query=cat:<cat>&start=<s>&max_results=<n>   Atom feed with synthetic papers 9999.00000, ...
+    /src/<arxiv_id>     source of the paper, depending on the ID: tar.gz, single gzipped .tex file or pdf only
+    /zenodo/records     record list in the format of the Zenodo API, pointing to /zenodo/ror.zip
+    /zenodo/ror.zip     zip with a small ROR dataset in schema v2
+"""
+import argparse
+import gzip
+import io
+import json
+import random
+import tarfile
+import threading
+import time
+import zipfile
+from dataclasses import dataclass, field
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+SYNTHETIC_ID_PREFIX = "9999."
+_ROR_RELEASE = "v9.99-2099-01-01-ror-data"
+_CHUNK_SIZE = 16 * 1024
+
+
+@dataclass
+class ServerConfig:
+    total_results: int = 1000
+    latency_ms: int = 0
+    bandwidth_kbps: int = 0  # 0 = unlimited
+    error_rate: float = 0.0  # share of source requests answered with 503
+    tex_padding_kb: int = 64  # size of the generated .tex files, mostly random comments
+    seed: int = 1337
+
+
+@dataclass
+class ServerStats:
+    src_requests: list[float] = field(default_factory=list)  # time.monotonic() of each source request
+    injected_errors: int = 0
+    bytes_sent: int = 0
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+def get_synthetic_id(index: int) -> str:
+    return f"{SYNTHETIC_ID_PREFIX}{index:05d}"
+
+
+def _get_feed_entry(index: int) -> str:
+    arxiv_id = get_synthetic_id(index)
+    month = index % 12 + 1
+    return f"""  <entry>
+    <id>http://arxiv.org/abs/{arxiv_id}v1</id>
+    <updated>2099-{month:02d}-02T12:00:00Z</updated>
+    <published>2099-{month:02d}-01T12:00:00Z</published>
+    <title>Synthetic paper {index}</title>
+    <summary>Generated by the stand-in server.</summary>
+    <author><name>Jane Doe {index}</name></author>
+    <author><name>John Smith {index}</name></author>
+    <arxiv:primary_category xmlns:arxiv="http://arxiv.org/schemas/atom" term="cs.SE"/>
+    <category term="cs.SE" scheme="http://arxiv.org/schemas/atom"/>
+  </entry>
+"""
+
+
+def _get_feed(config: ServerConfig, start: int, max_results: int) -> bytes:
+    end = min(start + max_results, config.total_results)
+    entries = "".join(_get_feed_entry(index) for index in range(start, end))
+    opensearch = 'xmlns:opensearch="http://a9.com/-/spec/opensearch/1.1/"'
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom">
+  <title type="html">ArXiv Query: stand-in</title>
+  <opensearch:totalResults {opensearch}>{config.total_results}</opensearch:totalResults>
+  <opensearch:startIndex {opensearch}>{start}</opensearch:startIndex>
+  <opensearch:itemsPerPage {opensearch}>{end - start}</opensearch:itemsPerPage>
+{entries}</feed>
+""".encode("utf-8")
+
+
+def _get_tex(config: ServerConfig, index: int) -> bytes:
+    rng = random.Random(config.seed + index)
+    padding = "".join(f"% {rng.getrandbits(128):032x}\n" for _ in range(config.tex_padding_kb * 1024 // 35))
+    return f"""\\documentclass{{article}}
+\\author{{Jane Doe {index}\\thanks{{Technical University of Munich, Germany}}}}
+\\author{{John Smith {index}\\thanks{{University of Oxford, United Kingdom}}}}
+{padding}\\begin{{document}}
+\\maketitle
+\\end{{document}}
+""".encode("utf-8")
+
+
+def _get_source(config: ServerConfig, arxiv_id: str) -> tuple[bytes, str]:
+    index = int(arxiv_id.removeprefix(SYNTHETIC_ID_PREFIX))
+    tex = _get_tex(config, index)
+    match index % 10:
+        case 8:  # only a pdf
+            return b"%PDF-1.5\n" + tex[:1024], "application/pdf"
+        case 9:  # a single gzipped .tex file instead of a tar
+            return gzip.compress(tex), "application/gzip"
+        case _:
+            buffer = io.BytesIO()
+            with tarfile.open(fileobj=buffer, mode="w:gz") as tar:
+                for name, content in (("main.tex", tex), ("figures/plot.png", tex[:2048])):
+                    tar_info = tarfile.TarInfo(name)
+                    tar_info.size = len(content)
+                    tar.addfile(tar_info, io.BytesIO(content))
+
+            return buffer.getvalue(), "application/gzip"
+
+
+def _get_ror_zip() -> bytes:
+    organizations = [
+        {"id": "https://ror.org/02kkvpp62", "names": [{"value": "Technical University of Munich"}],
+         "locations": [{"geonames_details": {"name": "Munich", "country_name": "Germany"}}]},
+        {"id": "https://ror.org/052gg0110", "names": [{"value": "University of Oxford"}],
+         "locations": [{"geonames_details": {"name": "Oxford", "country_name": "United Kingdom"}}]}
+    ]
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
+        zip_file.writestr(f"{_ROR_RELEASE}_schema_v2.json", json.dumps(organizations))
+
+    return buffer.getvalue()
+
+
+def _create_handler(config: ServerConfig, stats: ServerStats) -> type[BaseHTTPRequestHandler]:
+    ror_zip = _get_ror_zip()
+    rng = random.Random(config.seed)
+
+    class StandInHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, like the real services
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path.startswith("/src/"):
+                with stats.lock:
+                    stats.src_requests.append(time.monotonic())
+
+            time.sleep(config.latency_ms / 1000)
+            with stats.lock:
+                # only the source downloads get errors, they are what the retries of the download loop are made for
+                inject_error = url.path.startswith("/src/") and rng.random() < config.error_rate
+                stats.injected_errors += inject_error
+
+            if inject_error:
+                self._send(503, b"", "text/plain", extra_headers={"Retry-After": "1"})
+            elif url.path == "/api/query":
+                query = parse_qs(url.query)
+                start = int(query.get("start", ["0"])[0])
+                max_results = int(query.get("max_results", ["10"])[0])
+                self._send(200, _get_feed(config, start, max_results), "application/atom+xml")
+            elif url.path.startswith("/src/" + SYNTHETIC_ID_PREFIX):
+                self._send(200, *_get_source(config, url.path.removeprefix("/src/")))
+            elif url.path == "/zenodo/records":
+                host = f"http://{self.headers.get('Host')}"
+                records = {"hits": {"hits": [{"files": [
+                    {"key": f"{_ROR_RELEASE}.zip", "links": {"self": f"{host}/zenodo/ror.zip"}}
+                ]}]}}
+                self._send(200, json.dumps(records).encode("utf-8"), "application/json")
+            elif url.path == "/zenodo/ror.zip":
+                self._send(200, ror_zip, "application/zip")
+            else:
+                self._send(404, b"", "text/plain")
+
+        def _send(self, status: int, body: bytes, content_type: str, extra_headers: dict | None = None):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (extra_headers or {}).items():
+                self.send_header(name, value)
+
+            self.end_headers()
+            # limit the bandwidth per connection by sending chunks and waiting after each of them
+            chunk_delay_s = _CHUNK_SIZE / (config.bandwidth_kbps * 1024) if config.bandwidth_kbps else 0
+            for start in range(0, len(body), _CHUNK_SIZE):
+                self.wfile.write(body[start:start + _CHUNK_SIZE])
+                time.sleep(chunk_delay_s)
+
+            with stats.lock:
+                stats.bytes_sent += len(body)
+
+    return StandInHandler
+
+
+def start(config: ServerConfig, port=0) -> tuple[ThreadingHTTPServer, ServerStats]:
+    """
+    Start the server in a background thread. Port 0 picks a free port, see server.server_port.
+    Stop it with server.shutdown().
+    """
+    stats = ServerStats()
+    server = ThreadingHTTPServer(("127.0.0.1", port), _create_handler(config, stats))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, stats
+
+
+def get_base_urls(server: ThreadingHTTPServer) -> dict[str, str]:
+    base = f"http://127.0.0.1:{server.server_port}"
+    return {
+        "api_base_url": f"{base}/api/query",
+        "src_base_url": f"{base}/src/",
+        "record_list_url": f"{base}/zenodo/records"
+    }
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Stand-in server for arXiv and Zenodo.")
+    arg_parser.add_argument("--port", type=int, default=8000)
+    arg_parser.add_argument("--total-results", type=int, default=1000, help="Number of synthetic papers.")
+    arg_parser.add_argument("--latency", type=int, default=0, help="Delay before each response in ms.")
+    arg_parser.add_argument("--bandwidth", type=int, default=0, help="KiB/s per connection, 0 for unlimited.")
+    arg_parser.add_argument("--error-rate", type=float, default=0.0, help="Share of source requests answered with 503.")
+    args = arg_parser.parse_args()
+    config = ServerConfig(args.total_results, args.latency, args.bandwidth, args.error_rate)
+    server, _ = start(config, args.port)
+    for name, url in get_base_urls(server).items():
+        print(f"{name}: {url}")
+
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
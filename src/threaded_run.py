@@ -1,53 +1,275 @@
-import itertools
+import contextlib
+import logging
 import multiprocessing
+import multiprocessing.pool
+import multiprocessing.queues
+import multiprocessing.synchronize
+import os
+import queue
+import threading
 import typing
-from multiprocessing import Queue, Process, cpu_count
+from multiprocessing import Queue, cpu_count
 
 import threaded_log
+import util
 
+_logger: logging.Logger = logging.getLogger(__name__)
 
-def _process_queue(log_queue: Queue, element_queue: Queue, action: callable, args) -> None:
+_POLL_INTERVAL_S = 1  # how often waiting for the workers checks whether one of them died
+_BARRIER_TIMEOUT_S = 600  # workers waiting for one that died give up after this time
+_MAX_BROADCAST_ATTEMPTS = 3
+
+# the pool of the current worker_pool() context, None outside of it
+_pool: multiprocessing.pool.Pool | None = None
+_pool_size = 0
+# the workers report every task they start, so a task of a worker that died is not waited for forever
+_started_tasks: multiprocessing.queues.SimpleQueue | None = None
+_running_tasks: dict[int, tuple[int, int]] = {}  # pid -> stage ID and index of the task the worker started last
+
+# state of a worker process. the action and arguments of a stage are sent to every worker once when it starts instead
+# of with each element, e.g. the ROR organizations used for matching. the main process keeps them as well, a worker
+# that replaces a dead one is forked from it and inherits the current stage.
+_barrier: multiprocessing.synchronize.Barrier | None = None
+_stage_id = 0
+_stage_action: callable = None
+_stage_args: tuple = ()
+
+
+def _init_worker(
+        log_queue: Queue, barrier: multiprocessing.synchronize.Barrier, started_tasks: multiprocessing.queues.SimpleQueue
+) -> None:
+    global _barrier, _started_tasks
     threaded_log.configure_process_logger(log_queue)
-    while True:
-        element = element_queue.get()
-        if element is None:  # check for sentinel value and break when it appears
-            break
+    # only shared through inheritance, a barrier can not be sent with a task
+    _barrier = barrier
+    _started_tasks = started_tasks
+
+
+def _run_on_worker(worker_task: tuple[callable, tuple]) -> None:
+    worker_action, args = worker_task
+    try:
+        worker_action(*args)
+    finally:
+        # a worker waits until every other one got its task as well, so none of them takes two
+        _barrier.wait(_BARRIER_TIMEOUT_S)
+
+
+def _run_on_each_worker(worker_action: callable, *args) -> None:
+    for attempt in range(1, _MAX_BROADCAST_ATTEMPTS + 1):
+        _barrier.reset()  # releases the workers still waiting after a failed attempt
+        worker_pids = _get_alive_pids()
+        result = _pool.map_async(_run_on_worker, [(worker_action, args)] * _pool_size, chunksize=1)
+        # the task of a worker that died never finishes and the other ones would wait for it at the barrier
+        while not result.ready() and worker_pids <= _get_alive_pids():
+            result.wait(_POLL_INTERVAL_S)
+
+        if result.ready() and (result.successful() or attempt == _MAX_BROADCAST_ATTEMPTS):
+            result.get()  # raises the exception of a failed worker
+            return
+
+        _discard_result(result)
+        _logger.warning("Running %s on every worker failed, trying again.", worker_action.__name__)
+
+    raise RuntimeError(f"Could not run {worker_action.__name__} on every worker, a worker process died.")
+
+
+def _set_stage(stage_id: int, queue_action: callable, args: tuple) -> None:
+    global _stage_id, _stage_action, _stage_args
+    _stage_id = stage_id
+    _stage_action = queue_action
+    _stage_args = args
+
+
+def _finish_stage() -> None:
+    _set_stage(_stage_id, None, ())
+    # the workers do not exit between stages, so they commit their buffered writes for the next stage themselves
+    util.get_pipeline_manifest().flush()
+    util.flush_artifacts()
+    util.sync_written_files()
+
+
+def _start_stage(queue_action: callable, args: tuple) -> None:
+    _set_stage(_stage_id + 1, queue_action, args)
+    _run_on_each_worker(_set_stage, _stage_id, queue_action, args)
+
+
+def _end_stage() -> None:
+    _run_on_each_worker(_finish_stage)
+    _set_stage(_stage_id, None, ())
+
+
+def _run_stage_action(element):
+    if _stage_args is not None and len(_stage_args) > 0:
+        return _stage_action(element, _stage_args)
+
+    return _stage_action(element)
+
+
+def _run_stage_task(stage_id: int, task_index: int, elements: list) -> list:
+    if stage_id != _stage_id:
+        raise RuntimeError(f"Worker {os.getpid()} did not get stage {stage_id}, it is at stage {_stage_id}.")
+
+    _started_tasks.put((os.getpid(), stage_id, task_index))
+    return [_run_stage_action(element) for element in elements]
+
+
+def _submit_task(task_index: int, elements: list, error_callback=None) -> multiprocessing.pool.AsyncResult:
+    return _pool.apply_async(_run_stage_task, (_stage_id, task_index, elements), error_callback=error_callback)
+
 
-        if args is not None and len(args) > 0:
-            action(element, args)
-        else:
-            action(element)
+def _discard_result(result: multiprocessing.pool.AsyncResult) -> None:
+    # the pool waits for the results of every task before its workers can be joined, even for the lost ones
+    _pool._cache.pop(result._job, None)
+
+
+def _get_alive_pids() -> set[int]:
+    # copied first, the pool's own thread replaces dead workers in this list
+    return {worker.pid for worker in list(_pool._pool) if worker.exitcode is None}
+
+
+def _update_running_tasks() -> None:
+    # the workers block once the pipe is full, so it is emptied whenever the main process waits for them
+    while not _started_tasks.empty():
+        pid, stage_id, task_index = _started_tasks.get()
+        _running_tasks[pid] = (stage_id, task_index)
+
+
+def _get_lost_tasks() -> set[int]:
+    # the pool replaces a worker that died, but the task it was processing is never finished
+    _update_running_tasks()
+    alive_pids = _get_alive_pids()
+    lost_tasks = set()
+    for pid in [pid for pid in _running_tasks if pid not in alive_pids]:
+        stage_id, task_index = _running_tasks.pop(pid)
+        if stage_id == _stage_id:
+            lost_tasks.add(task_index)
+
+    return lost_tasks
+
+
+def _wait_for_tasks(results: list[multiprocessing.pool.AsyncResult], tasks: list[list]) -> None:
+    lost_tasks = set()
+    for task_index, result in enumerate(results):
+        lost_tasks.update(_get_lost_tasks())
+        while not result.ready() and task_index not in lost_tasks:
+            result.wait(_POLL_INTERVAL_S)
+            lost_tasks.update(_get_lost_tasks())
+
+    for task_index in sorted(lost_tasks):
+        if not results[task_index].ready():  # the worker might have died right after finishing it
+            _discard_result(results[task_index])
+            _logger.error("A worker process died while processing %s.", tasks[task_index])
+
+
+def _log_error(exception: BaseException) -> None:
+    # like an exception in a worker process, a failed element does not stop the other ones
+    _logger.error("Processing an element failed: %s", exception, exc_info=exception)
+
+
+@contextlib.contextmanager
+def worker_pool(log_queue: multiprocessing.queues.Queue | None = None) -> typing.Iterator[None]:
+    """
+    Keep one worker process per CPU core running until the context is left. Every run(), run_with_results() and
+    start_workers() inside the context hands its elements to these workers instead of starting new ones, so all stages
+    of a pipeline share the start-up cost and loaded data of the workers. Only one stage can run at a time. A worker
+    that dies is replaced, only the element it was processing is lost. The workers log into log_queue if given,
+    otherwise into a logging process of their own.
+    """
+    global _pool, _pool_size, _barrier, _started_tasks
+    if _pool is not None:
+        yield
+        return
+
+    util.configure_logger(_logger)
+    logging_thread = None
+    if log_queue is None:
+        log_queue = Queue()
+        logging_thread = threaded_log.start_logging_thread(log_queue)
+
+    _pool_size = cpu_count()
+    _barrier = multiprocessing.Barrier(_pool_size)
+    # unlike a Queue, a SimpleQueue writes without a feeder thread, so a worker that gets killed already reported
+    # the task it started
+    _started_tasks = multiprocessing.SimpleQueue()
+    _pool = multiprocessing.Pool(
+        processes=_pool_size, initializer=_init_worker, initargs=(log_queue, _barrier, _started_tasks)
+    )
+    try:
+        yield
+    except BaseException:
+        _pool.terminate()
+        raise
+    else:
+        # let the workers exit normally instead of terminating them, so they commit buffered writes
+        _pool.close()
+    finally:
+        _pool.join()
+        _pool = None
+        _running_tasks.clear()
+        if logging_thread is not None:
+            log_queue.put(None)
+            logging_thread.join()
 
 
 # since we can not be sure that each run will take a similar amount of time (due to larger/more tex files) we are not
-# splitting the list of paper directories and passing each part to a thread as that may result in one thread having a
-# way larger workload, and thus increasing the total time.
+# splitting the list of paper directories and passing each part to a process as that may result in one process having
+# a way larger workload, and thus increasing the total time.
 # Additionally, using this approach benefits us in I/O-heavy workloads (which this program spends most of its time on).
-# Because of that we use a queue to assign new papers to a thread when they are done with their current one. We use
-# as many threads as CPU cores as testing showed that although more threads may speed up I/O loads while not having
-# a huge benefit (or even reduce performance) for CPU-heavy tasks, more threads do not scale for this application.
+# Because of that we submit each paper on its own, so a worker gets a new paper when it is done with its current one.
+# We use as many processes as CPU cores as testing showed that although more processes may speed up I/O loads while
+# not having a huge benefit (or even reduce performance) for CPU-heavy tasks, more processes do not scale for this
+# application.
 def run(queue_elements: typing.Collection, queue_action: callable, *args) -> None:
-    queue = Queue()  # speed benefit compared to JoinableQueue
-    for queue_element in queue_elements:
-        queue.put(queue_element)
+    if _pool is None:
+        with worker_pool():
+            run(queue_elements, queue_action, *args)
+
+        return
+
+    _start_stage(queue_action, args)
+    try:
+        tasks = [[queue_element] for queue_element in queue_elements]
+        results = [_submit_task(task_index, task, _log_error) for task_index, task in enumerate(tasks)]
+        _wait_for_tasks(results, tasks)
+    finally:
+        _end_stage()
+
+
+def _feed_workers(element_queue: Queue) -> None:
+    tasks = []
+    results = []
+    while True:
+        try:
+            element = element_queue.get(timeout=_POLL_INTERVAL_S)
+        except queue.Empty:
+            _update_running_tasks()
+            continue
+
+        if element is None:  # check for sentinel value and stop when it appears
+            break
+
+        tasks.append([element])
+        results.append(_submit_task(len(results), tasks[-1], _log_error))
+        _update_running_tasks()
+
+    _wait_for_tasks(results, tasks)
 
-    cores = cpu_count()
-    for _ in range(cores):
-        queue.put(None)  # sentinel value to notify a process that the queue is finished
 
-    log_queue = Queue()
-    logging_thread = threaded_log.start_logging_thread(log_queue)
-    processes = []
-    for _ in range(cores):
-        p = Process(target=_process_queue, args=(log_queue, queue, queue_action, args), daemon=True)
-        p.start()  # kill all child processes when the main process is killed
-        processes.append(p)
+def start_workers(element_queue: Queue, queue_action: callable, *args) -> threading.Thread:
+    """
+    Call queue_action on the workers of the current worker_pool() for each element put into element_queue, until
+    stop_workers() is called. Elements can still be added while the workers are running.
+    """
+    _start_stage(queue_action, args)
+    feeder = threading.Thread(target=_feed_workers, args=(element_queue,), daemon=True)
+    feeder.start()
+    return feeder
 
-    for p in processes:
-        p.join()
 
-    log_queue.put(None)
-    logging_thread.join()
+def stop_workers(element_queue: Queue, feeder: threading.Thread) -> None:
+    element_queue.put(None)  # sentinel value to notify the feeder that the queue is finished
+    feeder.join()
+    _end_stage()
 
 
 def _filter_return_values(return_values: list) -> list:
@@ -60,26 +282,25 @@ def _filter_return_values(return_values: list) -> list:
 
 
 def run_with_results(queue_elements: typing.Collection, queue_action: callable, *args) -> list:
-    log_queue = Queue()
-    logging_thread = threaded_log.start_logging_thread(log_queue)
-
-    cores = cpu_count()
-    with multiprocessing.Pool(processes=cores) as pool:
-        if args is not None and len(args) > 0:
-            # use zip() to pass the argument for the queue action and additional arguments, we need to repeat the args
-            # so zip() does not use the elements of the tuple instead of the whole tuple.
-            # default chunk size is divmod(len(iterable), len(self._pool) * 4) -> 767 on 6 cores and 18400 iterable length.
-            # that leads to processes taking way longer than other ones and hurting the overall runtime. instead, we
-            # select a way smaller chunk size as context switching and pre-processing of the data are way faster than
-            # the task itself. We arbitrarily select cores * 4 as our chunk size.
-            return_values = pool.starmap(queue_action, zip(queue_elements, itertools.repeat(args)), chunksize=cores * 4)
-        else:
-            return_values = pool.map(queue_action, queue_elements, chunksize=cores * 4)
-
-        # queue action might return None so we filter any Nones. we also need to handle the results before leaving the
-        # context as they will be removed when leaving the context
-        results = _filter_return_values(return_values)
-
-    log_queue.put(None)
-    logging_thread.join()
-    return results
+    if _pool is None:
+        with worker_pool():
+            return run_with_results(queue_elements, queue_action, *args)
+
+    _start_stage(queue_action, args)
+    try:
+        # default chunk size is divmod(len(iterable), len(self._pool) * 4) -> 767 on 6 cores and 18400 iterable length.
+        # that leads to processes taking way longer than other ones and hurting the overall runtime. instead, we
+        # select a way smaller chunk size as context switching and pre-processing of the data are way faster than
+        # the task itself. We arbitrarily select cores * 4 as our chunk size.
+        queue_elements = list(queue_elements)
+        chunk_size = _pool_size * 4
+        tasks = [queue_elements[start:start + chunk_size] for start in range(0, len(queue_elements), chunk_size)]
+        results = [_submit_task(task_index, task) for task_index, task in enumerate(tasks)]
+        _wait_for_tasks(results, tasks)
+        # the return values of a lost task are missing, an exception of a failed one is raised like map() does
+        return_values = [return_value for result in results if result.ready() for return_value in result.get()]
+    finally:
+        _end_stage()
+
+    # queue action might return None so we filter any Nones
+    return _filter_return_values(return_values)
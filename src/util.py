@@ -1,14 +1,35 @@
+import codecs
+import contextlib
+import hashlib
 import logging
+import mmap
+import multiprocessing.util
+import os
+import re
 import sys
+import threading
+import time
 import typing
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import jsonpickle
 
+import json_codec
+from ArtifactCompressor import ArtifactCompressor, COMPRESSIONS, COMPRESSION_NONE, DECOMPRESSION_ERRORS, get_suffix
+from ArtifactStore import ArtifactStore
+from PipelineManifest import PipelineManifest, STAGE_DOWNLOAD, STAGE_CMDS, STAGE_EXTRACT, STAGE_MATCH, STATUS_DONE
+from definition.data.ArchiveMember import ArchiveMember
+from definition.data.MatchedAuthorData import MatchedPaperData
+
 _logger = logging.getLogger(__name__)
 _LOGGER_HANDLER_NAME = "formatted_stdout_handler"  # used to identify our handlers
 
 ARXIV_ENCODING = "utf-8"  # according to docs arxiv feed will always be utf-8 encoded
+# older tex sources are often latin-1 encoded. every byte is a valid latin-1 character, so decoding never fails.
+_FALLBACK_ENCODING = "latin-1"
+_FALLBACK_ERROR_HANDLER = "affilext_latin1_fallback"
 LOG_LEVEL = logging.INFO
 
 # FILES
@@ -17,7 +38,9 @@ SKIPPED_DL_FILE = "skipped_papers.json"
 CMDS_FILE = "cmds.json"
 EXTRACTED_DATA_FILE = "extracted_data.json"
 ROR_DATASET_FILE = "ror.json"
+ROR_MANIFEST_FILE = "ror_manifest.json"
 MATCHED_DATA_FILE = "matched_data.json"
+TEX_ARCHIVE_FILE = "tex.zip"  # replaces the tex directory of a paper if sources are stored packed
 BASIC_STATS_FILE = "basic_stats.json"
 STATS_ALL_DATA = "combined_data.json"
 FORCE_GRAPH_DATASET_INST = "fg_inst.json"
@@ -31,6 +54,9 @@ _REQUESTS_DIR = "requests"
 _PAPERS_DIR = "papers"
 _PAPER_TEX_DIR = "tex"
 _ROR_DIR = "ror"
+_HTTP_CACHE_DIR = "http_cache"
+_EXPORT_DIR = "export"
+_ZSTD_DICTS_DIR = "zstd_dicts"
 
 ######### PATHS ###########
 # root                    #
@@ -39,8 +65,11 @@ _ROR_DIR = "ror"
 #    ├─ arxiv             #
 #    │  ├─ papers         #
 #    │  └─ requests       #
+#    ├─ export            #
+#    ├─ http_cache        #
 #    ├─ ror               #
-#    └─ stats             #
+#    ├─ stats             #
+#    └─ zstd_dicts        #
 ###########################
 _ROOT_PATH = Path(__file__).parent.parent
 _DATA_PATH = _ROOT_PATH / _DATA_DIR
@@ -48,19 +77,247 @@ _ARXIV_PATH = _DATA_PATH / _ARXIV_DIR
 _PAPERS_PATH = _ARXIV_PATH / _PAPERS_DIR
 _REQUESTS_PATH = _ARXIV_PATH / _REQUESTS_DIR
 _ROR_PATH = _DATA_PATH / _ROR_DIR
+_HTTP_CACHE_PATH = _DATA_PATH / _HTTP_CACHE_DIR
+_EXPORT_PATH = _DATA_PATH / _EXPORT_DIR
 _STATS_PATH = _DATA_PATH / _STATS_DIR
+_ZSTD_DICTS_PATH = _DATA_PATH / _ZSTD_DICTS_DIR
 
 # CREATE PATHS IF NEEDED
 Path.mkdir(_PAPERS_PATH, parents=True, exist_ok=True)  # also creates data and arxiv dir
 Path.mkdir(_REQUESTS_PATH, parents=True, exist_ok=True)
 Path.mkdir(_ROR_PATH, parents=True, exist_ok=True)
+Path.mkdir(_HTTP_CACHE_PATH, parents=True, exist_ok=True)
+Path.mkdir(_EXPORT_PATH, parents=True, exist_ok=True)
 Path.mkdir(_STATS_PATH, parents=True, exist_ok=True)
+Path.mkdir(_ZSTD_DICTS_PATH, parents=True, exist_ok=True)
+
+
+# STORAGE
+STORAGE_FILES = "files"
+STORAGE_SQLITE = "sqlite"
+# an environment variable is inherited by all child processes, no matter if they are forked or spawned
+_STORAGE_ENV_VAR = "AFFILEXT_STORAGE"
+_STORAGE_FILE = "storage.txt"  # marker in the papers dir, files storage if it does not exist
+_storage: str | None = None  # read from the marker on first use
+_ARTIFACT_DB_FILE = "artifacts.sqlite"
+# the artifacts of a paper that are kept in the database instead of the paper directory when using sqlite storage
+_PAPER_ARTIFACT_TABLES = {
+    ARXIV_METADATA_FILE: "arxiv_metadata",
+    CMDS_FILE: "cmds",
+    EXTRACTED_DATA_FILE: "extracted_data",
+    MATCHED_DATA_FILE: "matched_data"
+}
+_artifact_store = ArtifactStore(_PAPERS_PATH / _ARTIFACT_DB_FILE, _PAPER_ARTIFACT_TABLES.values())  # connects lazily
+
+
+def set_storage(storage: str) -> None:
+    # the marker makes later runs and the scripts use the same storage, the environment variable overrides it
+    global _storage
+    write_to_file(_PAPERS_PATH, _STORAGE_FILE, storage)
+    os.environ[_STORAGE_ENV_VAR] = storage
+    _storage = storage
+
+
+def get_storage() -> str:
+    global _storage
+    if storage := os.environ.get(_STORAGE_ENV_VAR):
+        return storage
+
+    if _storage is None:
+        _storage = read(_PAPERS_PATH / _STORAGE_FILE).strip() or STORAGE_FILES
+
+    return _storage
+
+
+def get_artifact_store() -> ArtifactStore:
+    return _artifact_store
+
+
+def get_artifact_table(file_name: str) -> str:
+    return _PAPER_ARTIFACT_TABLES[file_name]
+
+
+def flush_artifacts() -> None:
+    # makes buffered artifacts visible to other processes
+    _artifact_store.flush()
+
+
+def _get_stored_artifact_table(dir_path: Path, file_name: str) -> str | None:
+    if get_storage() != STORAGE_SQLITE or not _is_paper_dir(dir_path):
+        return None
+
+    return _PAPER_ARTIFACT_TABLES.get(file_name, None)
+
+
+# COMPRESSION
+# the artifacts of a paper can be stored compressed when using files storage, e.g. cmds.json.zst instead of cmds.json.
+# the compression of a file is given by its suffix, so files written with different settings can be mixed.
+_COMPRESSION_ENV_VAR = "AFFILEXT_COMPRESSION"
+_artifact_compressor = ArtifactCompressor(_ZSTD_DICTS_PATH)
+
+
+def set_compression(compression: str) -> None:
+    os.environ[_COMPRESSION_ENV_VAR] = compression
+
+
+def get_compression() -> str:
+    return os.environ.get(_COMPRESSION_ENV_VAR, COMPRESSION_NONE)
+
+
+def get_artifact_compressor() -> ArtifactCompressor:
+    return _artifact_compressor
+
+
+def _get_artifact_compressions(dir_path: Path, file_name: str) -> tuple[str, ...]:
+    # the compressions an artifact file may be stored with, the configured one first as it is the most likely
+    if file_name not in _PAPER_ARTIFACT_TABLES or not _is_paper_dir(dir_path):
+        return COMPRESSION_NONE,
+
+    compression = get_compression()
+    return compression, *(other for other in COMPRESSIONS if other != compression)
+
+
+# DURABILITY
+# files are always replaced atomically, so a killed process never leaves a truncated file behind. that does not
+# protect against a power loss, the written data may still only be in the page cache of the OS. the temporary file of
+# a killed write stays, delete_stale_tmp_files() removes it later.
+FSYNC_NONE = "none"
+FSYNC_BATCH = "batch"  # sync the files written by a process every _FSYNC_BATCH_SIZE files and when it exits
+FSYNC_ALWAYS = "always"  # sync every file before replacing the old one
+_FSYNC_ENV_VAR = "AFFILEXT_FSYNC"
+_FSYNC_BATCH_SIZE = 200
+_TMP_FILE_MAX_AGE_S = 60 * 60  # a running write is done long before that
+_unsynced_lock = threading.Lock()  # the download threads write files concurrently
+_unsynced_files: dict[int, set[Path]] = {}  # pid -> files written since the last batch, a forked process has its own
+
+
+def set_fsync(fsync: str) -> None:
+    os.environ[_FSYNC_ENV_VAR] = fsync
+
+
+def get_fsync() -> str:
+    return os.environ.get(_FSYNC_ENV_VAR, FSYNC_NONE)
+
+
+def sync_written_files() -> None:
+    """
+    Flush the files written by this process since the last batch and their directory entries to the disk.
+    """
+    with _unsynced_lock:
+        file_paths = _unsynced_files.pop(os.getpid(), set())
+
+    for file_path in file_paths:
+        _fsync_path(file_path)
+
+    for dir_path in {file_path.parent for file_path in file_paths}:
+        _fsync_path(dir_path)  # makes the renames durable
+
+
+def _fsync_path(path: Path) -> None:
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return  # deleted in the meantime, or a directory on Windows which can not be opened
+
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _add_unsynced_file(file_path: Path) -> None:
+    with _unsynced_lock:
+        if (file_paths := _unsynced_files.get(os.getpid())) is None:
+            file_paths = _unsynced_files[os.getpid()] = set()
+            # runs when a process exits normally, including the workers of multiprocessing pools
+            multiprocessing.util.Finalize(None, sync_written_files, exitpriority=10)
+
+        file_paths.add(file_path)
+        batch_full = len(file_paths) >= _FSYNC_BATCH_SIZE
+
+    if batch_full:
+        sync_written_files()
+
+
+# LAYOUT
+LAYOUT_FLAT = "flat"  # papers/2409.08279
+# papers/2409/08/2409.08279 and papers/hep-ph/0209/hep-ph_0209124. keeps the directories small, listing or looking
+# up a paper in a directory with a million entries is slow on many file systems.
+LAYOUT_SHARDED = "sharded"
+_LAYOUT_FILE = "layout.txt"  # marker in the papers dir, flat if it does not exist
+_SHARD_DEPTH = 2
+_OTHER_SHARD = "other"
+_NEW_ID_REGEX = re.compile(r"(\d{4})\.(\d{2})\d{2,3}(v\d+)?")
+_OLD_ID_REGEX = re.compile(r"([a-zA-Z\-]+(?:\.[a-zA-Z\-]+)?)_(\d{4})\d{3}(v\d+)?")
+_layout: str | None = None  # read from the marker on first use
+
+# LISTING
+# the subdirectories of a directory are listed again only if its modification time changed, which happens whenever an
+# entry is added or removed. an entry added within the timestamp granularity of the file system (up to 2 s) after
+# the listing would not change it, so listings of recently modified directories are not kept.
+_LISTING_MIN_AGE_NS = 2_000_000_000
+_LISTING_WORKERS = 8  # listing and stat() calls mostly wait for the file system, the threads overlap them
+_listings: dict[str, tuple[int, list[str]]] = {}  # dir path -> (mtime in ns, subdir paths)
+
+
+# PIPELINE MANIFEST
+_PIPELINE_DB_FILE = "pipeline.sqlite"
+_pipeline_manifest = PipelineManifest(_PAPERS_PATH / _PIPELINE_DB_FILE)  # connects lazily
+
+
+def get_pipeline_manifest() -> PipelineManifest:
+    return _pipeline_manifest
+
+
+def load_pipeline_manifest() -> PipelineManifest:
+    """
+    Get the pipeline manifest. If it is empty, it gets filled from the files of all papers first. That happens in the
+    first run and after clearing the cache or the generated data, afterward the stages keep it up to date.
+    """
+    if _pipeline_manifest.is_empty():
+        _logger.info("Building pipeline manifest from the files on disk...")
+        # walking the tex files of each paper mostly waits for the file system, the manifest is thread safe
+        with ThreadPoolExecutor(max_workers=_LISTING_WORKERS) as executor:
+            for _ in executor.map(_add_paper_to_manifest, get_paper_dirs()):
+                pass
+
+        _pipeline_manifest.flush()
+
+    return _pipeline_manifest
+
+
+def get_unfinished_paper_dirs(paper_dirs: list[Path], stage: str) -> list[Path]:
+    # a single query instead of checking the output file of each paper
+    finished = load_pipeline_manifest().get_finished_papers(stage)
+    return [paper_dir for paper_dir in paper_dirs if paper_dir.name not in finished]
+
+
+def _add_paper_to_manifest(paper_dir: Path) -> None:
+    paper = paper_dir.name
+    delete_stale_tmp_files(paper_dir)  # the rebuild visits every paper anyway
+    tex_files, tex_bytes = get_tex_stats(paper_dir)
+    _pipeline_manifest.set_tex_stats(paper, tex_files, tex_bytes)
+    if tex_files == 0:
+        return
+
+    # the files only tell us which stages wrote their output, the status of the other stages stays unknown
+    _pipeline_manifest.set_status(paper, STAGE_DOWNLOAD, STATUS_DONE)
+    stage_files = ((STAGE_CMDS, CMDS_FILE), (STAGE_EXTRACT, EXTRACTED_DATA_FILE), (STAGE_MATCH, MATCHED_DATA_FILE))
+    for stage, file_name in stage_files:
+        if not file_exists(paper_dir, file_name):
+            break
+
+        _pipeline_manifest.set_status(paper, stage, STATUS_DONE)
 
 
 def get_requests_dir() -> Path:
     return _REQUESTS_PATH
 
 
+def get_http_cache_dir() -> Path:
+    return _HTTP_CACHE_PATH
+
+
 def get_papers_dir() -> Path:
     return _PAPERS_PATH
 
@@ -73,14 +330,100 @@ def get_stats_dir() -> Path:
     return _STATS_PATH
 
 
-def get_paper_dirs() -> list[Path]:
-    return [paper_dir for paper_dir in _PAPERS_PATH.iterdir() if paper_dir.is_dir()]
+def get_export_dir() -> Path:
+    return _EXPORT_PATH
+
+
+def get_layout() -> str:
+    global _layout
+    if _layout is None:
+        _layout = read(_PAPERS_PATH / _LAYOUT_FILE).strip() or LAYOUT_FLAT
+
+    return _layout
+
+
+def set_layout(layout: str) -> None:
+    # only changes the marker, use scripts/migrate_layout.py to move existing paper directories
+    global _layout
+    write_to_file(_PAPERS_PATH, _LAYOUT_FILE, layout)
+    _layout = layout
+
+
+def _get_shard(paper_name: str) -> tuple[str, str]:
+    if m := _NEW_ID_REGEX.fullmatch(paper_name):
+        return m.group(1), m.group(2)
+
+    if m := _OLD_ID_REGEX.fullmatch(paper_name):
+        return m.group(1), m.group(2)
+
+    # should not happen for arXiv IDs, spread anything else by its hash
+    return _OTHER_SHARD, hashlib.sha1(paper_name.encode(ARXIV_ENCODING)).hexdigest()[:2]
+
+
+def get_paper_path(paper_name: str, layout: str | None = None) -> Path:
+    """
+    Path of the directory of a paper, named by its sanitized arXiv ID, in the given or the current layout. Unlike
+    get_paper_dir() the directory is not created.
+    """
+    if (layout or get_layout()) == LAYOUT_SHARDED:
+        return _PAPERS_PATH.joinpath(*_get_shard(paper_name), paper_name)
+
+    return _PAPERS_PATH / paper_name
+
+
+def _is_paper_dir(dir_path: Path) -> bool:
+    return dir_path == get_paper_path(dir_path.name)
+
+
+def _looks_like_paper_dir(dir_path: Path) -> bool:
+    # shard directories like papers/2409 are named like a paper in the flat layout. they are told apart by their name,
+    # which is no arXiv ID, and by not containing any files of a paper.
+    if _NEW_ID_REGEX.fullmatch(dir_path.name) or _OLD_ID_REGEX.fullmatch(dir_path.name):
+        return True
+
+    return (
+        (dir_path / _PAPER_TEX_DIR).is_dir()
+        or (dir_path / TEX_ARCHIVE_FILE).is_file()
+        or file_exists(dir_path, ARXIV_METADATA_FILE)
+    )
+
+
+def _list_subdirs(dir_path: str) -> list[str]:
+    mtime_ns = os.stat(dir_path).st_mtime_ns
+    listing = _listings.get(dir_path)
+    if listing and listing[0] == mtime_ns:
+        return listing[1]
+
+    # os.scandir() gets the type of each entry from the directory listing, Path.is_dir() needs a stat() per entry
+    with os.scandir(dir_path) as entries:
+        subdir_paths = [entry.path for entry in entries if entry.is_dir()]
+
+    if time.time_ns() - mtime_ns > _LISTING_MIN_AGE_NS:
+        _listings[dir_path] = (mtime_ns, subdir_paths)
+
+    return subdir_paths
+
+
+def get_paper_dirs(layout: str | None = None) -> list[Path]:
+    layout = layout or get_layout()
+    dir_paths = [str(_PAPERS_PATH)]
+    # the shards of one level are listed concurrently
+    with ThreadPoolExecutor(max_workers=_LISTING_WORKERS) as executor:
+        for _ in range(_SHARD_DEPTH + 1 if layout == LAYOUT_SHARDED else 1):
+            dir_paths = [path for subdir_paths in executor.map(_list_subdirs, dir_paths) for path in subdir_paths]
+
+    # skips directories that belong to the other layout, e.g. when a migration got interrupted
+    paper_dirs = [Path(dir_path) for dir_path in dir_paths]
+    return [
+        paper_dir for paper_dir in paper_dirs
+        if paper_dir == get_paper_path(paper_dir.name, layout) and _looks_like_paper_dir(paper_dir)
+    ]
 
 
 def get_paper_dir(arxiv_id: str) -> Path:
-    paper_dir = _PAPERS_PATH / sanitize_arxiv_id(arxiv_id)
+    paper_dir = get_paper_path(sanitize_arxiv_id(arxiv_id))
     if not paper_dir.exists():
-        Path.mkdir(paper_dir)
+        Path.mkdir(paper_dir, parents=True, exist_ok=True)  # the download threads may create a shard concurrently
 
     return paper_dir
 
@@ -104,30 +447,104 @@ def get_single_cmd_scheme_dir() -> Path:
     return code_dir / "definition" / "single_cmd_scheme"
 
 
+def walk_files(dir_path: Path) -> typing.Iterator[os.DirEntry]:
+    """
+    Lazily yield the files below dir_path, nothing if it is not a directory. Unlike Path.rglob() and Path.is_file()
+    this uses the entry types of the directory listings instead of a stat() call per entry, and the cached stat()
+    result of an entry can be reused. Symlinks to directories are not followed.
+    """
+    try:
+        entries = os.scandir(dir_path)
+    except (FileNotFoundError, NotADirectoryError):
+        return
+
+    subdir_paths = []
+    with entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                subdir_paths.append(entry.path)
+            elif entry.is_file():
+                yield entry
+
+    # the listing is closed before descending, so only one directory is open at a time
+    for subdir_path in subdir_paths:
+        yield from walk_files(Path(subdir_path))
+
+
 def get_all_files_recursive(dir_path: Path, extension="") -> list[Path]:
-    if not dir_path.is_dir():
+    return [Path(entry.path) for entry in walk_files(dir_path) if entry.name.endswith(extension)]
+
+
+def _get_archive_members(archive_path: Path) -> list[ArchiveMember]:
+    # only the central directory is read, the archive is opened again when a member is read. keeping it open would
+    # hold one file descriptor per paper while listing the whole corpus.
+    try:
+        with zipfile.ZipFile(archive_path) as archive:
+            return [
+                ArchiveMember(archive_path, info.filename, info.file_size)
+                for info in archive.infolist() if info.filename.endswith(".tex")
+            ]
+    except (OSError, zipfile.BadZipFile):
+        _logger.warning("Could not open archive '%s'", archive_path)
         return []
 
-    return [file_path for file_path in list(dir_path.rglob(f"*{extension}")) if
-            file_path.is_file()]  # rglob returns a Generator object, list turns it into list of paths
-
 
-def _should_ignore_file(file_path: Path, ignore_cls: bool) -> bool:
-    if not file_path.is_file():
-        return True
+def get_all_tex_files(dir_path: Path, ignore_cls=True) -> list[Path | ArchiveMember]:
+    # a single walk finds both, extracted .tex files and packed sources
+    tex_files = []
+    for entry in walk_files(dir_path):
+        if entry.name.endswith(".tex"):
+            tex_files.append(Path(entry.path))
+        elif entry.name == TEX_ARCHIVE_FILE:
+            tex_files += _get_archive_members(Path(entry.path))
 
     if ignore_cls:
-        return file_path.name.endswith(".cls.tex")
+        return [tex_file for tex_file in tex_files if not tex_file.name.endswith(".cls.tex")]
 
-    return False
+    return tex_files
 
 
-def get_all_tex_files(dir_path: Path, ignore_cls=True) -> list[Path]:
-    if not dir_path.is_dir():
-        return []
+def get_file_size(file_path: Path | ArchiveMember) -> int:
+    if isinstance(file_path, ArchiveMember):
+        return file_path.file_size
+
+    return file_path.stat().st_size
+
+
+def get_tex_stats(paper_dir: Path) -> tuple[int, int]:
+    # number and total size of all tex files of a paper, stored in the pipeline manifest
+    tex_files = tex_bytes = 0
+    for entry in walk_files(paper_dir):
+        if entry.name.endswith(".tex"):
+            tex_files += 1
+            tex_bytes += entry.stat().st_size  # on windows the listing already contains the size
+        elif entry.name == TEX_ARCHIVE_FILE:
+            members = _get_archive_members(Path(entry.path))
+            tex_files += len(members)
+            tex_bytes += sum(get_file_size(member) for member in members)
+
+    return tex_files, tex_bytes
+
+
+def has_tex_files(paper_dir: Path) -> bool:
+    if (paper_dir / TEX_ARCHIVE_FILE).is_file():
+        return True
+
+    # stops at the first tex file instead of listing all of them
+    return any(entry.name.endswith(".tex") for entry in walk_files(paper_dir / _PAPER_TEX_DIR))
 
-    return [file_path for file_path in list(dir_path.rglob(f"*.tex")) if
-            not _should_ignore_file(file_path, ignore_cls=ignore_cls)]
+
+def pack_tex_files(paper_dir: Path) -> None:
+    # one compressed file per paper instead of a directory tree, the central directory of the zip is the index
+    tex_dir = paper_dir / _PAPER_TEX_DIR
+    tmp_archive_path = paper_dir / (TEX_ARCHIVE_FILE + ".tmp")
+    with zipfile.ZipFile(tmp_archive_path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for file_path in get_all_files_recursive(tex_dir):
+            archive.write(file_path, file_path.relative_to(tex_dir).as_posix())
+
+    tmp_archive_path.replace(paper_dir / TEX_ARCHIVE_FILE)
+    _delete_recursive(tex_dir)
+    tex_dir.rmdir()
 
 
 # / is not allowed in a directory name on windows and linux
@@ -138,10 +555,25 @@ def sanitize_arxiv_id(arxiv_id: str) -> str:
     return arxiv_id.replace("/", "_")
 
 
-def read(file_path: Path, flags="r", encoding=ARXIV_ENCODING) -> str:
+def _read_archive_member(member: ArchiveMember, flags: str, encoding: str | None) -> str | bytes:
+    try:
+        with zipfile.ZipFile(member.archive_path) as archive:
+            content = archive.read(member.at)
+    except (OSError, KeyError, zipfile.BadZipFile):
+        _logger.warning("Could not read archive member '%s'", member)
+        return ""
+
+    return content if "b" in flags else content.decode(encoding, errors="ignore")
+
+
+def read(file_path: Path | ArchiveMember, flags="r", encoding=ARXIV_ENCODING) -> str:
+    if isinstance(file_path, ArchiveMember):
+        return _read_archive_member(file_path, flags, encoding)
+
     if file_path.is_file():
         try:
-            with open(file_path, flags, encoding=encoding, errors="ignore") as file:
+            errors = None if "b" in flags else "ignore"  # binary mode does not decode anything
+            with open(file_path, flags, encoding=encoding, errors=errors) as file:
                 return file.read()
         except OSError:
             # windows defender complains about 2406.04027 05_evaluation.tex as it includes (deobfuscated) malicious src
@@ -151,6 +583,48 @@ def read(file_path: Path, flags="r", encoding=ARXIV_ENCODING) -> str:
         return ""
 
 
+@contextlib.contextmanager
+def read_mapped(file_path: Path | ArchiveMember) -> typing.Iterator[bytes | mmap.mmap]:
+    """
+    Undecoded content of a file. Files on disk are memory-mapped, so only the pages that get accessed are read and
+    nothing is copied. Archive members are decompressed into memory.
+    """
+    if isinstance(file_path, ArchiveMember):
+        yield _read_archive_member(file_path, "rb", None) or b""
+        return
+
+    try:
+        file = open(file_path, "rb")
+    except OSError:
+        _logger.warning("Could not read file '%s'", file_path)
+        file = None
+
+    if file is None:
+        yield b""
+        return
+
+    with file:
+        if os.fstat(file.fileno()).st_size == 0:  # an empty file can not be mapped
+            yield b""
+            return
+
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield mapped
+
+
+def _decode_fallback(error: UnicodeDecodeError) -> tuple[str, int]:
+    return error.object[error.start:error.end].decode(_FALLBACK_ENCODING), error.end
+
+
+codecs.register_error(_FALLBACK_ERROR_HANDLER, _decode_fallback)
+
+
+def decode(content: bytes) -> str:
+    # unlike read() nothing gets dropped: only the bytes that are not valid utf-8 are taken as latin-1, so a stray
+    # latin-1 character does not turn the utf-8 characters around it into mojibake
+    return content.decode(ARXIV_ENCODING, errors=_FALLBACK_ERROR_HANDLER)
+
+
 def read_file(dir_path: Path, file_name: str) -> str:
     file_path = dir_path / file_name
     return read(file_path)
@@ -162,31 +636,157 @@ def dir_exists(base_path: Path, dir_name: str) -> bool:
 
 
 def file_exists(dir_path: Path, file_name: str) -> bool:
-    file_path = dir_path / file_name
-    return file_path.is_file()
+    if table := _get_stored_artifact_table(dir_path, file_name):
+        return _artifact_store.exists(table, dir_path.name)
+
+    for compression in _get_artifact_compressions(dir_path, file_name):
+        if (dir_path / (file_name + get_suffix(compression))).is_file():
+            return True
+
+    return False
 
 
-def write_to_file(dir_path: Path, file_name: str, file_content: str, flags="w", encoding=ARXIV_ENCODING) -> Path:
+def write_to_file(
+        dir_path: Path, file_name: str, file_content: str | bytes, flags="w", encoding=ARXIV_ENCODING
+) -> Path:
     file_path = dir_path / file_name
-    with open(file_path, flags, encoding=encoding) as file:
-        file.write(file_content)
+    if "a" in flags:  # appending can not be done atomically
+        with open(file_path, flags, encoding=encoding) as file:
+            file.write(file_content)
+
+        return file_path
+
+    # write a temporary file next to the target and replace the target with it. the name is unique per thread, as
+    # the same file may be written by multiple download threads.
+    fsync = get_fsync()
+    tmp_path = dir_path / f".{file_name}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, flags, encoding=encoding) as file:
+            file.write(file_content)
+            if fsync == FSYNC_ALWAYS:
+                file.flush()
+                os.fsync(file.fileno())
+
+        tmp_path.replace(file_path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+    if fsync == FSYNC_ALWAYS:
+        _fsync_path(dir_path)
+    elif fsync == FSYNC_BATCH:
+        _add_unsynced_file(file_path)
 
     return file_path
 
 
+def delete_stale_tmp_files(dir_path: Path) -> None:
+    """
+    Delete the temporary files of writes that never finished in a directory, e.g. of a killed worker process. Files
+    younger than an hour are kept, they may belong to a write that is still running.
+    """
+    min_mtime = time.time() - _TMP_FILE_MAX_AGE_S
+    try:
+        with os.scandir(dir_path) as entries:
+            tmp_entries = [entry for entry in entries if entry.name.endswith(".tmp")]
+    except OSError:
+        return
+
+    for entry in tmp_entries:
+        try:
+            if entry.is_file(follow_symlinks=False) and entry.stat().st_mtime < min_mtime:
+                os.unlink(entry.path)
+                _logger.debug("Deleted stale temporary file '%s'.", entry.path)
+        except OSError:
+            pass  # deleted by another process in the meantime
+
+
+def _encode_json(obj: typing.Any, unpicklable: bool, make_refs: bool) -> str:
+    # the codec is way faster than jsonpickle but only supports our dataclasses. files without type information
+    # (unpicklable=False) and shared references are left to jsonpickle.
+    if unpicklable and not make_refs:
+        try:
+            return json_codec.encode(obj)
+        except TypeError:
+            pass
+
+    return jsonpickle.encode(obj, unpicklable=unpicklable, make_refs=make_refs)
+
+
 def write_obj_to_json(dir_path: Path, file_name: str, obj: typing.Any,
                       flags="w", encoding=ARXIV_ENCODING, unpicklable=True, make_refs=False) -> None:
-    json_str = jsonpickle.encode(obj, unpicklable=unpicklable, make_refs=make_refs)
-    write_to_file(dir_path, file_name, json_str, flags, encoding=encoding)
+    write_json_text(dir_path, file_name, _encode_json(obj, unpicklable, make_refs), flags, encoding=encoding)
+
+
+def write_json_text(dir_path: Path, file_name: str, json_str: str, flags="w", encoding=ARXIV_ENCODING) -> None:
+    # stores an already serialized artifact, compressed if configured
+    if table := _get_stored_artifact_table(dir_path, file_name):
+        _artifact_store.write(table, dir_path.name, json_str)
+        return
+
+    compression, *other_compressions = _get_artifact_compressions(dir_path, file_name)
+    if compression == COMPRESSION_NONE:
+        write_to_file(dir_path, file_name, json_str, flags, encoding=encoding)
+    else:
+        content = _artifact_compressor.compress(json_str.encode(encoding), compression)
+        write_to_file(dir_path, file_name + get_suffix(compression), content, "wb", encoding=None)
+
+    # an older version of the file with another compression would still be found by read_json()
+    for other_compression in other_compressions:
+        delete_file(dir_path / (file_name + get_suffix(other_compression)))
+
+
+def read_json_text(dir_path: Path, file_name: str, flags="r", encoding=ARXIV_ENCODING) -> str:
+    # the serialized artifact, decompressed if needed
+    if table := _get_stored_artifact_table(dir_path, file_name):
+        return _artifact_store.read(table, dir_path.name) or ""
+
+    for compression in _get_artifact_compressions(dir_path, file_name):
+        file_path = dir_path / (file_name + get_suffix(compression))
+        if compression == COMPRESSION_NONE:
+            content = read(file_path, flags=flags, encoding=encoding)
+        elif content := read(file_path, flags="rb", encoding=None):
+            try:
+                content = _artifact_compressor.decompress(content, compression).decode(encoding, errors="ignore")
+            except DECOMPRESSION_ERRORS as e:
+                _logger.warning("Could not decompress file '%s': %s", file_path, e)
+                content = ""
+
+        if content:
+            return content
+
+    return ""
 
 
 def read_json(dir_path: Path, file_name: str, flags="r", encoding=ARXIV_ENCODING) -> typing.Any:
-    file_path = dir_path / file_name
-    content = read(file_path, flags=flags, encoding=encoding)
+    content = read_json_text(dir_path, file_name, flags=flags, encoding=encoding)
     if not content:
         return None
 
-    return jsonpickle.decode(content)
+    # files written before the codec existed or with objects it does not support are jsonpickle encoded
+    if json_codec.is_encoded(content):
+        obj = json_codec.decode(content)
+    else:
+        obj = jsonpickle.decode(content)
+
+    if file_name == MATCHED_DATA_FILE:
+        upgrade_matched_data(obj)
+
+    return obj
+
+
+def upgrade_matched_data(matched_data: MatchedPaperData | None) -> None:
+    """
+    Bring matched data of older versions up to date. Files written before only the ROR IDs were stored hold the whole
+    organization of an affiliation in matched_ror instead of its ror_id.
+    """
+    if not matched_data:
+        return
+
+    for author in matched_data.matched_authors:
+        for affiliation in author.affiliations:
+            if (ror_org := affiliation.__dict__.pop("matched_ror", None)) is not None:
+                affiliation.ror_id = ror_org.ror_id
 
 
 def rename_file(dir_path: Path, old_name: str, new_name: str) -> bool:
@@ -210,14 +810,20 @@ def delete_files(file_paths: list[Path]) -> None:
 
 
 def delete_file_in_dir(dir_path: Path, file_name: str) -> None:
-    file_path = dir_path / file_name
-    delete_file(file_path)
+    if table := _get_stored_artifact_table(dir_path, file_name):
+        _artifact_store.delete(table, dir_path.name)
+        return
+
+    for compression in _get_artifact_compressions(dir_path, file_name):
+        delete_file(dir_path / (file_name + get_suffix(compression)))
 
 
 def _delete_cached_requests() -> None:
-    xml_files = [path for path in _REQUESTS_PATH.iterdir() if path.is_file()]
-    for xml_file in xml_files:
-        xml_file.unlink()
+    # the requests dir holds the date based query cache of older versions
+    for cache_path in (_REQUESTS_PATH, _HTTP_CACHE_PATH):
+        cached_files = [path for path in cache_path.iterdir() if path.is_file()]
+        for cached_file in cached_files:
+            cached_file.unlink()
 
 
 def _delete_recursive(top: Path) -> None:
@@ -232,6 +838,7 @@ def _delete_recursive(top: Path) -> None:
 def _delete_arxiv_files() -> None:
     for paper_dir in get_paper_dirs():
         delete_file_in_dir(paper_dir, ARXIV_METADATA_FILE)
+        delete_file_in_dir(paper_dir, TEX_ARCHIVE_FILE)
         tex_dir = paper_dir / _PAPER_TEX_DIR
         if tex_dir.is_dir():
             _delete_recursive(tex_dir)
@@ -242,9 +849,17 @@ def clear_cache() -> None:
     _delete_arxiv_files()
     delete_file_in_dir(get_stats_dir(), ROR_DATASET_FILE)
     delete_file_in_dir(get_papers_dir(), SKIPPED_DL_FILE)
+    _pipeline_manifest.clear()  # gets rebuilt from the remaining files
 
 
 def delete_generated_data() -> None:
+    _pipeline_manifest.clear()  # gets rebuilt from the remaining files, which also deletes stale temporary files
+    if get_storage() == STORAGE_SQLITE:
+        for file_name in (CMDS_FILE, EXTRACTED_DATA_FILE, MATCHED_DATA_FILE):
+            _artifact_store.delete_all(_PAPER_ARTIFACT_TABLES[file_name])
+
+        return
+
     for paper_dir in get_paper_dirs():
         delete_file_in_dir(paper_dir, CMDS_FILE)
         delete_file_in_dir(paper_dir, EXTRACTED_DATA_FILE)
@@ -256,6 +871,11 @@ def clear_stats() -> None:
     _delete_recursive(get_stats_dir())
 
 
+def clear_export() -> None:
+    # filled by export_tables.py
+    _delete_recursive(get_export_dir())
+
+
 def configure_logger(logger: logging.Logger) -> None:
     # if that logger already has a handler, do not modify it further
     if logger.hasHandlers():